@@ -0,0 +1,55 @@
+"""Compare the vectorized distance kernels against per-pair geopy geodesic calls.
+
+Run from the repository root with ``python -m benchmarks.geodesic_benchmark``.
+Pairs are drawn around the La Jolla survey area with baselines up to
+``--max-baseline`` meters, which covers our sub-kilometer modem ranges.
+"""
+import argparse
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+from logprocessor.geodesy import METHODS, geodesic_distance
+
+
+def random_pairs(count, max_baseline, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes1 = rng.uniform(32.84947, 32.96678, count)
+    longitudes1 = rng.uniform(-117.40825, -117.24071, count)
+    bearings = rng.uniform(0, 2 * np.pi, count)
+    baselines = rng.uniform(0, max_baseline, count)
+    latitudes2 = latitudes1 + np.degrees(baselines * np.cos(bearings) / 6371000.0)
+    longitudes2 = longitudes1 + np.degrees(baselines * np.sin(bearings) / (6371000.0 * np.cos(np.radians(latitudes1))))
+    return latitudes1, longitudes1, latitudes2, longitudes2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pairs', type=int, default=100_000)
+    parser.add_argument('--geopy-pairs', type=int, default=10_000, help="geopy is slow; time it on a subset")
+    parser.add_argument('--max-baseline', type=float, default=1000.0)
+    args = parser.parse_args()
+
+    columns = random_pairs(args.pairs, args.max_baseline)
+
+    subset = min(args.geopy_pairs, args.pairs)
+    start = time.perf_counter()
+    reference = np.array([
+        geodesic((lat1, lon1), (lat2, lon2)).meters
+        for lat1, lon1, lat2, lon2 in zip(*(column[:subset] for column in columns))
+    ])
+    geopy_rate = subset / (time.perf_counter() - start)
+    print(f"geopy      {geopy_rate:>14,.0f} pairs/s")
+
+    for method in METHODS:
+        start = time.perf_counter()
+        distances = geodesic_distance(*columns, method=method)
+        rate = args.pairs / (time.perf_counter() - start)
+        error = np.abs(distances[:subset] - reference)
+        print(f"{method:<10} {rate:>14,.0f} pairs/s  {rate / geopy_rate:>8,.0f}x  "
+              f"max error {error.max():.2e} m  mean error {error.mean():.2e} m")
+
+
+if __name__ == '__main__':
+    main()
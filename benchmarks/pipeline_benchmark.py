@@ -0,0 +1,176 @@
+"""Time every pipeline stage on synthetic deployments and track peak memory.
+
+Run from the repository root with
+``python -m benchmarks.pipeline_benchmark --scale 1 10 100``. For each scale
+a deployment is generated (not timed) and the stages parse, load, align,
+distance, clock, query (indexing plus ``QUERIES`` time-window queries),
+stats, depth, map and plot are run in order. Peak memory per
+stage is traced with ``tracemalloc`` when ``--trace-memory`` is given (it
+slows the Python-heavy stages down); the process peak RSS is always reported.
+
+``--output`` saves the results as JSON; ``--baseline`` compares against such
+a file and exits non-zero when a stage got slower than ``--tolerance``.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from loguru import logger
+
+from benchmarks.synthetic import BATHYMETRY_FILE, generate_deployment
+from logprocessor.instrumentation import peak_rss_mb
+
+STAGES = ('parse', 'load', 'align', 'distance', 'clock', 'query', 'stats', 'depth', 'map', 'plot')
+QUERIES = 500
+
+
+def run_stages(deployment_dir, output_dir, trace_memory=False, workers=None):
+    """Run every stage once; returns ``{stage: {'seconds': ..., 'peak_mb': ...}}``."""
+    from logprocessor.alignment import align_pings
+    from logprocessor.bathymetry import load_bathymetry, ping_depths
+    from logprocessor.clock import compare_fitted
+    from logprocessor.dataset import RANGES_FILE, load_dataset
+    from logprocessor.geodesy import geodesic_distance
+    from logprocessor.parsing import convert_logs
+    from logprocessor.plots import plot_boat_buoy_distances, plot_range_errors
+    from logprocessor.query import DeploymentIndex
+    from logprocessor.site import build_map
+    from logprocessor.stats import accumulate_range_errors
+
+    os.makedirs(output_dir, exist_ok=True)
+    ranges_file = os.path.join(deployment_dir, RANGES_FILE)
+    state = {}
+
+    def parse():
+        convert_logs(os.path.join(deployment_dir, 'pi_runs'), ranges_file, workers=workers)
+
+    def load():
+        state['dataset'] = load_dataset(deployment_dir, ranges_file=ranges_file, use_cache=False)
+
+    def align():
+        dataset = state['dataset']
+        state['aligned'] = align_pings(dataset.ranges.seconds_after_start, dataset.boat_track, dataset.buoy_track)
+
+    def distance():
+        aligned = state['aligned']
+        geodesic_distance(aligned.boat_latitudes, aligned.boat_longitudes,
+                          aligned.buoy_latitudes, aligned.buoy_longitudes)
+
+    def clock():
+        state['clock_fit'], state['comparison'] = compare_fitted(state['dataset'])
+
+    def query():
+        index = DeploymentIndex(state['dataset'], state['comparison'], state['clock_fit'])
+        times = state['dataset'].ranges.seconds_after_start
+        for start in np.linspace(times[0], times[-1], QUERIES):
+            index.pings(start, start + 600, max_gps_distance=200)
+            index.fixes('boat', start, start + 600)
+
+    def stats():
+        accumulate_range_errors(state['dataset'], state['clock_fit'])
+
+    def depth():
+        index = load_bathymetry(os.path.join(deployment_dir, BATHYMETRY_FILE), use_cache=False)
+        ping_depths(index, state['comparison'].aligned)
+
+    def render_map():
+        build_map(state['dataset'], state['comparison'], tiff_file=None,
+                  map_file=os.path.join(output_dir, 'index.html'))
+
+    def plot():
+        plot_range_errors(state['dataset'], state['comparison'], output_dir=output_dir, workers=workers)
+        plot_boat_buoy_distances(state['dataset'], state['comparison'], output_dir=output_dir, workers=workers)
+
+    stages = dict(zip(STAGES, (parse, load, align, distance, clock, query, stats, depth, render_map, plot)))
+    results = {}
+    for name, stage in stages.items():
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        stage()
+        seconds = time.perf_counter() - start
+        result = {'seconds': round(seconds, 4)}
+        if trace_memory:
+            result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+        results[name] = result
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Stages slower than ``(1 + tolerance)`` times the baseline, as printable lines."""
+    regressions = []
+    for scale, stages in results.items():
+        for stage, result in stages.items():
+            reference = baseline.get(scale, {}).get(stage)
+            # Ignore sub-10 ms stages, whose timings are mostly noise
+            if reference and reference['seconds'] >= 0.01 and result['seconds'] > reference['seconds'] * (1 + tolerance):
+                regressions.append(f"scale {scale} {stage}: {result['seconds']:.3f} s "
+                                   f"vs {reference['seconds']:.3f} s baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, nargs='+', default=[1.0, 10.0],
+                        help="deployment sizes relative to the sample data (1 to 1000)")
+    parser.add_argument('--workdir', help="where deployments are generated (default: a temporary directory)")
+    parser.add_argument('--workers', type=int, help="processes for parsing and plotting (default: one per CPU)")
+    parser.add_argument('--trace-memory', action='store_true', help="trace peak allocations of every stage")
+    parser.add_argument('--output', help="save the results as JSON")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown relative to the baseline")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    # Import the lazily loaded libraries up front so their one-time cost is not charged to a stage
+    import folium  # noqa: F401
+    import matplotlib.backends.backend_agg  # noqa: F401
+    import scipy.spatial  # noqa: F401
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='logprocessor-benchmark-')
+    results = {}
+    try:
+        for scale in args.scale:
+            deployment_dir = os.path.join(workdir, f'scale-{scale:g}')
+            sizes = generate_deployment(deployment_dir, scale=scale)
+            print(f"scale {scale:g}: {sizes}")
+            results[f'{scale:g}'] = run_stages(deployment_dir, os.path.join(deployment_dir, 'output'),
+                                               trace_memory=args.trace_memory, workers=args.workers)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    header = f"{'stage':<10}" + ''.join(f"{'x' + scale:>18}" for scale in results)
+    print(header)
+    for stage in STAGES:
+        cells = []
+        for stages in results.values():
+            result = stages[stage]
+            memory = f" {result['peak_mb']:6.1f}M" if 'peak_mb' in result else ''
+            cells.append(f"{result['seconds']:9.3f} s{memory}")
+        print(f"{stage:<10}" + ''.join(f"{cell:>18}" for cell in cells))
+    print(f"peak RSS: {peak_rss_mb():.0f} MiB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results, 'peak_rss_mb': round(peak_rss_mb(), 1)}, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Synthetic deployments for benchmarking, shaped like the sample data in ``logs/``.
+
+``scale=1`` matches the sample deployment: about 88 minutes of 1 Hz boat and
+buoy GPS fixes, a range request every 15 seconds or so for the middle half
+hour, and 9000 bathymetry contour points. Each request cycle also ranges
+the boat to two moored nodes, so the logs hold several node pairs, with
+node 0 (the boat) to node 1 (the buoy) the one compared with the GPS. Larger scales stretch the
+deployment in time (and the bathymetry in point count) proportionally, so
+``scale=1000`` is roughly two months of tracks and 170k range requests.
+
+Run ``python -m benchmarks.synthetic OUTPUT_DIR --scale 10`` to write one.
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from logprocessor.alignment import BOAT_COLUMNS, BUOY_COLUMNS
+from logprocessor.dataset import BOAT_FILE, BUOY_FILE
+from logprocessor.geodesy import geodesic_distance, meters_per_degree
+
+# Sizes of the sample deployment
+SAMPLE_GPS_SECONDS = 5275
+SAMPLE_PINGS = 166
+SAMPLE_BATHYMETRY_POINTS = 9070
+
+BATHYMETRY_FILE = 'la_jolla_bathymetry_data.csv'
+ORIGIN = (32.8815, -117.2738)
+START_TIME = datetime(2024, 8, 20, 8, 18, 43)
+PING_INTERVAL = 15.0
+# Node pairs ranged in each request cycle, PAIR_INTERVAL seconds apart
+PAIRS = ((0, 1), (0, 2), (0, 3))
+PAIR_INTERVAL = 2.0
+# Moorings of the nodes beyond the boat (0) and the buoy (1), in meters north and east of the buoy's
+MOORINGS = {2: (600.0, -400.0), 3: (-500.0, 700.0)}
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+
+def _log_timestamp(moment):
+    return f"{MONTH_NAMES[moment.month - 1]} {moment.day}, {moment.year} > {moment:%H:%M:%S}"
+
+
+def boat_track(seconds, rng):
+    """A boat wandering at up to ~3 m/s, as (latitudes, longitudes)."""
+    heading = np.cumsum(rng.normal(0, 0.05, len(seconds)))
+    speed = np.clip(1.5 + np.cumsum(rng.normal(0, 0.02, len(seconds))) % 3.0, 0, 3.0)
+    east = np.cumsum(speed * np.sin(heading))
+    north = np.cumsum(speed * np.cos(heading))
+    # Keep the boat within ~2 km of the buoy, like the sample deployment
+    east = 2000 * np.sin(east / 2000)
+    north = 2000 * np.sin(north / 2000)
+    east_scale, north_scale = meters_per_degree(ORIGIN[0])
+    return ORIGIN[0] + north / north_scale, ORIGIN[1] + east / east_scale
+
+
+def buoy_track(seconds, rng):
+    """An anchored buoy swinging a few meters around its mooring."""
+    east_scale, north_scale = meters_per_degree(ORIGIN[0])
+    east = 5 * np.sin(seconds / 600) + rng.normal(0, 0.5, len(seconds))
+    north = 5 * np.cos(seconds / 900) + rng.normal(0, 0.5, len(seconds))
+    return ORIGIN[0] + 0.0005 + north / north_scale, ORIGIN[1] - 0.0005 + east / east_scale
+
+
+def _write_track(file_path, columns, seconds, latitudes, longitudes, missing):
+    time_key, latitude_key, longitude_key = columns
+    with open(file_path, 'w') as f:
+        for second, latitude, longitude, gap in zip(seconds.tolist(), latitudes.tolist(), longitudes.tolist(),
+                                                     missing.tolist()):
+            entry = {time_key: second, latitude_key: None if gap else round(latitude, 7),
+                     longitude_key: None if gap else round(longitude, 7)}
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+
+def node_positions(node, seconds, boat, buoy):
+    """``(latitudes, longitudes)`` of modem ``node`` at the GPS ``seconds`` (whole seconds into the tracks)."""
+    index = seconds.astype(np.intp)
+    if node == 0:
+        return boat[0][index], boat[1][index]
+    if node == 1:
+        return buoy[0][index], buoy[1][index]
+    east_scale, north_scale = meters_per_degree(ORIGIN[0])
+    north, east = MOORINGS[node]
+    return (np.full(len(index), ORIGIN[0] + 0.0005 + north / north_scale),
+            np.full(len(index), ORIGIN[1] - 0.0005 + east / east_scale))
+
+
+def _write_logs(log_dir, ping_seconds, ranges, rng, files, noise_lines):
+    """Write the request cycles over ``files`` consecutive log files, with modem chatter between them.
+
+    ``ranges`` holds ``(offset_seconds, source, destination, distances)`` per
+    pair, with one distance (NaN when it failed) per cycle.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    for number, chunk in enumerate(np.array_split(np.arange(len(ping_seconds)), files)):
+        with open(os.path.join(log_dir, f'pi_run_{number:04d}.log'), 'w') as f:
+            for index in chunk.tolist():
+                for offset, source, destination, distances in ranges:
+                    moment = START_TIME + timedelta(seconds=float(ping_seconds[index] + offset))
+                    stamp = _log_timestamp(moment)
+                    f.write(f"{stamp} | SER_OUT | $P00{source},{destination}\n")
+                    for _ in range(noise_lines):
+                        f.write(f"{stamp} | INFO | modem status ok, battery {rng.integers(60, 100)}%\n")
+                    if np.isnan(distances[index]):
+                        f.write(f"{stamp} | SER_IN | Response Not Received\n")
+                    else:
+                        f.write(f"{stamp} | SER_IN | Range {source} to {destination} : {distances[index]:.1f} m\n")
+
+
+def _write_bathymetry(file_path, count, rng):
+    east_scale, north_scale = meters_per_degree(ORIGIN[0])
+    depths_ft = rng.choice(np.arange(20, 620, 20), count)
+    # Contours run roughly parallel to the coast, deeper to the west
+    north = rng.uniform(-8000, 8000, count)
+    east = -depths_ft * 15.0 + rng.normal(0, 50, count)
+    with open(file_path, 'w') as f:
+        f.write('Name,Latitude,Longitude,Altitude\n')
+        for depth, latitude, longitude in zip(depths_ft.tolist(), (ORIGIN[0] + north / north_scale).tolist(),
+                                              (ORIGIN[1] + east / east_scale).tolist()):
+            f.write(f"{depth} ft,{latitude},{longitude},{-depth * 0.3048:.3f}\n")
+
+
+def generate_deployment(output_dir, scale=1.0, seed=0, files=None, noise_lines=20, success_rate=0.6, pairs=PAIRS):
+    """Write a synthetic deployment directory and return its sizes.
+
+    The directory holds the two resampled GPS files, ``pi_runs/*.log`` and a
+    bathymetry CSV. Every request cycle ranges each of ``pairs`` in turn. Modem
+    ranges are the true distance between the nodes plus 3 m of noise and
+    occasional multipath outliers; ranges fail more often with distance so
+    that about ``success_rate`` of them succeed. ``pings`` in the result
+    counts the cycles, i.e. the requests of each pair.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    gps_seconds = np.arange(0, int(SAMPLE_GPS_SECONDS * scale), dtype=np.float64)
+
+    boat_latitudes, boat_longitudes = boat_track(gps_seconds, rng)
+    buoy_latitudes, buoy_longitudes = buoy_track(gps_seconds, rng)
+    _write_track(os.path.join(output_dir, BOAT_FILE), BOAT_COLUMNS, gps_seconds, boat_latitudes, boat_longitudes,
+                 rng.random(len(gps_seconds)) < 0.002)
+    _write_track(os.path.join(output_dir, BUOY_FILE), BUOY_COLUMNS, gps_seconds, buoy_latitudes, buoy_longitudes,
+                 rng.random(len(gps_seconds)) < 0.002)
+
+    pings = max(1, int(SAMPLE_PINGS * scale))
+    intervals = np.round(rng.uniform(0.5, 1.5, pings) * PING_INTERVAL)
+    ping_seconds = 150 + np.cumsum(intervals)
+    ping_seconds = ping_seconds[ping_seconds + (len(pairs) - 1) * PAIR_INTERVAL < gps_seconds[-1]]
+    boat, buoy = (boat_latitudes, boat_longitudes), (buoy_latitudes, buoy_longitudes)
+    ranges = []
+    for number, (source, destination) in enumerate(pairs):
+        offset = number * PAIR_INTERVAL
+        distances = geodesic_distance(*node_positions(source, ping_seconds + offset, boat, buoy),
+                                      *node_positions(destination, ping_seconds + offset, boat, buoy))
+        modem = distances + rng.normal(0, 3.0, len(distances))
+        outliers = rng.random(len(modem)) < 0.05
+        modem[outliers] += rng.uniform(20, 300, outliers.sum())
+        failure_probability = np.clip((1 - success_rate) * 2 * distances / max(distances.max(), 1.0), 0, 1)
+        modem[rng.random(len(modem)) < failure_probability] = np.nan
+        ranges.append((offset, source, destination, modem))
+    files = files or max(1, int(np.ceil(scale)))
+    _write_logs(os.path.join(output_dir, 'pi_runs'), ping_seconds, ranges, rng, min(files, len(ping_seconds)),
+                noise_lines)
+
+    bathymetry_points = int(SAMPLE_BATHYMETRY_POINTS * scale)
+    _write_bathymetry(os.path.join(output_dir, BATHYMETRY_FILE), bathymetry_points, rng)
+    successful = sum(int((~np.isnan(modem)).sum()) for _, _, _, modem in ranges)
+    return {'gps_fixes': len(gps_seconds), 'pings': len(ping_seconds), 'pairs': len(pairs),
+            'successful_pings': successful, 'log_files': min(files, len(ping_seconds)),
+            'bathymetry_points': bathymetry_points}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', type=float, default=1.0, help="size relative to the sample deployment")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--files', type=int, help="number of pi log files (default: one per unit of scale)")
+    args = parser.parse_args()
+    print(generate_deployment(args.output_dir, scale=args.scale, seed=args.seed, files=args.files))
+
+
+if __name__ == '__main__':
+    main()
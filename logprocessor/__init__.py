@@ -0,0 +1 @@
+"""Shared processing code for the pi modem range logs and boat/buoy GPS tracks."""
@@ -0,0 +1,3 @@
+from logprocessor.cli import main
+
+main()
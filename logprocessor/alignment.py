@@ -0,0 +1,130 @@
+"""Timestamp-based alignment of modem range pings against the boat and buoy GPS tracks.
+
+Each resampled GPS file is loaded once into sorted NumPy columns and every
+range ping is resolved with a single vectorized ``searchsorted`` followed by
+linear interpolation of latitude and longitude.
+"""
+import json
+from array import array
+from collections import namedtuple
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.cache import cached_columns
+from logprocessor.compression import open_stream
+from logprocessor.instrumentation import count
+from logprocessor.records import Track
+
+# Column names used by the resampled GPS JSON-lines files
+BOAT_COLUMNS = ('seconds_after_start', 'phone_latitude', 'phone_longitude')
+BUOY_COLUMNS = ('SecondsFromStart', 'Latitude', 'Longitude')
+
+AlignedPings = namedtuple('AlignedPings', ['boat_latitudes', 'boat_longitudes',
+                                           'buoy_latitudes', 'buoy_longitudes', 'valid'])
+
+
+def _read_track_columns(file_path, time_key, latitude_key, longitude_key):
+    # Plain doubles while reading, rather than a list of boxed floats per column
+    times, latitudes, longitudes = array('d'), array('d'), array('d')
+    with open_stream(file_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                time, latitude, longitude = entry[time_key], entry[latitude_key], entry[longitude_key]
+            except json.JSONDecodeError as e:
+                logger.error(f"Error parsing JSON from {file_path}: {e}")
+                count('gps_json_errors')
+                continue
+            except KeyError as e:
+                logger.error(f"Missing key in {file_path}: {e}")
+                count('gps_json_errors')
+                continue
+            if time is None or latitude is None or longitude is None:
+                logger.warning(f"Invalid GPS entry found in {file_path}: {entry}")
+                count('invalid_gps_fixes')
+                continue
+            times.append(time)
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+
+    count('gps_fixes_read', len(times))
+    times = np.frombuffer(times, dtype=np.float64)
+    order = np.argsort(times, kind='stable')
+    return Track(times[order], np.frombuffer(latitudes, dtype=np.float64)[order],
+                 np.frombuffer(longitudes, dtype=np.float64)[order]).columns()
+
+
+def load_track(file_path, time_key, latitude_key, longitude_key, use_cache=True, cache_dir=None):
+    """Load a resampled GPS JSON-lines file, which may be compressed, into a time-sorted ``Track``.
+
+    With ``use_cache`` the parsed columns are memory-mapped from the columnar
+    cache (in ``cache_dir``, by default ``.cache`` next to the file), so only
+    the first load of a given file content parses the JSON.
+    """
+    def build(source_file):
+        return _read_track_columns(source_file, time_key, latitude_key, longitude_key)
+
+    columns = cached_columns(file_path, 'track', build, cache_dir) if use_cache else build(file_path)
+    track = Track(columns['times'], columns['latitudes'], columns['longitudes'])
+    logger.info(f"Loaded {len(track.times)} GPS points from {file_path}.")
+    return track
+
+
+def load_boat_track(file_path='./logs/resampled_boat_gps_data.json', use_cache=True, cache_dir=None):
+    return load_track(file_path, *BOAT_COLUMNS, use_cache=use_cache, cache_dir=cache_dir)
+
+
+def load_buoy_track(file_path='./logs/resampled_buoy_gps_data.json', use_cache=True, cache_dir=None):
+    return load_track(file_path, *BUOY_COLUMNS, use_cache=use_cache, cache_dir=cache_dir)
+
+
+def interpolate_track(track, query_times):
+    """Linearly interpolate track positions at ``query_times``.
+
+    Returns ``(latitudes, longitudes)``; queries outside the time span of the
+    track are NaN.
+    """
+    query_times = np.asarray(query_times, dtype=np.float64)
+    latitudes = np.full(query_times.shape, np.nan)
+    longitudes = np.full(query_times.shape, np.nan)
+    n = len(track.times)
+    if n == 0:
+        return latitudes, longitudes
+    if n == 1:
+        exact = query_times == track.times[0]
+        latitudes[exact] = track.latitudes[0]
+        longitudes[exact] = track.longitudes[0]
+        return latitudes, longitudes
+
+    inside = (query_times >= track.times[0]) & (query_times <= track.times[-1])
+    upper = np.clip(np.searchsorted(track.times, query_times, side='right'), 1, n - 1)
+    lower = upper - 1
+    start, end = track.times[lower], track.times[upper]
+    span = end - start
+    weight = np.divide(query_times - start, span, out=np.zeros_like(query_times), where=span > 0)
+
+    latitudes = track.latitudes[lower] + weight * (track.latitudes[upper] - track.latitudes[lower])
+    longitudes = track.longitudes[lower] + weight * (track.longitudes[upper] - track.longitudes[lower])
+    latitudes[~inside] = np.nan
+    longitudes[~inside] = np.nan
+    return latitudes, longitudes
+
+
+def align_pings(ping_seconds, boat_track, buoy_track, boat_scale=1.0, buoy_scale=1.0,
+                boat_offset=0.0, buoy_offset=0.0):
+    """Resolve boat and buoy positions for every range ping in one batched lookup.
+
+    Ping times (seconds after the first modem log entry) are mapped onto each
+    GPS clock as ``seconds * scale + offset`` before interpolation. ``valid``
+    is False for pings that fall outside either track.
+    """
+    ping_seconds = np.asarray(ping_seconds, dtype=np.float64)
+    boat_latitudes, boat_longitudes = interpolate_track(boat_track, ping_seconds * boat_scale + boat_offset)
+    buoy_latitudes, buoy_longitudes = interpolate_track(buoy_track, ping_seconds * buoy_scale + buoy_offset)
+    valid = ~(np.isnan(boat_latitudes) | np.isnan(buoy_latitudes))
+    skipped = int((~valid).sum())
+    count('dropped_pings', skipped)
+    if skipped:
+        logger.warning(f"{skipped} range pings fall outside the boat or buoy GPS tracks and were not aligned.")
+    return AlignedPings(boat_latitudes, boat_longitudes, buoy_latitudes, buoy_longitudes, valid)
@@ -0,0 +1,24 @@
+"""Comparison of modem-reported ranges with GPS-derived boat-buoy distances."""
+from collections import namedtuple
+
+import numpy as np
+
+from logprocessor.alignment import align_pings
+from logprocessor.geodesy import geodesic_distance
+
+RangeComparison = namedtuple('RangeComparison', ['aligned', 'calculated_distances', 'successful'])
+
+
+def compare_ranges(dataset, boat_scale=1.0, buoy_scale=1.0, boat_offset=0.0, buoy_offset=0.0):
+    """Align every range ping and compute the boat-buoy distance at that time.
+
+    The clock parameters are usually taken from ``logprocessor.clock.fit_clock``.
+    ``successful`` marks pings that were aligned and got a modem distance.
+    """
+    aligned = align_pings(dataset.ranges.seconds_after_start, dataset.boat_track, dataset.buoy_track,
+                          boat_scale=boat_scale, buoy_scale=buoy_scale,
+                          boat_offset=boat_offset, buoy_offset=buoy_offset)
+    calculated_distances = geodesic_distance(aligned.boat_latitudes, aligned.boat_longitudes,
+                                             aligned.buoy_latitudes, aligned.buoy_longitudes)
+    successful = aligned.valid & ~np.isnan(dataset.ranges.distances)
+    return RangeComparison(aligned, calculated_distances, successful)
@@ -0,0 +1,167 @@
+"""Reprocessing of many deployments in parallel worker processes.
+
+A deployment is any directory holding the two resampled GPS files and either
+a ``pi_runs.json`` range dataset or a ``pi_runs/`` directory of raw modem
+logs. Each one is ingested, clock-fitted, summarized, mapped and plotted in
+its own worker process into ``<output_dir>/<deployment name>/``, and the
+per-deployment results are combined into ``<output_dir>/summary.json`` and a
+merged ``range_error_stats.json``. A failing deployment is reported in the
+summary without stopping the others. A deployment with a bathymetry CSV also
+gets its range errors broken down by water depth. The deployment directories
+are only read: the range dataset ingested from raw logs, its manifest and the
+columnar caches are kept in the deployment's output directory too.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from loguru import logger
+
+from logprocessor.cache import CACHE_DIR_NAME
+from logprocessor.compression import find_compressed
+from logprocessor.dataset import BOAT_FILE, BUOY_FILE, RANGES_FILE
+from logprocessor.instrumentation import call_counted, merge_counts, timed
+from logprocessor.parsing import DEFAULT_PAIR
+
+PI_LOG_DIR_NAME = 'pi_runs'
+SUMMARY_FILE = 'summary.json'
+STATS_FILE = 'range_error_stats.json'
+
+
+def is_deployment(directory):
+    def exists(name):
+        return os.path.exists(find_compressed(os.path.join(directory, name)))
+
+    return exists(BOAT_FILE) and exists(BUOY_FILE) and (exists(RANGES_FILE) or exists(PI_LOG_DIR_NAME))
+
+
+def find_deployments(root):
+    """Deployment directories under ``root`` (including ``root`` itself), sorted by path."""
+    deployments = []
+    for directory, subdirectories, _ in os.walk(root):
+        if is_deployment(directory):
+            deployments.append(directory)
+            subdirectories.clear()  # A deployment's pi_runs/ never holds another deployment
+        else:
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+    return sorted(deployments)
+
+
+def deployment_name(root, deployment_dir):
+    """Output directory name of a deployment: its path below ``root`` joined with ``__``."""
+    relative = os.path.relpath(deployment_dir, root)
+    if relative == '.':
+        return os.path.basename(os.path.abspath(root))
+    return relative.replace(os.sep, '__')
+
+
+def process_deployment(deployment_dir, output_dir, tiff_file=None, tile_dir=None, pyramid=None, render_mode='fast',
+                       track_tolerance=1.0, use_cache=True, clean=True, filter_ranges=False, pair=DEFAULT_PAIR):
+    """Ingest, fit, summarize, map and plot one deployment into ``output_dir``.
+
+    Nothing is written to ``deployment_dir``. Runs in a worker process;
+    returns a JSON-serializable result row.
+    """
+    from logprocessor.bathymetry import BATHYMETRY_FILE, load_bathymetry, ping_depths
+    from logprocessor.clock import compare_fitted
+    from logprocessor.dataset import load_dataset
+    from logprocessor.ingest import ingest_logs
+    from logprocessor.plots import plot_boat_buoy_distances, plot_range_errors
+    from logprocessor.site import build_map
+    from logprocessor.stats import aggregate_range_errors, save_stats
+
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    ranges_file = os.path.join(deployment_dir, RANGES_FILE)
+    pi_log_dir = os.path.join(deployment_dir, PI_LOG_DIR_NAME)
+    if os.path.isdir(pi_log_dir):
+        # Deployments already run in parallel, so each parses its own logs serially
+        ranges_file = os.path.join(output_dir, RANGES_FILE)
+        ingest_logs(pi_log_dir, ranges_file, workers=1)
+
+    cache_dir = os.path.join(output_dir, CACHE_DIR_NAME)
+    dataset = load_dataset(deployment_dir, ranges_file=ranges_file, use_cache=use_cache, clean=clean,
+                           filter_ranges=filter_ranges, pair=pair, cache_dir=cache_dir)
+    clock_fit, comparison = compare_fitted(dataset)
+    depths = None
+    bathymetry_file = os.path.join(deployment_dir, BATHYMETRY_FILE)
+    if os.path.exists(bathymetry_file):
+        index = load_bathymetry(bathymetry_file, use_cache=use_cache, cache_dir=cache_dir)
+        depths = ping_depths(index, comparison.aligned).mean()
+    aggregate = aggregate_range_errors(dataset, comparison, depths=depths)
+    save_stats(aggregate, os.path.join(output_dir, STATS_FILE))
+    build_map(dataset, comparison, tiff_file=tiff_file, map_file=os.path.join(output_dir, 'index.html'),
+              render_mode=render_mode, track_tolerance=track_tolerance, tile_dir=tile_dir, pyramid=pyramid)
+    plot_range_errors(dataset, comparison, output_dir=output_dir, workers=1)
+    plot_boat_buoy_distances(dataset, comparison, output_dir=output_dir, workers=1)
+    return {
+        'clock': clock_fit._asdict(),
+        'stats': aggregate.total.summary(),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+@timed('batch')
+def run_batch(root, output_dir, workers=None, tiff_file=None, render_mode='fast', track_tolerance=1.0,
+              use_cache=True, clean=True, filter_ranges=False, pair=DEFAULT_PAIR):
+    """Process every deployment under ``root`` and write the combined summary.
+
+    Returns the summary dict that is also saved to ``<output_dir>/summary.json``.
+    """
+    from logprocessor.stats import RangeErrorAggregate, load_stats, save_stats
+
+    deployments = find_deployments(root)
+    if not deployments:
+        raise ValueError(f"No deployments found under {root}")
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Processing {len(deployments)} deployments from {root} into {output_dir}.")
+
+    # Build the shared bathymetry tiles once, before the workers look them up concurrently
+    tile_dir = pyramid = None
+    if tiff_file:
+        from logprocessor.site import TILE_DIR_NAME
+        from logprocessor.tiles import build_tile_pyramid
+
+        tile_dir = os.path.join(output_dir, TILE_DIR_NAME)
+        pyramid = build_tile_pyramid(tiff_file, tile_dir)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for deployment_dir in deployments:
+            name = deployment_name(root, deployment_dir)
+            process = partial(process_deployment, tiff_file=tiff_file, tile_dir=tile_dir, pyramid=pyramid,
+                              render_mode=render_mode, track_tolerance=track_tolerance, use_cache=use_cache,
+                              clean=clean, filter_ranges=filter_ranges, pair=pair)
+            future = pool.submit(call_counted, process, deployment_dir, os.path.join(output_dir, name))
+            futures[future] = (name, deployment_dir)
+        for future in as_completed(futures):
+            name, deployment_dir = futures[future]
+            try:
+                result, counts = future.result()
+                merge_counts(counts)
+            except Exception as e:
+                logger.error(f"Deployment {deployment_dir} failed: {e!r}")
+                result = {'error': repr(e)}
+            else:
+                logger.info(f"Processed deployment {deployment_dir} in {result['seconds']} s.")
+            results[name] = dict(result, directory=deployment_dir)
+
+    combined = RangeErrorAggregate()
+    for name, result in results.items():
+        if 'error' not in result:
+            combined.merge(load_stats(os.path.join(output_dir, name, STATS_FILE)))
+    save_stats(combined, os.path.join(output_dir, STATS_FILE))
+
+    summary = {
+        'deployments': {name: results[name] for name in sorted(results)},
+        'failed': sorted(name for name, result in results.items() if 'error' in result),
+        'combined': combined.total.summary(),
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILE), 'w') as f:
+        json.dump(summary, f, indent=4)
+    logger.info(f"Processed {len(results) - len(summary['failed'])} of {len(results)} deployments; "
+                f"summary saved to {os.path.join(output_dir, SUMMARY_FILE)}.")
+    return summary
@@ -0,0 +1,136 @@
+"""Spatial index over the bathymetry contour export for per-ping depth lookup.
+
+``la_jolla_bathymetry_data.csv`` holds contour points (Name, Latitude,
+Longitude, Altitude in meters, negative below sea level). The points are
+projected onto a local east/north plane in meters and indexed with a KD-tree,
+so nearest-neighbour and interpolated-depth queries for whole coordinate
+columns cost O(log n) per query point. ``logprocessor stats --bathymetry``
+uses the depths of the pings to break the range errors and failures down by
+water depth.
+"""
+import csv
+from collections import namedtuple
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.cache import cached_columns
+from logprocessor.compression import open_stream
+from logprocessor.geodesy import meters_per_degree
+from logprocessor.instrumentation import count, timed
+
+BATHYMETRY_FILE = 'la_jolla_bathymetry_data.csv'
+
+
+class PingDepths(namedtuple('PingDepths', ['boat_depths', 'buoy_depths'])):
+    __slots__ = ()
+
+    def mean(self):
+        """Mean water depth at the boat and buoy of each ping; NaN where either is unknown."""
+        return (self.boat_depths + self.buoy_depths) / 2
+
+
+def _read_bathymetry_columns(file_path):
+    names, latitudes, longitudes, altitudes = [], [], [], []
+    with open_stream(file_path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                latitude, longitude, altitude = float(row['Latitude']), float(row['Longitude']), float(row['Altitude'])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping bathymetry row {row}: {e}")
+                count('bathymetry_rows_skipped')
+                continue
+            # Named placemarks (buoys, anchor spots) are exported at altitude 0 and are not soundings
+            if altitude == 0 and not row['Name'].endswith(' ft'):
+                continue
+            names.append(row['Name'])
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            altitudes.append(altitude)
+    return {
+        'names': np.array(names, dtype=str),
+        'latitudes': np.asarray(latitudes, dtype=np.float64),
+        'longitudes': np.asarray(longitudes, dtype=np.float64),
+        'altitudes': np.asarray(altitudes, dtype=np.float64),
+    }
+
+
+class BathymetryIndex:
+    """KD-tree over bathymetry points in a local metric projection."""
+
+    def __init__(self, latitudes, longitudes, altitudes):
+        from scipy.spatial import cKDTree
+
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.altitudes = np.asarray(altitudes, dtype=np.float64)
+        self.origin = (float(self.latitudes.mean()), float(self.longitudes.mean()))
+        self.scale = meters_per_degree(self.origin[0])
+        self.tree = cKDTree(self._project(self.latitudes, self.longitudes))
+
+    def __len__(self):
+        return len(self.altitudes)
+
+    def _project(self, latitudes, longitudes):
+        east = (np.asarray(longitudes, dtype=np.float64) - self.origin[1]) * self.scale[0]
+        north = (np.asarray(latitudes, dtype=np.float64) - self.origin[0]) * self.scale[1]
+        return np.column_stack([np.ravel(east), np.ravel(north)])
+
+    def nearest(self, latitudes, longitudes, k=1):
+        """Distances in meters and indices of the ``k`` nearest bathymetry points.
+
+        NaN coordinates get an infinite distance and index ``len(self)``, the
+        same convention ``cKDTree.query`` uses for missing neighbours.
+        """
+        points = self._project(latitudes, longitudes)
+        finite = np.isfinite(points).all(axis=1)
+        shape = (len(points), k) if k > 1 else (len(points),)
+        distances = np.full(shape, np.inf)
+        indices = np.full(shape, len(self), dtype=np.intp)
+        if finite.any():
+            distances[finite], indices[finite] = self.tree.query(points[finite], k=k)
+        return distances, indices
+
+    def depth_at(self, latitudes, longitudes, k=4, max_distance=None, power=2.0):
+        """Water depth in meters (positive down) interpolated from the ``k`` nearest points.
+
+        Uses inverse-distance weighting with the given ``power``. Positions whose
+        nearest point is further than ``max_distance`` meters, or that are NaN,
+        get NaN.
+        """
+        k = min(k, len(self))
+        distances, indices = self.nearest(latitudes, longitudes, k=k)
+        if k == 1:
+            distances, indices = distances[:, None], indices[:, None]
+        found = np.isfinite(distances)
+        altitudes = np.where(found, self.altitudes[np.minimum(indices, len(self) - 1)], 0.0)
+        with np.errstate(divide='ignore'):
+            weights = np.where(found, 1.0 / np.maximum(distances, 1e-6) ** power, 0.0)
+        with np.errstate(invalid='ignore'):
+            depths = -(weights * altitudes).sum(axis=1) / weights.sum(axis=1)
+        too_far = ~found[:, 0]
+        if max_distance is not None:
+            too_far |= distances[:, 0] > max_distance
+        depths[too_far] = np.nan
+        return depths
+
+
+@timed('bathymetry')
+def load_bathymetry(file_path=f'./logs/{BATHYMETRY_FILE}', use_cache=True, cache_dir=None):
+    """Build a ``BathymetryIndex`` from a bathymetry CSV export.
+
+    The parsed columns are cached in ``cache_dir`` (default: next to the CSV).
+    """
+    columns = (cached_columns(file_path, 'bathymetry', _read_bathymetry_columns, cache_dir) if use_cache
+               else _read_bathymetry_columns(file_path))
+    index = BathymetryIndex(columns['latitudes'], columns['longitudes'], columns['altitudes'])
+    logger.info(f"Indexed {len(index)} bathymetry points from {file_path}.")
+    return index
+
+
+def ping_depths(index, aligned, k=4, max_distance=None):
+    """Water depth at the boat and buoy position of every aligned range ping."""
+    return PingDepths(
+        boat_depths=index.depth_at(aligned.boat_latitudes, aligned.boat_longitudes, k=k, max_distance=max_distance),
+        buoy_depths=index.depth_at(aligned.buoy_latitudes, aligned.buoy_longitudes, k=k, max_distance=max_distance),
+    )
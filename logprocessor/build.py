@@ -0,0 +1,313 @@
+"""Content-hashed build graph of the processing stages.
+
+The pipeline is a graph of ``Stage``s: ingest -> load -> clock -> stats,
+map and plots. Each stage is keyed by a SHA-256 over its configuration, the
+content of its source input files, the source of the modules implementing it
+and the keys of the stages it depends on, so a key changes exactly when the
+stage could produce something different. Keys of the last successful build
+are kept in a state file next to the outputs, which can be committed with
+them; a stage whose key matches and whose outputs all exist is skipped. File
+hashes are remembered by size and mtime in a separate, local cache file.
+When a stale stage needs the value of an up-to-date one (the clock fit, say),
+that value is reloaded from its saved output instead of being recomputed
+where the stage supports it. Stale stages whose dependencies are done run
+concurrently in a thread pool; the plot stage renders its figures in worker
+processes, so it overlaps with the map. Stages that start processes from
+these threads spawn them rather than fork, which could copy a lock held by
+another thread into the child.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from loguru import logger
+
+from logprocessor.cache import file_sha256
+from logprocessor.instrumentation import timed
+
+# Bump to invalidate every recorded key, e.g. when the key derivation changes
+BUILD_VERSION = 1
+STATE_FILE_NAME = '.build.json'
+FILE_HASHES_NAME = os.path.join('.cache', 'build_file_hashes.json')
+# Figure sets of the plot stage, named after the CLI subcommands that draw them
+PLOT_SETS = ('errors', 'plot')
+
+
+class Stage:
+    """One node of the build graph.
+
+    ``run(*dependency_values)`` does the work and returns the stage's value.
+    ``load(*dependency_values)``, if given, rebuilds the value of an
+    up-to-date stage from its outputs more cheaply than ``run``. ``inputs``
+    are source files read by the stage that no other stage produces;
+    ``outputs`` are the files it writes; ``modules`` name the code it runs.
+    """
+
+    def __init__(self, name, run, deps=(), inputs=(), outputs=(), modules=(), config=None, load=None):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.modules = tuple(modules)
+        self.config = config or {}
+        self.load = load
+
+
+class FileHashes:
+    """SHA-256 of files, reused while a file's size and mtime are unchanged."""
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.known = {}
+        if cache_file:
+            try:
+                with open(cache_file, 'r') as f:
+                    self.known = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    def __call__(self, file_path):
+        # Relative to the working directory, so a state file committed with the outputs is valid in any checkout
+        file_path = os.path.relpath(file_path)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        entry = self.known.get(file_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        digest = file_sha256(file_path)
+        self.known[file_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def save(self):
+        if not self.cache_file:
+            return
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        with open(self.cache_file, 'w') as f:
+            json.dump(self.known, f, indent=4)
+
+
+def module_hash(module_name, hashes):
+    """Hash of the source file of ``module_name``, found without importing it."""
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or not spec.origin or not os.path.exists(spec.origin):
+        return module_name
+    return hashes(spec.origin)
+
+
+def stage_keys(stages, hashes):
+    """``{name: key}`` for stages listed so that every stage comes after its dependencies."""
+    keys = {}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in keys]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on {missing}, which are not listed before it")
+        description = {
+            'version': BUILD_VERSION,
+            'stage': stage.name,
+            'config': stage.config,
+            'inputs': {os.path.relpath(path): hashes(path) for path in stage.inputs},
+            'code': {name: module_hash(name, hashes) for name in stage.modules},
+            'deps': [keys[dep] for dep in stage.deps],
+        }
+        keys[stage.name] = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+    return keys
+
+
+def load_state(state_file):
+    try:
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'stages': {}}
+    if state.get('version') != BUILD_VERSION:
+        return {'stages': {}}
+    return state
+
+
+def save_state(state, state_file):
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+    temporary_file = state_file + '.tmp'
+    with open(temporary_file, 'w') as f:
+        json.dump(dict(state, version=BUILD_VERSION), f, indent=4, sort_keys=True)
+    os.replace(temporary_file, state_file)
+
+
+def _plan(stages, keys, state, force):
+    """Which stages to run, which to reload from their outputs, and which to skip."""
+    by_name = {stage.name: stage for stage in stages}
+    stale = {stage.name for stage in stages
+             if force or state['stages'].get(stage.name) != keys[stage.name]
+             or not all(os.path.exists(path) for path in stage.outputs)}
+    actions = {name: 'run' for name in stale}
+    # Walk backwards so a stage's dependents are planned before the stage itself
+    for stage in reversed(stages):
+        if stage.name not in actions:
+            continue
+        for dep in stage.deps:
+            if dep not in actions:
+                actions[dep] = 'load' if by_name[dep].load is not None else 'run'
+    return actions
+
+
+@timed('build')
+def build(stages, state_file, workers=None, force=False):
+    """Bring the outputs of ``stages`` up to date; returns ``{name: 'run' | 'load' | 'fresh'}``.
+
+    The state file is updated after the build, also when a stage fails, so
+    the stages that did finish are not redone next time.
+    """
+    state = load_state(state_file)
+    hashes = FileHashes(os.path.join(os.path.dirname(state_file) or '.', FILE_HASHES_NAME))
+    keys = stage_keys(stages, hashes)
+    actions = _plan(stages, keys, state, force)
+    plan = ', '.join(f"{stage.name}: {actions.get(stage.name, 'fresh')}" for stage in stages)
+    logger.info(f"Build plan: {plan}.")
+
+    by_name = {stage.name: stage for stage in stages}
+    values = {}
+    pending = [stage.name for stage in stages if stage.name in actions]
+    running = {}
+
+    def execute(stage, action):
+        function = stage.run if action == 'run' else stage.load
+        with timed(f'build:{stage.name}'):
+            return function(*(values[dep] for dep in stage.deps))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in [name for name in pending if all(dep in values for dep in by_name[name].deps)]:
+                    pending.remove(name)
+                    running[pool.submit(execute, by_name[name], actions[name])] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    values[name] = future.result()
+                    if actions[name] == 'run':
+                        state['stages'][name] = keys[name]
+    finally:
+        save_state(state, state_file)
+        hashes.save()
+    return {stage.name: actions.get(stage.name, 'fresh') for stage in stages}
+
+
+def pipeline_stages(log_dir='./logs', ranges_file=None, pi_log_dir=None, map_file=None, tiff_file=None,
+                    plot_dir=None, plots=PLOT_SETS, stats_file=None, clock_file=None, map_options=None,
+                    load_options=None, plot_workers=None):
+    """The stages of a deployment's pipeline; map, plots and stats are included when their output is given.
+
+    ``plots`` picks the figure sets drawn into ``plot_dir`` (see
+    ``PLOT_SETS``). ``map_options`` are passed to ``build_map`` and
+    ``load_options`` to ``load_dataset``. The clock fit is saved to
+    ``clock_file`` (default: ``<log_dir>/clock_fit.json``) so it can be reused
+    without refitting.
+    """
+    from logprocessor.clock import CLOCK_FILE
+    from logprocessor.compression import find_compressed
+    from logprocessor.dataset import BOAT_FILE, BUOY_FILE, RANGES_FILE
+    from logprocessor.plots import (BOAT_BUOY_DISTANCE_FILES, RANGE_ERROR_FILES, boat_buoy_distance_figures,
+                                    range_error_figures)
+
+    ranges_file = ranges_file or os.path.join(log_dir, RANGES_FILE)
+    clock_file = clock_file or os.path.join(log_dir, CLOCK_FILE)
+    map_options = dict(map_options or {})
+    load_options = dict(load_options or {})
+    stages = []
+    gps_files = [find_compressed(os.path.join(log_dir, BOAT_FILE)), find_compressed(os.path.join(log_dir, BUOY_FILE))]
+
+    if pi_log_dir and os.path.isdir(pi_log_dir):
+        def ingest():
+            from logprocessor.ingest import ingest_logs
+
+            ingest_logs(pi_log_dir, ranges_file)
+
+        from logprocessor.parsing import find_log_files
+
+        # Ingest only produces its file, so an up-to-date ingest has nothing to reload
+        stages.append(Stage('ingest', ingest, inputs=find_log_files(pi_log_dir), outputs=[ranges_file],
+                            modules=['logprocessor.ingest', 'logprocessor.parsing'], load=lambda: None))
+        load_inputs, load_deps = gps_files, ['ingest']
+    else:
+        load_inputs, load_deps = gps_files + [find_compressed(ranges_file)], []
+
+    def load(*_):
+        from logprocessor.dataset import load_dataset
+
+        return load_dataset(log_dir, ranges_file=ranges_file, **load_options)
+
+    stages.append(Stage('load', load, deps=load_deps, inputs=load_inputs, config=load_options,
+                        modules=['logprocessor.dataset', 'logprocessor.alignment', 'logprocessor.parsing',
+                                 'logprocessor.records', 'logprocessor.validation', 'logprocessor.cache']))
+
+    def fit(dataset):
+        from logprocessor.clock import compare_fitted, save_clock_fit
+
+        clock_fit, comparison = compare_fitted(dataset)
+        save_clock_fit(clock_fit, clock_file)
+        return clock_fit, comparison
+
+    def load_fit(dataset):
+        from logprocessor.analysis import compare_ranges
+        from logprocessor.clock import load_clock_fit
+
+        clock_fit = load_clock_fit(clock_file)
+        return clock_fit, compare_ranges(dataset, clock_fit.boat_scale, clock_fit.buoy_scale,
+                                         clock_fit.boat_offset, clock_fit.buoy_offset)
+
+    stages.append(Stage('clock', fit, deps=['load'], outputs=[clock_file], load=load_fit,
+                        modules=['logprocessor.clock', 'logprocessor.analysis', 'logprocessor.alignment',
+                                 'logprocessor.geodesy']))
+
+    if stats_file:
+        def stats(dataset, clock):
+            from logprocessor.stats import aggregate_range_errors, save_stats
+
+            save_stats(aggregate_range_errors(dataset, clock[1]), stats_file)
+
+        stages.append(Stage('stats', stats, deps=['load', 'clock'], outputs=[stats_file],
+                            modules=['logprocessor.stats']))
+
+    if map_file:
+        def render_map(dataset, clock):
+            from logprocessor.site import build_map
+
+            os.makedirs(os.path.dirname(map_file) or '.', exist_ok=True)
+            build_map(dataset, clock[1], tiff_file=tiff_file, map_file=map_file, **map_options)
+
+        from logprocessor.site import TILE_DIR_NAME
+        from logprocessor.tiles import MANIFEST_NAME
+
+        map_outputs = [map_file]
+        if tiff_file and map_options.get('overlay', 'tiles') == 'tiles':
+            # The page is useless without its tiles, so a missing pyramid makes the map stale too
+            map_outputs.append(os.path.join(os.path.dirname(map_file), TILE_DIR_NAME, MANIFEST_NAME))
+        stages.append(Stage('map', render_map, deps=['load', 'clock'], inputs=[tiff_file] if tiff_file else [],
+                            outputs=map_outputs, config=dict(map_options, tiff_file=tiff_file),
+                            modules=['logprocessor.site', 'logprocessor.tiles', 'logprocessor.decimation',
+                                     'logprocessor.records', 'logprocessor.geodesy']))
+
+    if plot_dir and plots:
+        sets = {'errors': (range_error_figures, RANGE_ERROR_FILES),
+                'plot': (boat_buoy_distance_figures, BOAT_BUOY_DISTANCE_FILES)}
+        unknown = set(plots) - set(sets)
+        if unknown:
+            raise ValueError(f"Unknown plot sets {sorted(unknown)}; expected some of {PLOT_SETS}")
+        plots = [name for name in PLOT_SETS if name in plots]
+
+        # One stage, so every figure shares one process pool and one write of the plot manifest
+        def render_plots(dataset, clock):
+            from logprocessor.plots import render_figures
+
+            os.makedirs(plot_dir, exist_ok=True)
+            render_figures([spec for name in plots for spec in sets[name][0](dataset, clock[1], plot_dir)],
+                           workers=plot_workers)
+
+        outputs = [os.path.join(plot_dir, file_name) for name in plots for file_name in sets[name][1]]
+        stages.append(Stage('plots', render_plots, deps=['load', 'clock'], outputs=outputs, config={'plots': plots},
+                            modules=['logprocessor.plots', 'logprocessor.geodesy']))
+    return stages
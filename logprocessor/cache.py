@@ -0,0 +1,104 @@
+"""Columnar binary cache for the GPS and range datasets.
+
+The first load of a JSON dataset converts it into one ``.npy`` file per column
+plus a ``schema.json`` header, stored under a directory keyed by the SHA-256
+of the source file. Later loads of the same content memory-map the columns
+with ``np.load(mmap_mode='r')`` instead of re-parsing the JSON.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from loguru import logger
+
+# Bump when the on-disk layout or any column builder changes
+CACHE_VERSION = 2
+CACHE_DIR_NAME = '.cache'
+
+
+def default_cache_dir(source_file):
+    return os.path.join(os.path.dirname(os.path.abspath(source_file)), CACHE_DIR_NAME)
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry_prefix(source_file, kind):
+    return f"{os.path.basename(source_file)}.{kind}-"
+
+
+def _read_entry(entry_dir):
+    with open(os.path.join(entry_dir, 'schema.json'), 'r') as f:
+        schema = json.load(f)
+    return {name: np.load(os.path.join(entry_dir, column['file']), mmap_mode='r')
+            for name, column in schema['columns'].items()}
+
+
+def _write_entry(entry_dir, source_file, source_hash, columns):
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+    schema = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(source_file),
+        'sha256': source_hash,
+        'length': len(next(iter(columns.values()))) if columns else 0,
+        'columns': {},
+    }
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+        np.save(os.path.join(staging_dir, f'{name}.npy'), values)
+        schema['columns'][name] = {'dtype': values.dtype.str, 'file': f'{name}.npy'}
+    with open(os.path.join(staging_dir, 'schema.json'), 'w') as f:
+        json.dump(schema, f, indent=4)
+    try:
+        os.replace(staging_dir, entry_dir)
+    except OSError:
+        # Another process cached the same content first
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _prune_stale_entries(cache_dir, prefix, keep):
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name != keep:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+def cached_columns(source_file, kind, build, cache_dir=None):
+    """Return the columns of ``source_file`` as a dict of read-only arrays.
+
+    ``kind`` names the column layout (e.g. ``'boat'``) and ``build`` is called
+    with the source path to produce ``{name: array}`` when there is no cache
+    entry for the current content of the file.
+    """
+    cache_dir = cache_dir or default_cache_dir(source_file)
+    source_hash = file_sha256(source_file)
+    prefix = _entry_prefix(source_file, kind)
+    entry_name = f"{prefix}v{CACHE_VERSION}-{source_hash[:16]}"
+    entry_dir = os.path.join(cache_dir, entry_name)
+
+    if os.path.isdir(entry_dir):
+        try:
+            columns = _read_entry(entry_dir)
+            logger.info(f"Mapped cached columns for {source_file} from {entry_dir}.")
+            return columns
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable cache entry {entry_dir}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    columns = build(source_file)
+    try:
+        _write_entry(entry_dir, source_file, source_hash, columns)
+        _prune_stale_entries(cache_dir, prefix, entry_name)
+        columns = _read_entry(entry_dir)
+    except OSError as e:
+        logger.warning(f"Could not write cache entry for {source_file}: {e}")
+    return columns
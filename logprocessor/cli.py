@@ -0,0 +1,344 @@
+"""Command line interface: ``logprocessor resample|ingest|clock|stats|map|shards|plot|errors|all|build|batch|live``.
+
+The datasets are loaded and their clocks fitted once per process and shared
+by every subcommand run in it; ``build`` instead only redoes the stages whose
+inputs, settings or code changed since its last run. folium, rasterio and
+matplotlib are only imported by the subcommands that draw something.
+"""
+import argparse
+import os
+
+from loguru import logger
+
+from logprocessor.build import PLOT_SETS
+from logprocessor.clock import CLOCK_FILE, compare_fitted
+from logprocessor.dataset import RANGES_FILE, load_dataset
+from logprocessor.instrumentation import PROFILERS, run
+
+# Kept in sync with logprocessor.site, which is not imported here to keep folium lazy
+RENDER_MODES = ('fast', 'markers')
+STATS_FILE = 'range_error_stats.json'
+# Kept in sync with logprocessor.bathymetry, which is not imported here to keep scipy lazy
+BATHYMETRY_FILE = 'la_jolla_bathymetry_data.csv'
+OVERLAY_MODES = ('tiles', 'inline')
+# Kept in sync with logprocessor.shards
+SHARD_WINDOWS = ('hour', 'day')
+
+
+def run_resample(args):
+    from logprocessor.resample import resample_gps_logs
+
+    written = resample_gps_logs(args.boat_file, args.buoy_file, output_dir=args.log_dir, step=args.step,
+                                max_gap=args.max_gap, start=args.start, end=args.end, clean=not args.no_clean)
+    print(f"Resampled from {written['start']}: {written['boat']} boat and {written['buoy']} buoy fixes "
+          f"written to {args.log_dir}")
+
+
+def run_ingest(args):
+    from logprocessor.ingest import ingest_logs
+
+    if not os.path.isdir(args.pi_log_dir):
+        logger.info(f"No raw pi logs in {args.pi_log_dir}; skipping ingest.")
+        return
+    ingest_logs(args.pi_log_dir, args.ranges, workers=args.workers, follow=args.follow)
+
+
+def run_clock(args, dataset, clock_fit, comparison):
+    print(f"boat:  scale {clock_fit.boat_scale:.6f}  offset {clock_fit.boat_offset:+.3f} s")
+    print(f"buoy:  scale {clock_fit.buoy_scale:.6f}  offset {clock_fit.buoy_offset:+.3f} s")
+    print(f"median residual {clock_fit.residual:.2f} m over {clock_fit.pings} pings, quality {clock_fit.quality:.2f}")
+
+
+def run_stats(args, dataset, clock_fit, comparison):
+    from logprocessor.stats import RangeErrorAggregate, aggregate_range_errors, load_stats, save_stats
+
+    depths = None
+    if args.bathymetry:
+        from logprocessor.bathymetry import load_bathymetry, ping_depths
+
+        index = load_bathymetry(args.bathymetry, use_cache=not args.no_cache)
+        depths = ping_depths(index, comparison.aligned).mean()
+    aggregate = aggregate_range_errors(dataset, comparison, RangeErrorAggregate(
+        args.window, args.band, depth_band_meters=args.depth_band), depths)
+    for file_path in args.merge:
+        aggregate.merge(load_stats(file_path))
+    save_stats(aggregate, args.stats_file)
+    logger.info(f"Saved range error statistics to '{args.stats_file}'.")
+
+    summary = aggregate.summary()
+    depth_bands = [(f'{name} deep', stats) for name, stats in summary['depths'].items()]
+    for name, stats in [('total', summary['total'])] + list(summary['bands'].items()) + depth_bands:
+        if not stats['successes']:
+            print(f"{name:>12}  {stats['pings']:7d} pings, none successful")
+            continue
+        print(f"{name:>12}  {stats['pings']:7d} pings  success {100 * stats['success_rate']:5.1f}%  "
+              f"bias {stats['bias']:7.2f} m  MAE {stats['mae']:6.2f} m  RMSE {stats['rmse']:6.2f} m  "
+              f"P95 {stats['p95_absolute_error']:6.2f} m")
+
+
+def run_map(args, dataset, clock_fit, comparison):
+    from logprocessor.site import build_map
+
+    os.makedirs(os.path.dirname(args.map_file) or '.', exist_ok=True)
+    build_map(dataset, comparison, tiff_file=args.tiff, map_file=args.map_file,
+              render_mode=args.render_mode, track_tolerance=args.track_tolerance, overlay=args.overlay)
+
+
+def run_shards(args, dataset, clock_fit, comparison):
+    from logprocessor.query import DeploymentIndex
+    from logprocessor.shards import build_shards
+
+    result = build_shards(DeploymentIndex(dataset, comparison, clock_fit), site_dir=args.site_dir,
+                          window=args.window, tiff_file=args.tiff, render_mode=args.render_mode,
+                          track_tolerance=args.track_tolerance, workers=args.workers)
+    print(f"{len(result['rendered'])} of {len(result['shards'])} {args.window} shards rendered into {args.site_dir}")
+
+
+def saved_clock(args, dataset):
+    """``(clock_fit, comparison)`` under the fit saved in ``args.clock_fit``, fitted and saved there if missing.
+
+    Reusing one fit keeps every ping and fix where it was, so ``shards`` only
+    redraws the windows that received data; ``--refit`` replaces the fit.
+    """
+    from logprocessor.analysis import compare_ranges
+    from logprocessor.clock import load_clock_fit, save_clock_fit
+
+    if os.path.exists(args.clock_fit) and not args.refit:
+        clock_fit = load_clock_fit(args.clock_fit)
+        logger.info(f"Using the clock fit saved in {args.clock_fit}.")
+        return clock_fit, compare_ranges(dataset, clock_fit.boat_scale, clock_fit.buoy_scale,
+                                         clock_fit.boat_offset, clock_fit.buoy_offset)
+    clock_fit, comparison = compare_fitted(dataset)
+    save_clock_fit(clock_fit, args.clock_fit)
+    logger.info(f"Saved the clock fit to {args.clock_fit}.")
+    return clock_fit, comparison
+
+
+def run_plot(args, dataset, clock_fit, comparison):
+    from logprocessor.plots import plot_boat_buoy_distances
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    plot_boat_buoy_distances(dataset, comparison, output_dir=args.output_dir)
+
+
+def run_errors(args, dataset, clock_fit, comparison):
+    from logprocessor.plots import plot_range_errors
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    plot_range_errors(dataset, comparison, output_dir=args.output_dir)
+
+
+def run_build(args):
+    from logprocessor.build import STATE_FILE_NAME, build, pipeline_stages
+
+    map_options = {'render_mode': args.render_mode, 'track_tolerance': args.track_tolerance, 'overlay': args.overlay}
+    load_options = {'use_cache': not args.no_cache, 'clean': not args.no_clean, 'filter_ranges': args.filter_ranges,
+                    'pair': tuple(args.pair)}
+    stages = pipeline_stages(args.log_dir, ranges_file=args.ranges, pi_log_dir=args.pi_log_dir, map_file=args.map_file,
+                             tiff_file=args.tiff, plot_dir=args.output_dir, plots=args.plots,
+                             stats_file=args.stats_file, map_options=map_options, load_options=load_options)
+    state_file = args.state_file or os.path.join(os.path.dirname(args.map_file) or '.', STATE_FILE_NAME)
+    actions = build(stages, state_file, force=args.force)
+    for name, action in actions.items():
+        print(f"{name:>8}  {action}")
+
+
+def run_batch(args):
+    from logprocessor.batch import run_batch as process_deployments
+
+    summary = process_deployments(args.root, args.output_dir, workers=args.workers, tiff_file=args.tiff,
+                                  render_mode=args.render_mode, track_tolerance=args.track_tolerance,
+                                  use_cache=not args.no_cache, clean=not args.no_clean,
+                                  filter_ranges=args.filter_ranges, pair=tuple(args.pair))
+    for name, result in summary['deployments'].items():
+        if 'error' in result:
+            print(f"{name}: FAILED {result['error']}")
+        else:
+            stats = result['stats']
+            rmse = '-' if stats['rmse'] is None else f"{stats['rmse']:.2f} m"
+            print(f"{name}: {stats['pings']} pings, success {stats['success_rate'] or 0:.1%}, RMSE {rmse}, "
+                  f"clock quality {result['clock']['quality']:.2f}")
+
+
+def run_live(args):
+    import asyncio
+
+    from logprocessor.live import follow
+
+    try:
+        asyncio.run(follow(args.log_dir, pi_log_dir=args.pi_log_dir, host=args.host, port=args.port,
+                           poll_interval=args.poll_interval, boat_scale=args.boat_scale, buoy_scale=args.buoy_scale,
+                           boat_offset=args.boat_offset, buoy_offset=args.buoy_offset, pair=tuple(args.pair),
+                           ranges_file=args.ranges))
+    except KeyboardInterrupt:
+        logger.info("Live mode stopped.")
+
+
+DATASET_COMMANDS = {
+    'clock': run_clock,
+    'stats': run_stats,
+    'map': run_map,
+    'shards': run_shards,
+    'plot': run_plot,
+    'errors': run_errors,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='logprocessor', description="Process pi modem range logs and GPS tracks.")
+    parser.add_argument('--log-dir', default='./logs', help="directory with the resampled GPS files and pi_runs.json")
+    parser.add_argument('--log-file', default='logprocessor.log', help="loguru log file")
+    parser.add_argument('--no-cache', action='store_true', help="parse the JSON datasets instead of using the columnar cache")
+    parser.add_argument('--no-clean', action='store_true',
+                        help="keep invalid, duplicate and outlying GPS fixes instead of dropping them")
+    parser.add_argument('--filter-ranges', action='store_true',
+                        help="drop modem ranges that a Hampel filter flags as outliers")
+    parser.add_argument('--pair', type=int, nargs=2, default=[0, 1], metavar=('SOURCE', 'DESTINATION'),
+                        help="modem nodes whose ranges are compared with the boat and buoy tracks")
+    parser.add_argument('--metrics', help="append structured stage timings and the run summary as JSON lines")
+    parser.add_argument('--profile', choices=PROFILERS, help="profile the run")
+    parser.add_argument('--profile-output', help="profile file (default: logprocessor-<command>.prof or .html)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, help_text):
+        subparser = subparsers.add_parser(name, help=help_text)
+        if name == 'resample':
+            subparser.add_argument('boat_file', help="raw phone GPS log (CSV or JSON lines)")
+            subparser.add_argument('buoy_file', help="raw buoy GPS log (CSV or JSON lines)")
+            subparser.add_argument('--step', type=float, default=1.0, help="seconds between resampled fixes")
+            subparser.add_argument('--max-gap', type=float, default=10.0,
+                                   help="seconds between raw fixes beyond which resampled fixes are left empty")
+            subparser.add_argument('--start', help="start of the window to resample (ISO 8601, UTC by default)")
+            subparser.add_argument('--end', help="end of the window to resample")
+            return subparser
+        if name == 'batch':
+            subparser.add_argument('root', help="directory searched for deployment directories")
+            subparser.add_argument('--output-dir', default='./batch', help="per-deployment outputs and summary.json")
+            subparser.add_argument('--tiff', help="bathymetry overlay image shared by every map (default: none)")
+            subparser.add_argument('--workers', type=int, help="deployments processed at once (default: one per CPU)")
+        else:
+            subparser.add_argument('--ranges', help="range dataset (default: <log-dir>/pi_runs.json)")
+        if name in ('ingest', 'all', 'build', 'live'):
+            subparser.add_argument('--pi-log-dir', help="raw pi modem logs (default: <log-dir>/pi_runs)")
+        if name in ('ingest', 'all'):
+            subparser.add_argument('--workers', type=int, help="parser processes (default: one per CPU)")
+            subparser.add_argument('--follow', action='store_true',
+                                   help="the logs are still being written: leave an unterminated last line "
+                                        "until a later run finds the file unchanged")
+        if name == 'shards':
+            subparser.add_argument('--window', choices=SHARD_WINDOWS, default='hour', help="time span of each map")
+            subparser.add_argument('--site-dir', default='./site/shards',
+                                   help="directory for the shard pages and their index")
+            subparser.add_argument('--tiff', default='./site/bethymetry.tiff', help="bathymetry overlay image")
+            subparser.add_argument('--workers', type=int, help="shards rendered at once (default: one per CPU)")
+            subparser.add_argument('--clock-fit', help="clock fit to reuse, as saved by 'build'; fitted and saved "
+                                                       "there if missing (default: <log-dir>/clock_fit.json)")
+            subparser.add_argument('--refit', action='store_true', help="refit the clocks and replace the saved fit")
+        if name == 'stats':
+            subparser.add_argument('--stats-file', help="JSON output (default: <log-dir>/range_error_stats.json)")
+            subparser.add_argument('--merge', nargs='*', default=[], metavar='STATS_FILE',
+                                   help="statistics of other runs or deployments to merge into the output")
+            subparser.add_argument('--window', type=int, default=600, help="seconds per time window")
+            subparser.add_argument('--band', type=float, default=50.0, help="meters per distance band")
+            subparser.add_argument('--bathymetry', help="bathymetry CSV export; also break the errors and failures "
+                                                        "down by water depth (default: <log-dir>/"
+                                                        "la_jolla_bathymetry_data.csv if present)")
+            subparser.add_argument('--depth-band', type=float, default=10.0, help="meters per water depth band")
+        if name in ('map', 'all', 'build'):
+            subparser.add_argument('--tiff', default='./site/bethymetry.tiff', help="bathymetry overlay image")
+            subparser.add_argument('--map-file', default='./site/index.html')
+            subparser.add_argument('--overlay', choices=OVERLAY_MODES, default='tiles',
+                                   help="serve the bathymetry as cached tiles next to the map or embed it inline")
+        if name in ('map', 'shards', 'all', 'build', 'batch'):
+            subparser.add_argument('--render-mode', choices=RENDER_MODES, default='fast',
+                                   help="'fast' clusters pings and draws tracks as lines; 'markers' draws every fix")
+            subparser.add_argument('--track-tolerance', type=float, default=1.0,
+                                   help="meters the drawn tracks may deviate from the GPS fixes (0 keeps every fix)")
+        if name in ('plot', 'errors', 'all', 'build'):
+            subparser.add_argument('--output-dir', default='.', help="directory for the PNG plots")
+        if name == 'build':
+            subparser.add_argument('--plots', nargs='*', choices=PLOT_SETS, default=list(PLOT_SETS),
+                                   help="plot sets to draw, as by the subcommands of the same name")
+            subparser.add_argument('--stats-file', help="also save range error statistics to this file")
+            subparser.add_argument('--state-file',
+                                   help="keys of the last build (default: .build.json next to the map file)")
+            subparser.add_argument('--force', action='store_true', help="redo every stage")
+        if name == 'live':
+            subparser.add_argument('--host', default='127.0.0.1', help="address the live map is served on")
+            subparser.add_argument('--port', type=int, default=8765)
+            subparser.add_argument('--poll-interval', type=float, default=0.5,
+                                   help="seconds between checks of the followed files for new lines")
+            for stream in ('boat', 'buoy'):
+                subparser.add_argument(f'--{stream}-scale', type=float, default=1.0,
+                                       help=f"{stream} GPS clock scale, e.g. from 'logprocessor clock' on an earlier run")
+                subparser.add_argument(f'--{stream}-offset', type=float, default=0.0,
+                                       help=f"{stream} GPS clock offset in seconds")
+        return subparser
+
+    add_command('resample', "resample raw boat and buoy GPS logs into <log-dir>/resampled_*_gps_data.json")
+    add_command('ingest', "parse new raw pi log data into the range dataset")
+    add_command('clock', "fit and print the GPS clock scales and offsets")
+    add_command('stats', "summarize the range error overall, per time window and per distance band")
+    add_command('map', "render the folium map")
+    add_command('shards', "render one map per hour or day, and an index page, redrawing only windows that changed")
+    add_command('plot', "plot boat, modem and calculated distances over time")
+    add_command('errors', "plot range errors against GPS-derived distances")
+    add_command('all', "ingest, then render the map and every plot")
+    add_command('build', "like 'all', but only redo the stages whose inputs, settings or code changed")
+    add_command('batch', "process every deployment directory under a root in parallel")
+    add_command('live', "follow the growing logs and serve a live map of new pings")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logger.add(args.log_file, format="{time} {level} {message}", level="INFO")
+    with run(f'logprocessor-{args.command}', metrics_file=args.metrics, profile=args.profile,
+             profile_output=args.profile_output):
+        run_command(args)
+
+
+def run_command(args):
+    if args.command == 'batch':
+        run_batch(args)
+        return
+    if args.command == 'resample':
+        run_resample(args)
+        return
+    args.ranges = args.ranges or os.path.join(args.log_dir, RANGES_FILE)
+    if args.command == 'stats':
+        args.stats_file = args.stats_file or os.path.join(args.log_dir, STATS_FILE)
+        default_bathymetry = os.path.join(args.log_dir, BATHYMETRY_FILE)
+        args.bathymetry = args.bathymetry or (default_bathymetry if os.path.exists(default_bathymetry) else None)
+    if args.command == 'shards':
+        args.clock_fit = args.clock_fit or os.path.join(args.log_dir, CLOCK_FILE)
+
+    if args.command in ('ingest', 'all', 'build', 'live'):
+        args.pi_log_dir = args.pi_log_dir or os.path.join(args.log_dir, 'pi_runs')
+    if args.command == 'live':
+        run_live(args)
+        return
+    if args.command == 'build':
+        run_build(args)
+        return
+    if args.command in ('ingest', 'all'):
+        run_ingest(args)
+    if args.command == 'ingest':
+        return
+
+    dataset = load_dataset(args.log_dir, ranges_file=args.ranges, use_cache=not args.no_cache,
+                           clean=not args.no_clean, filter_ranges=args.filter_ranges, pair=tuple(args.pair))
+    if args.command == 'shards':
+        clock_fit, comparison = saved_clock(args, dataset)
+    else:
+        clock_fit, comparison = compare_fitted(dataset)
+    if args.command == 'all':
+        commands = [command for name, command in DATASET_COMMANDS.items() if name not in ('clock', 'stats', 'shards')]
+    else:
+        commands = [DATASET_COMMANDS[args.command]]
+    for command in commands:
+        command(args, dataset, clock_fit, comparison)
+
+
+if __name__ == '__main__':
+    main()
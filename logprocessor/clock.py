@@ -0,0 +1,194 @@
+"""Estimation of the clock scale and offset of each GPS stream against the modem log.
+
+Modem seconds are mapped onto each GPS clock as ``seconds * scale + offset``.
+The four parameters are found by minimizing the mean absolute difference
+between the modem ``distance`` and the GPS-derived boat-buoy distance over all
+successful pings, each difference capped at ``max_residual`` so that modem
+outliers cannot dominate and a ping left outside a track costs as much as the
+worst fit: a coarse joint grid over both scales, then alternating (scale,
+offset) grids per stream that shrink around the best point. Candidates within
+``tolerance`` meters of the best are tied, and the tie goes to the one nearest
+scale 1 and offset 0. Every grid is evaluated in one vectorized pass per
+chunk of candidates, using the ENU distance on an evenly spaced subset of at
+most ``search_pings`` pings; the final residual and quality are computed over
+every ping with Vincenty.
+"""
+import json
+from collections import namedtuple
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.alignment import interpolate_track
+from logprocessor.analysis import compare_ranges
+from logprocessor.geodesy import geodesic_distance
+from logprocessor.instrumentation import timed
+
+ClockFit = namedtuple('ClockFit', ['boat_scale', 'boat_offset', 'buoy_scale', 'buoy_offset',
+                                   'residual', 'quality', 'pings'])
+
+CLOCK_FILE = 'clock_fit.json'
+
+# Upper bound on candidate-by-ping elements evaluated at once, to bound memory
+CHUNK_ELEMENTS = 2_000_000
+
+
+def _positions(track, seconds, scales, offsets):
+    """Track positions for every (scale, offset) candidate, shaped ``(candidates, pings)``."""
+    query_times = seconds[None, :] * np.asarray(scales)[:, None] + np.asarray(offsets)[:, None]
+    return interpolate_track(track, query_times)
+
+
+def _costs(modem, boat, buoy, max_residual):
+    """Mean absolute range residual per candidate, each residual capped at ``max_residual``.
+
+    Pings the candidate maps outside either track cost ``max_residual``, so a
+    candidate cannot win by dropping the pings it fits badly.
+    """
+    calculated = geodesic_distance(boat[0], boat[1], buoy[0], buoy[1], method='enu')
+    # fmin also replaces the NaN residuals of unaligned pings
+    return np.fmin(np.abs(modem - calculated), max_residual).mean(axis=-1)
+
+
+def _preferred(costs, shifts, tolerance):
+    """Index of the smallest of ``shifts`` among the candidates within ``tolerance`` of the lowest cost."""
+    tied = np.flatnonzero(costs <= np.min(costs) + tolerance)
+    return int(tied[np.argmin(shifts[tied])])
+
+
+def _search(track, other, seconds, modem, scales, offsets, max_residual, tolerance):
+    """Best (scale, offset) of ``track`` among the candidates with the other stream's positions fixed."""
+    chunk = max(1, CHUNK_ELEMENTS // len(seconds))
+    costs = np.concatenate([
+        _costs(modem, _positions(track, seconds, scales[start:start + chunk], offsets[start:start + chunk]), other,
+               max_residual)
+        for start in range(0, len(scales), chunk)])
+    index = _preferred(costs, _clock_shift(scales, offsets, seconds), tolerance)
+    return costs[index], (scales[index], offsets[index])
+
+
+def _clock_shift(scales, offsets, seconds):
+    """Largest seconds by which a (scale, offset) candidate moves a ping away from the modem clock."""
+    return np.maximum(np.abs((np.asarray(scales) - 1) * seconds[0] + offsets),
+                      np.abs((np.asarray(scales) - 1) * seconds[-1] + offsets))
+
+
+def _movement(track, seconds, scale, offset):
+    """95th percentile distance in meters of the track's fixes over the pings' span from their median position."""
+    fixes = track.between(*sorted((seconds[0] * scale + offset, seconds[-1] * scale + offset)))
+    if not len(fixes):
+        return 0.0
+    spread = geodesic_distance(fixes.latitudes, fixes.longitudes, np.median(fixes.latitudes),
+                               np.median(fixes.longitudes), method='enu')
+    return float(np.percentile(spread, 95))
+
+
+def _grid(center, half_width, bounds, size):
+    low, high = max(center - half_width, bounds[0]), min(center + half_width, bounds[1])
+    return np.linspace(low, high, size)
+
+
+def _with_identity(grid, value, bounds):
+    """``grid`` plus the identity clock's ``value`` if it is within ``bounds``, so a tie can go to it."""
+    if bounds[0] <= value <= bounds[1]:
+        return np.union1d(grid, [value])
+    return grid
+
+
+@timed('clock')
+def compare_fitted(dataset, scale_bounds=(0.5, 3.0), offset_bounds=None, grid_size=25, iterations=6,
+                   inlier_threshold=10.0, search_pings=2000, max_residual=100.0, tolerance=0.05):
+    """Fit the scale and offset mapping modem seconds onto the boat and buoy GPS clocks.
+
+    Returns ``(clock_fit, comparison)`` with the ``RangeComparison`` under the
+    fitted clocks. ``offset_bounds`` defaults to +/-10% of the longer GPS track. ``residual``
+    is the median absolute range error of the aligned pings under the fit and
+    ``quality`` the fraction of all successful pings that align to within
+    ``inlier_threshold`` meters of the modem distance, halved for each stream
+    whose fixes stay within ``inlier_threshold`` meters of one spot (such as
+    an anchored buoy): the ranges cannot pin down the clock of a stream that
+    does not move.
+    """
+    successful = ~np.isnan(dataset.ranges.distances)
+    seconds = np.asarray(dataset.ranges.seconds_after_start, dtype=np.float64)[successful]
+    modem = np.asarray(dataset.ranges.distances, dtype=np.float64)[successful]
+    if len(seconds) == 0:
+        raise ValueError("Cannot fit the clocks without any successful range pings")
+    total_pings = len(seconds)
+    if total_pings > search_pings:
+        subset = np.linspace(0, total_pings - 1, search_pings).round().astype(np.intp)
+        seconds, modem = seconds[subset], modem[subset]
+    if offset_bounds is None:
+        span = max(np.ptp(dataset.boat_track.times), np.ptp(dataset.buoy_track.times))
+        offset_bounds = (-0.1 * span, 0.1 * span)
+
+    # Coarse joint search over both scales, offsets at zero
+    scales = _with_identity(np.linspace(*scale_bounds, grid_size), 1.0, scale_bounds)
+    zeros = np.zeros(len(scales))
+    boat = _positions(dataset.boat_track, seconds, scales, zeros)
+    buoy = _positions(dataset.buoy_track, seconds, scales, zeros)
+    costs = np.stack([_costs(modem, (boat[0][i], boat[1][i]), buoy, max_residual) for i in range(len(scales))])
+    if np.all(costs >= max_residual):
+        raise ValueError(f"No clock scale in {scale_bounds} aligns any successful ping within {max_residual} m")
+    shifts = _clock_shift(scales, zeros, seconds)
+    boat_index, buoy_index = np.unravel_index(
+        _preferred(costs.ravel(), np.add.outer(shifts, shifts).ravel(), tolerance), costs.shape)
+    fit = {'boat': [scales[boat_index], 0.0], 'buoy': [scales[buoy_index], 0.0]}
+
+    # Alternate per-stream (scale, offset) grids, shrinking around the current best
+    scale_width = (scale_bounds[1] - scale_bounds[0]) / 2
+    offset_width = (offset_bounds[1] - offset_bounds[0]) / 2
+    tracks = {'boat': dataset.boat_track, 'buoy': dataset.buoy_track}
+    cost = costs[boat_index, buoy_index]
+    for _ in range(iterations):
+        for stream, other in (('boat', 'buoy'), ('buoy', 'boat')):
+            scale, offset = fit[stream]
+            scale_grid, offset_grid = np.meshgrid(
+                _with_identity(_grid(scale, scale_width, scale_bounds, grid_size), 1.0, scale_bounds),
+                _with_identity(_grid(offset, offset_width, offset_bounds, grid_size), 0.0, offset_bounds))
+            other_positions = interpolate_track(tracks[other], seconds * fit[other][0] + fit[other][1])
+            candidate_cost, best = _search(tracks[stream], other_positions, seconds, modem,
+                                           scale_grid.ravel(), offset_grid.ravel(), max_residual, tolerance)
+            if candidate_cost <= cost + tolerance:
+                cost, fit[stream] = candidate_cost, list(best)
+        scale_width /= 4
+        offset_width /= 4
+
+    boat_scale, boat_offset = (float(value) for value in fit['boat'])
+    buoy_scale, buoy_offset = (float(value) for value in fit['buoy'])
+    comparison = compare_ranges(dataset, boat_scale, buoy_scale, boat_offset, buoy_offset)
+    residuals = np.abs(dataset.ranges.distances - comparison.calculated_distances)[comparison.successful]
+    quality = np.count_nonzero(residuals <= inlier_threshold) / total_pings
+    for stream, (scale, offset) in (('boat', (boat_scale, boat_offset)), ('buoy', (buoy_scale, buoy_offset))):
+        movement = _movement(tracks[stream], seconds, scale, offset)
+        if movement < inlier_threshold:
+            logger.warning(f"The {stream} stays within {movement:.1f} m, so its clock is not identifiable from "
+                           f"the ranges; halving the fit quality.")
+            quality /= 2
+    clock_fit = ClockFit(
+        boat_scale=boat_scale, boat_offset=boat_offset, buoy_scale=buoy_scale, buoy_offset=buoy_offset,
+        residual=float(np.median(residuals)) if len(residuals) else float('nan'),
+        quality=float(quality),
+        pings=int(len(residuals)),
+    )
+    logger.info(f"Fitted clocks: boat {boat_scale:.4f}x{boat_offset:+.1f} s, buoy {buoy_scale:.4f}x{buoy_offset:+.1f} s; "
+                f"median residual {clock_fit.residual:.2f} m, quality {clock_fit.quality:.2f} "
+                f"over {clock_fit.pings} pings.")
+    return clock_fit, comparison
+
+
+def fit_clock(dataset, **fit_options):
+    """``ClockFit`` of ``dataset``; see ``compare_fitted`` for the options."""
+    return compare_fitted(dataset, **fit_options)[0]
+
+
+def save_clock_fit(clock_fit, file_path):
+    """Save a ``ClockFit`` as JSON, e.g. to reuse it for ``compare_ranges`` without refitting."""
+    with open(file_path, 'w') as f:
+        json.dump(clock_fit._asdict(), f, indent=4)
+
+
+def load_clock_fit(file_path):
+    """``ClockFit`` saved by ``save_clock_fit``."""
+    with open(file_path, 'r') as f:
+        return ClockFit(**json.load(f))
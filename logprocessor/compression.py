@@ -0,0 +1,148 @@
+"""Transparent reading of gzip- and zstd-compressed logs and datasets.
+
+``open_stream`` opens a plain, gzip or zstd file for reading; compression is
+recognised by the file's magic bytes, whatever the file is called. Compressed
+files are decompressed chunk by chunk in a background thread that stays up to
+``QUEUE_CHUNKS`` chunks ahead of the reader, so decompression (zlib and
+zstandard release the GIL) overlaps with parsing and nothing is written to
+disk. The log parser's worker processes each get their own decompression
+thread. zstd needs the optional ``zstandard`` package.
+"""
+import gzip
+import io
+import os
+import queue
+import threading
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+CHUNK_SIZE = 1024 * 1024
+QUEUE_CHUNKS = 8
+
+
+def compression_of(file_path):
+    """``'gzip'``, ``'zstd'`` or None, from the first bytes of the file."""
+    with open(file_path, 'rb') as f:
+        head = f.read(len(ZSTD_MAGIC))
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def strip_compression_suffix(file_name):
+    """``file_name`` without a trailing ``.gz`` or ``.zst``."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+def find_compressed(file_path):
+    """``file_path`` if it exists, else its ``.gz`` or ``.zst`` variant if one does (else ``file_path``)."""
+    if os.path.exists(file_path):
+        return file_path
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(file_path + suffix):
+            return file_path + suffix
+    return file_path
+
+
+def _decompressing_reader(file_path, compression):
+    if compression == 'gzip':
+        # GzipFile reads every member of a concatenated archive
+        return gzip.open(file_path, 'rb')
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"Reading the zstd-compressed {file_path} needs the zstandard package "
+                          f"(pip install zstandard)") from None
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True, closefd=True)
+
+
+class _ThreadedReader(io.RawIOBase):
+    """Raw stream over the chunks a background thread reads ahead from ``source``."""
+
+    def __init__(self, source):
+        self._source = source
+        self._queue = queue.Queue(QUEUE_CHUNKS)
+        self._stop = threading.Event()
+        self._pending = memoryview(b'')
+        self._finished = False
+        self._thread = threading.Thread(target=self._fill, name='decompress', daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self._source.read(CHUNK_SIZE)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Give up once the reader is closed rather than block on a full queue forever
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            if self._finished:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._finished = True
+                raise item
+            if not item:
+                self._finished = True
+                return 0
+            self._pending = memoryview(item)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+def open_stream(file_path, mode='rb', offset=0, threaded=True, encoding='utf-8', newline=None):
+    """Open a plain or compressed file for reading in ``'rb'`` or ``'r'`` mode.
+
+    Reading starts ``offset`` bytes into the (decompressed) content; in a
+    compressed file everything before it is decompressed and skipped. With
+    ``threaded`` compressed content is decompressed in a background thread.
+    """
+    if mode not in ('r', 'rb'):
+        raise ValueError(f"open_stream only reads; unsupported mode {mode!r}")
+    compression = compression_of(file_path)
+    if compression is None:
+        stream = open(file_path, 'rb')
+        stream.seek(offset)
+    else:
+        source = _decompressing_reader(file_path, compression)
+        stream = io.BufferedReader(_ThreadedReader(source), CHUNK_SIZE) if threaded else source
+        while offset > 0:
+            skipped = len(stream.read(min(offset, CHUNK_SIZE)))
+            if not skipped:
+                break
+            offset -= skipped
+    if mode == 'rb':
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, newline=newline)
@@ -0,0 +1,45 @@
+"""Loading of one deployment's boat track, buoy track and range log.
+
+Each file may also be stored compressed, e.g. ``pi_runs.json.gz``.
+"""
+import os
+from collections import namedtuple
+
+from logprocessor.alignment import load_boat_track, load_buoy_track
+from logprocessor.compression import find_compressed
+from logprocessor.instrumentation import timed
+from logprocessor.parsing import DEFAULT_PAIR, load_range_log
+from logprocessor.validation import clean_track, filter_range_outliers
+
+Dataset = namedtuple('Dataset', ['boat_track', 'buoy_track', 'ranges'])
+
+BOAT_FILE = 'resampled_boat_gps_data.json'
+BUOY_FILE = 'resampled_buoy_gps_data.json'
+RANGES_FILE = 'pi_runs.json'
+
+
+@timed('load')
+def load_dataset(log_dir='./logs', ranges_file=None, use_cache=True, clean=True, filter_ranges=False,
+                 pair=DEFAULT_PAIR, cache_dir=None):
+    """Load the resampled GPS tracks and the boat-to-buoy range log of a deployment directory.
+
+    ``pair`` selects the ``(source, destination)`` modem nodes whose ranges
+    are compared with the two tracks.
+
+    With ``clean`` invalid, duplicate and outlying GPS fixes are dropped (see
+    ``logprocessor.validation``); with ``filter_ranges`` modem ranges flagged
+    by the Hampel filter are removed as well. ``cache_dir`` moves the
+    columnar cache out of the dataset directories.
+    """
+    boat_track = load_boat_track(find_compressed(os.path.join(log_dir, BOAT_FILE)), use_cache=use_cache,
+                                 cache_dir=cache_dir)
+    buoy_track = load_buoy_track(find_compressed(os.path.join(log_dir, BUOY_FILE)), use_cache=use_cache,
+                                 cache_dir=cache_dir)
+    ranges_file = find_compressed(ranges_file or os.path.join(log_dir, RANGES_FILE))
+    ranges = load_range_log(ranges_file, use_cache=use_cache, pair=pair, cache_dir=cache_dir)
+    if clean:
+        boat_track, _ = clean_track(boat_track, name='boat')
+        buoy_track, _ = clean_track(buoy_track, name='buoy')
+    if filter_ranges:
+        ranges, _ = filter_range_outliers(ranges)
+    return Dataset(boat_track, buoy_track, ranges)
@@ -0,0 +1,133 @@
+"""Track decimation before rendering.
+
+Points are projected onto a local east/north plane in meters, runs of fixes
+that stay within a radius of where they started are collapsed to their first
+fix, and the remaining polyline is simplified with Ramer-Douglas-Peucker so no
+dropped fix lies further than the tolerance from the rendered line. A
+pyramid of such tracks, one per Web Mercator zoom level with a tolerance of
+about a screen pixel, lets the map draw fewer points the further it zooms out.
+"""
+import numpy as np
+from loguru import logger
+
+from logprocessor.geodesy import meters_per_degree
+
+# Web Mercator ground resolution at the equator for zoom level 0, in meters per pixel
+EQUATOR_METERS_PER_PIXEL = 156543.03392804097
+
+
+def project_local(latitudes, longitudes):
+    """Project coordinates onto an east/north plane in meters around their mean latitude."""
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    if len(latitudes) == 0:
+        return np.empty(0), np.empty(0)
+    east_scale, north_scale = meters_per_degree(latitudes.mean())
+    east = (longitudes - longitudes[0]) * east_scale
+    north = (latitudes - latitudes[0]) * north_scale
+    return east, north
+
+
+def collapse_stationary(east, north, radius):
+    """Indices of fixes kept after collapsing each stationary run to its first fix.
+
+    A fix is dropped while it stays within ``radius`` meters of the last kept
+    fix; the final fix of the track is always kept.
+    """
+    n = len(east)
+    if n <= 2 or radius <= 0:
+        return np.arange(n)
+    keep = [0]
+    anchor_east, anchor_north = east[0], north[0]
+    radius_squared = radius * radius
+    for i, (x, y) in enumerate(zip(east.tolist(), north.tolist())):
+        if (x - anchor_east) ** 2 + (y - anchor_north) ** 2 > radius_squared:
+            keep.append(i)
+            anchor_east, anchor_north = x, y
+    if keep[-1] != n - 1:
+        keep.append(n - 1)
+    return np.asarray(keep)
+
+
+def _segment_distances(east, north, start, end):
+    """Distance of the points strictly between ``start`` and ``end`` to the segment joining them."""
+    x, y = east[start + 1:end], north[start + 1:end]
+    dx, dy = east[end] - east[start], north[end] - north[start]
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0:
+        return np.hypot(x - east[start], y - north[start])
+    t = np.clip(((x - east[start]) * dx + (y - north[start]) * dy) / length_squared, 0.0, 1.0)
+    return np.hypot(x - (east[start] + t * dx), y - (north[start] + t * dy))
+
+
+def simplify_rdp(east, north, tolerance):
+    """Indices kept by Ramer-Douglas-Peucker simplification with ``tolerance`` meters."""
+    n = len(east)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = _segment_distances(east, north, start, end)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def decimate_indices(latitudes, longitudes, tolerance, stationary_radius=None):
+    """Indices of the fixes to keep so the rendered track stays within ``tolerance`` meters.
+
+    A collapsed fix lies within ``stationary_radius`` of a fix that RDP then
+    approximates to within the rest of the budget, so the two share the
+    tolerance; ``stationary_radius`` defaults to half of it.
+    """
+    stationary_radius = tolerance / 2 if stationary_radius is None else min(stationary_radius, tolerance)
+    east, north = project_local(latitudes, longitudes)
+    kept = collapse_stationary(east, north, stationary_radius)
+    return kept[simplify_rdp(east[kept], north[kept], tolerance - stationary_radius)]
+
+
+def decimate_track(track, tolerance, stationary_radius=None, name='track'):
+    """Return a ``Track`` with only the fixes needed to draw it within ``tolerance`` meters."""
+    kept = decimate_indices(track.latitudes, track.longitudes, tolerance, stationary_radius)
+    removed = len(track.times) - len(kept)
+    logger.info(f"Decimated {name} to {len(kept)} of {len(track.times)} points "
+                f"({removed} removed, tolerance {tolerance:g} m).")
+    return track[kept]
+
+
+
+def zoom_tolerance(zoom, latitude, pixels=1.0):
+    """Ground distance in meters covered by ``pixels`` screen pixels at a Web Mercator zoom level."""
+    return pixels * EQUATOR_METERS_PER_PIXEL * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def decimation_pyramid(track, zoom_levels, pixels=1.0, min_tolerance=0.0, name='track'):
+    """Decimate a track once per zoom level with a tolerance of ``pixels`` screen pixels.
+
+    Returns ``{zoom: Track}``. Each coarser level is simplified from the next
+    finer one, so the whole pyramid costs little more than its finest level;
+    the accumulated error of a level stays below twice its own tolerance.
+    Levels whose tolerance is at most ``min_tolerance`` are ``track`` itself.
+    """
+    if len(track.times) == 0:
+        return {zoom: track for zoom in zoom_levels}
+    latitude = float(np.mean(track.latitudes))
+    pyramid = {}
+    level = track
+    for zoom in sorted(zoom_levels, reverse=True):
+        tolerance = zoom_tolerance(zoom, latitude, pixels)
+        if tolerance > min_tolerance:
+            decimated = decimate_track(level, tolerance, name=f"{name} zoom {zoom} level")
+            if len(decimated.times) < len(level.times):
+                level = decimated
+        pyramid[zoom] = level
+    return pyramid
@@ -0,0 +1,171 @@
+"""Incremental ingestion of pi modem logs using a per-file checkpoint manifest.
+
+The manifest records, for every source ``.log`` file, its size, mtime, the
+byte offset parsing reached, a fingerprint of the content before that
+offset and the node pair of the last range line before it, which failures
+after the offset are attributed to. A rerun only parses bytes appended since
+the last run (and new files) and appends the resulting entries to the
+existing range dataset. In ``follow`` mode, for logs that are still being
+written, a last line without a newline is left for a later run until the
+file stops changing. A file that
+shrank or whose already-parsed content changed forces a full rebuild, as
+does any change to a compressed log, whose offsets count decompressed bytes.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from loguru import logger
+
+from logprocessor.compression import compression_of
+from logprocessor.instrumentation import timed
+from logprocessor.parsing import (DEFAULT_PAIR, append_range_entries, find_log_files, merge_entries,
+                                  parse_log_chunks, write_range_entries)
+
+MANIFEST_VERSION = 1
+
+# Bytes hashed at the start of the file and just before the checkpoint offset
+FINGERPRINT_BLOCK = 64 * 1024
+
+
+def default_manifest_path(output_file):
+    return os.path.splitext(output_file)[0] + '_manifest.json'
+
+
+def file_fingerprint(file_path, offset):
+    """SHA-256 over the first and last ``FINGERPRINT_BLOCK`` bytes before ``offset``.
+
+    Hashing two bounded blocks detects rewritten or rotated logs without
+    rereading everything that was already parsed.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(min(offset, FINGERPRINT_BLOCK)))
+        if offset > FINGERPRINT_BLOCK:
+            tail_start = max(offset - FINGERPRINT_BLOCK, FINGERPRINT_BLOCK)
+            file.seek(tail_start)
+            digest.update(file.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError as e:
+        logger.warning(f"Ignoring unreadable manifest {manifest_file}: {e}")
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        logger.warning(f"Ignoring manifest {manifest_file} with unsupported version {manifest.get('version')}")
+        return None
+    return manifest
+
+
+def save_manifest(manifest, manifest_file):
+    temporary_file = manifest_file + '.tmp'
+    with open(temporary_file, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(temporary_file, manifest_file)
+
+
+def _is_unchanged_prefix(file_path, state, size):
+    if compression_of(file_path) is not None:
+        return False
+    return size >= state['offset'] and file_fingerprint(file_path, state['offset']) == state['hash']
+
+
+def _read_range_entries(output_file):
+    with open(output_file, 'r') as f:
+        return [(datetime.fromisoformat(entry['timestamp']), entry['distance'],
+                 entry.get('source', DEFAULT_PAIR[0]), entry.get('destination', DEFAULT_PAIR[1]))
+                for entry in json.load(f)]
+
+
+@timed('ingest')
+def ingest_logs(log_dir, output_file, manifest_file=None, workers=None, follow=False):
+    """Bring ``output_file`` up to date with the ``.log`` (or ``.log.gz``, ``.log.zst``) files in ``log_dir``.
+
+    With ``follow`` an unterminated last line is taken to be mid-write and is
+    only parsed once a later run finds the file's size and mtime unchanged.
+    Returns the number of new range entries ingested.
+    """
+    manifest_file = manifest_file or default_manifest_path(output_file)
+    manifest = load_manifest(manifest_file)
+    if manifest is not None and (manifest['output_file'] != output_file or not os.path.exists(output_file)):
+        logger.info(f"Range dataset {output_file} does not match manifest {manifest_file}; rebuilding.")
+        manifest = None
+
+    log_files = find_log_files(log_dir)
+    stats = {file_path: os.stat(file_path) for file_path in log_files}
+    known_files = manifest['files'] if manifest is not None else {}
+
+    rebuild = manifest is None or any(file_path not in stats for file_path in known_files)
+    to_parse = []
+    for file_path in log_files:
+        state = known_files.get(file_path)
+        stat = stats[file_path]
+        if state is None:
+            to_parse.append((file_path, 0, DEFAULT_PAIR, not follow))
+        elif stat.st_size == state['size'] and stat.st_mtime == state['mtime']:
+            if state['offset'] < stat.st_size:
+                # The held back last line stopped changing, so it is complete
+                to_parse.append((file_path, state['offset'], tuple(state.get('pair', DEFAULT_PAIR)), True))
+        elif _is_unchanged_prefix(file_path, state, stat.st_size):
+            to_parse.append((file_path, state['offset'], tuple(state.get('pair', DEFAULT_PAIR)), not follow))
+        else:
+            logger.info(f"{file_path} was rewritten since the last ingest; rebuilding.")
+            rebuild = True
+            break
+
+    if rebuild:
+        manifest = {'version': MANIFEST_VERSION, 'output_file': output_file,
+                    'start_time': None, 'last_timestamp': None, 'entry_count': 0, 'files': {}}
+        to_parse = [(file_path, 0, DEFAULT_PAIR, not follow) for file_path in log_files]
+
+    if not to_parse and not rebuild:
+        logger.info(f"No new log data since the last ingest of {output_file}.")
+        return 0
+
+    file_paths, offsets, pairs, finals = zip(*to_parse) if to_parse else ((),) * 4
+    results = parse_log_chunks(file_paths, offsets, final=finals, workers=workers, pairs=pairs)
+    new_entries = list(merge_entries(entries for entries, _, _ in results))
+
+    start_time = manifest['start_time'] and datetime.fromisoformat(manifest['start_time'])
+    last_timestamp = manifest['last_timestamp'] and datetime.fromisoformat(manifest['last_timestamp'])
+    if rebuild:
+        count = write_range_entries(new_entries, output_file)
+        start_time = new_entries[0][0] if new_entries else None
+    elif new_entries and (last_timestamp is None or new_entries[0][0] >= last_timestamp) \
+            and (start_time is None or new_entries[0][0] >= start_time):
+        start_time = start_time or new_entries[0][0]
+        count = append_range_entries(new_entries, output_file, start_time)
+    elif new_entries:
+        # New entries predate what was already written; merge them into place
+        logger.info(f"New entries predate the end of {output_file}; rewriting it in order.")
+        merged = list(merge_entries([_read_range_entries(output_file), new_entries]))
+        write_range_entries(merged, output_file)
+        start_time = merged[0][0]
+        count = len(new_entries)
+    else:
+        count = 0
+
+    if new_entries:
+        last_timestamp = max(last_timestamp or new_entries[-1][0], new_entries[-1][0])
+    manifest['start_time'] = start_time.isoformat() if start_time else None
+    manifest['last_timestamp'] = last_timestamp.isoformat() if last_timestamp else None
+    manifest['entry_count'] += count
+    for file_path, (_, end_offset, pair) in zip(file_paths, results):
+        stat = stats[file_path]
+        manifest['files'][file_path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'offset': end_offset,
+            'hash': file_fingerprint(file_path, end_offset),
+            'pair': list(pair),
+        }
+    save_manifest(manifest, manifest_file)
+    logger.info(f"Ingested {count} new range entries into {output_file} ({manifest['entry_count']} total).")
+    return count
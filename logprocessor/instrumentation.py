@@ -0,0 +1,183 @@
+"""Stage timers, counters, peak RSS and optional profiling, reported through loguru.
+
+Library functions are wrapped with ``timed`` and bump ``count`` as they go, so
+every entry point is instrumented without changes to the scripts. Each
+finished stage and the end-of-run summary are logged as records carrying a
+``metric`` extra field; ``enable_metrics`` (or ``LOGPROCESSOR_METRICS``) adds
+a sink that writes just those records as JSON lines. ``run`` wraps a whole
+script or command: it reads the environment, starts the requested profiler
+and logs the summary when the run ends.
+
+Environment variables:
+
+``LOGPROCESSOR_METRICS``
+    JSON-lines file the structured records are appended to.
+``LOGPROCESSOR_PROFILE``
+    ``cprofile`` or ``pyinstrument`` to profile the run.
+``LOGPROCESSOR_PROFILE_OUTPUT``
+    Where the profile is written (default: ``<run name>.prof`` or ``.html``).
+"""
+import functools
+import os
+import resource
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from loguru import logger
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+_counters = Counter()
+_timings = defaultdict(lambda: [0, 0.0])  # stage: [calls, seconds]
+_metrics_sinks = {}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def count(name, amount=1):
+    """Add ``amount`` to the counter ``name``."""
+    if amount:
+        _counters[name] += amount
+
+
+def merge_counts(counts):
+    """Add counters reported by a worker process."""
+    _counters.update(counts)
+
+
+def call_counted(function, *args):
+    """Call ``function`` and return ``(result, counters it added)``.
+
+    Used as the target of worker processes, whose counters would otherwise
+    be lost; the parent passes the counters to ``merge_counts``.
+    """
+    before = Counter(_counters)
+    result = function(*args)
+    return result, dict(_counters - before)
+
+
+class timed:
+    """Time a stage, as a context manager (``with timed('load'):``) or decorator (``@timed('load')``)."""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._start
+        timing = _timings[self.stage]
+        timing[0] += 1
+        timing[1] += seconds
+        logger.bind(metric='stage', stage=self.stage, seconds=round(seconds, 6), peak_rss_mb=round(peak_rss_mb(), 1)) \
+            .info(f"Stage {self.stage} took {seconds:.3f} s.")
+        return False
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def summary():
+    """Timings, counters and peak RSS accumulated so far, as a plain dict."""
+    return {
+        'stages': {stage: {'calls': calls, 'seconds': round(seconds, 6)}
+                   for stage, (calls, seconds) in sorted(_timings.items(), key=lambda item: -item[1][1])},
+        'counters': dict(sorted(_counters.items())),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def log_summary(name='run', wall_seconds=None):
+    """Log the end-of-run summary, one line per stage and counter plus a structured record."""
+    report = summary()
+    if wall_seconds is not None:
+        report['wall_seconds'] = round(wall_seconds, 6)
+    lines = [f"{stage:<24} {timing['seconds']:10.3f} s  x{timing['calls']}" for stage, timing in report['stages'].items()]
+    lines += [f"{counter:<24} {value:12d}" for counter, value in report['counters'].items()]
+    lines.append(f"{'peak RSS':<24} {report['peak_rss_mb']:10.1f} MiB")
+    if wall_seconds is not None:
+        lines.append(f"{'wall time':<24} {wall_seconds:10.3f} s")
+    logger.bind(metric='summary', run=name, **report).info(f"Run summary for {name}:\n" + '\n'.join(lines))
+    return report
+
+
+def reset():
+    _counters.clear()
+    _timings.clear()
+
+
+def enable_metrics(file_path):
+    """Append every stage and summary record to ``file_path`` as JSON lines."""
+    if file_path not in _metrics_sinks:
+        _metrics_sinks[file_path] = logger.add(file_path, serialize=True, level='DEBUG',
+                                               filter=lambda record: 'metric' in record['extra'])
+
+
+@contextmanager
+def _profiler(kind, output_file):
+    if kind == 'cprofile':
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(output_file)
+            pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+    elif kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("Profiling with pyinstrument requires the pyinstrument package") from None
+
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(output_file, 'w') as f:
+                f.write(profile.output_html())
+    else:
+        raise ValueError(f"Unknown profiler {kind!r}; expected one of {PROFILERS}")
+    logger.info(f"Saved {kind} profile to '{output_file}'.")
+
+
+@contextmanager
+def run(name, metrics_file=None, profile=None, profile_output=None):
+    """Instrument a whole run and log its summary at the end, even if it fails.
+
+    Arguments left as None fall back to the ``LOGPROCESSOR_*`` environment
+    variables described in the module docstring.
+    """
+    metrics_file = metrics_file or os.environ.get('LOGPROCESSOR_METRICS')
+    profile = profile or os.environ.get('LOGPROCESSOR_PROFILE')
+    if metrics_file:
+        enable_metrics(metrics_file)
+    start = time.perf_counter()
+    try:
+        if profile:
+            profile = profile.lower()
+            default_output = f"{name}.html" if profile == 'pyinstrument' else f"{name}.prof"
+            profile_output = profile_output or os.environ.get('LOGPROCESSOR_PROFILE_OUTPUT') or default_output
+            with _profiler(profile, profile_output):
+                yield
+        else:
+            yield
+    finally:
+        log_summary(name, time.perf_counter() - start)
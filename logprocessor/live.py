@@ -0,0 +1,385 @@
+"""Live follow mode for sea trials.
+
+Tails the growing pi modem logs and the boat/buoy GPS JSON-lines feeds,
+parses only newly completed lines, aligns each range ping as soon as both GPS
+tracks cover its time, keeps streaming range-error statistics, and pushes every
+update to a small locally served Leaflet page over Server-Sent Events. Nothing
+is regenerated on disk. Ping times are measured from the start time of the
+ingested range dataset, so a clock fit from an earlier run applies; without
+one, from the earliest range line of the logs being followed.
+"""
+import asyncio
+import json
+import math
+import os
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.alignment import BOAT_COLUMNS, BUOY_COLUMNS, interpolate_track
+from logprocessor.geodesy import geodesic_distance
+from logprocessor.parsing import DEFAULT_PAIR, PairTracker, load_range_matrix, parse_line
+from logprocessor.records import Fix, Ping, RangeLog, Track
+from logprocessor.stats import RangeErrorAggregate
+
+# Events replayed to a browser that connects after the session started
+HISTORY_LENGTH = 20000
+CLIENT_QUEUE_LENGTH = 10000
+
+
+async def follow_lines(file_path, offset=0, poll_interval=0.5):
+    """Yield complete lines appended to ``file_path`` from byte ``offset`` on, forever.
+
+    A file that shrinks is assumed to have been rotated and is read again
+    from the start.
+    """
+    while True:
+        try:
+            size = os.path.getsize(file_path)
+        except FileNotFoundError:
+            size = offset
+        if size < offset:
+            logger.info(f"{file_path} shrank; following it from the start.")
+            offset = 0
+        if size > offset:
+            data = await asyncio.to_thread(_read_range, file_path, offset, size)
+            end = data.rfind(b'\n')
+            if end >= 0:
+                offset += end + 1
+                for raw_line in data[:end + 1].splitlines():
+                    yield raw_line.decode('utf-8', errors='replace')
+        await asyncio.sleep(poll_interval)
+
+
+def _read_range(file_path, start, end):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+class LiveTrack:
+    """Append-only GPS track backed by NumPy arrays that grow by doubling."""
+
+    def __init__(self, capacity=4096):
+        self._columns = np.empty((3, capacity))
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, fix):
+        if self._size == self._columns.shape[1]:
+            grown = np.empty((3, 2 * self._size))
+            grown[:, :self._size] = self._columns[:, :self._size]
+            self._columns = grown
+        position = self._size
+        if position and fix.time < self._columns[0, position - 1]:
+            # Out-of-order fix; shift it into place so the times stay sorted
+            position = int(np.searchsorted(self._columns[0, :self._size], fix.time, side='right'))
+            self._columns[:, position + 1:self._size + 1] = self._columns[:, position:self._size]
+        self._columns[:, position] = (fix.time, fix.latitude, fix.longitude)
+        self._size += 1
+
+    @property
+    def last_time(self):
+        return self._columns[0, self._size - 1] if self._size else -math.inf
+
+    def view(self):
+        return Track(*self._columns[:, :self._size])
+
+
+class LiveSession:
+    """State shared by the file followers and the event stream."""
+
+    def __init__(self, boat_scale=1.0, buoy_scale=1.0, boat_offset=0.0, buoy_offset=0.0, pair=DEFAULT_PAIR,
+                 start_time=None):
+        self.pair = pair
+        self.boat_clock = (boat_scale, boat_offset)
+        self.buoy_clock = (buoy_scale, buoy_offset)
+        self.boat_track = LiveTrack()
+        self.buoy_track = LiveTrack()
+        self.stats = RangeErrorAggregate()
+        self.start_time = start_time
+        self.pending = deque()
+        self.history = deque(maxlen=HISTORY_LENGTH)
+        self.clients = set()
+
+    def publish(self, event):
+        self.history.append(event)
+        for queue in self.clients:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    def add_gps_line(self, line, track, columns, kind):
+        try:
+            entry = json.loads(line)
+            time, latitude, longitude = (entry[key] for key in columns)
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.error(f"Skipping {kind} GPS line {line!r}: {e}")
+            return
+        if time is None or latitude is None or longitude is None:
+            return
+        try:
+            fix = Fix(time, latitude, longitude)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Skipping {kind} GPS line {line!r}: {e}")
+            return
+        track.append(fix)
+        self.publish({'type': kind, 'time': fix.time, 'lat': fix.latitude, 'lon': fix.longitude})
+        self.resolve_pending()
+
+    def add_log_line(self, line, pairs):
+        """Queue the ping of one modem log line; ``pairs`` is the ``PairTracker`` of the line's file."""
+        parsed = parse_line(line)
+        if parsed is None:
+            return
+        timestamp, distance, source, destination = pairs.resolve(parsed)
+        if self.start_time is None:
+            self.start_time = timestamp
+        if (source, destination) != self.pair:
+            return
+        seconds_after_start = (timestamp - self.start_time).total_seconds()
+        self.pending.append(Ping(timestamp, seconds_after_start, distance))
+        self.resolve_pending()
+
+    def resolve_pending(self):
+        """Align every queued ping whose time is now covered by both GPS tracks."""
+        ready = []
+        while self.pending:
+            seconds_after_start = self.pending[0].seconds_after_start
+            if (seconds_after_start * self.boat_clock[0] + self.boat_clock[1] > self.boat_track.last_time
+                    or seconds_after_start * self.buoy_clock[0] + self.buoy_clock[1] > self.buoy_track.last_time):
+                break
+            ready.append(self.pending.popleft())
+        if not ready:
+            return
+
+        ready = RangeLog.from_records(ready)
+        seconds = ready.seconds_after_start
+        boat_latitudes, boat_longitudes = interpolate_track(self.boat_track.view(),
+                                                            seconds * self.boat_clock[0] + self.boat_clock[1])
+        buoy_latitudes, buoy_longitudes = interpolate_track(self.buoy_track.view(),
+                                                            seconds * self.buoy_clock[0] + self.buoy_clock[1])
+        calculated_distances = geodesic_distance(boat_latitudes, boat_longitudes, buoy_latitudes, buoy_longitudes)
+        for ping, latitude, longitude, calculated_distance in zip(
+                ready, boat_latitudes, boat_longitudes, calculated_distances):
+            if math.isnan(calculated_distance):
+                continue  # Ping predates the start of a GPS track
+            self.publish({
+                'type': 'ping',
+                'timestamp': ping.timestamp.isoformat(),
+                'lat': latitude,
+                'lon': longitude,
+                'distance': ping.distance if ping.successful else None,
+                'calculated': round(float(calculated_distance), 2),
+            })
+        self.stats.add(ready.timestamps, ready.distances, calculated_distances)
+        self.publish(dict(type='stats', **self.stats.total.summary()))
+
+
+def dataset_start_time(ranges_file):
+    """Time ``seconds_after_start`` is measured from in ``ranges_file``, or None if there is no such dataset.
+
+    Read from the ingest manifest when there is one, else from the dataset itself.
+    """
+    from logprocessor.compression import find_compressed
+    from logprocessor.ingest import default_manifest_path, load_manifest
+
+    manifest = load_manifest(default_manifest_path(ranges_file))
+    if manifest is not None and manifest['start_time']:
+        return datetime.fromisoformat(manifest['start_time'])
+    ranges_file = find_compressed(ranges_file)
+    if not os.path.exists(ranges_file):
+        return None
+    ranges = load_range_matrix(ranges_file, use_cache=False)
+    if not len(ranges):
+        return None
+    return ranges.timestamps[0].astype(object) - timedelta(seconds=float(ranges.seconds_after_start[0]))
+
+
+def _first_timestamp(file_path):
+    with open(file_path, 'r', errors='replace') as f:
+        for line in f:
+            parsed = parse_line(line)
+            if parsed is not None:
+                return parsed[0]
+    return None
+
+
+async def _follow_gps(session, file_path, columns, kind, poll_interval):
+    async for line in follow_lines(file_path, poll_interval=poll_interval):
+        session.add_gps_line(line, getattr(session, f'{kind}_track'), columns, kind)
+
+
+async def _follow_log(session, file_path, poll_interval):
+    # Failures are attributed to the last range line of the same file
+    pairs = PairTracker()
+    async for line in follow_lines(file_path, poll_interval=poll_interval):
+        session.add_log_line(line, pairs)
+
+
+def _log_follower_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.opt(exception=task.exception()).error(f"Stopped following {task.get_name()}: {task.exception()}")
+
+
+async def _follow_log_dir(session, log_dir, poll_interval):
+    """Start a follower for every ``.log`` file, including ones created later."""
+    followed = set()
+    tasks = []
+    try:
+        while True:
+            if os.path.isdir(log_dir):
+                new_files = [os.path.join(log_dir, name) for name in sorted(os.listdir(log_dir))
+                             if name.endswith('.log') and os.path.join(log_dir, name) not in followed]
+                if session.start_time is None:
+                    # Measure from the earliest file, not from whichever follower reads a line first
+                    first_times = [time for time in map(_first_timestamp, new_files) if time is not None]
+                    if first_times:
+                        session.start_time = min(first_times)
+                        logger.info(f"Measuring ping times from the first range line at {session.start_time}.")
+                for file_path in new_files:
+                    logger.info(f"Following {file_path}")
+                    followed.add(file_path)
+                    task = asyncio.create_task(_follow_log(session, file_path, poll_interval), name=file_path)
+                    task.add_done_callback(_log_follower_failure)
+                    tasks.append(task)
+            await asyncio.sleep(max(poll_interval, 2.0))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>LogProcessor live</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>
+  html, body, #map { height: 100%; margin: 0; }
+  #stats { position: fixed; bottom: 30px; left: 30px; z-index: 1000; padding: 10px 15px; border-radius: 10px;
+           background: rgba(44, 44, 44, 0.6); color: #f0f0f0; font: 13px sans-serif; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+<div id="stats">Waiting for data&hellip;</div>
+<script>
+var map = L.map('map', {preferCanvas: true}).setView([32.9081, -117.3245], 13);
+L.tileLayer('http://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}', {attribution: 'Google', maxZoom: 22}).addTo(map);
+var tracks = {boat: L.polyline([], {color: '#cc0066'}).addTo(map), buoy: L.polyline([], {color: '#0000cc'}).addTo(map)};
+var centered = false;
+function fmt(value, digits) { return value === null ? '&ndash;' : value.toFixed(digits); }
+var source = new EventSource('/events');
+source.onmessage = function (message) {
+  var e = JSON.parse(message.data);
+  if (e.type === 'boat' || e.type === 'buoy') {
+    tracks[e.type].addLatLng([e.lat, e.lon]);
+    if (!centered) { map.setView([e.lat, e.lon], 16); centered = true; }
+  } else if (e.type === 'ping') {
+    var good = e.distance !== null;
+    L.circleMarker([e.lat, e.lon], {radius: 6, color: good ? 'green' : 'red', fillOpacity: 0.8})
+      .bindPopup('Timestamp: ' + e.timestamp + '<br>' + (good ? 'Modem Distance: ' + e.distance + ' meters<br>' : '')
+                 + 'Actual Distance: ' + e.calculated.toFixed(2) + ' meters')
+      .addTo(map);
+  } else if (e.type === 'stats') {
+    document.getElementById('stats').innerHTML =
+      'Pings: ' + e.pings + ' &nbsp; Success: ' + fmt(e.success_rate === null ? null : 100 * e.success_rate, 1) + '%<br>'
+      + 'Bias: ' + fmt(e.bias, 2) + ' m &nbsp; RMSE: ' + fmt(e.rmse, 2) + ' m &nbsp; P95: '
+      + fmt(e.p95_absolute_error, 2) + ' m';
+  }
+};
+</script>
+</body>
+</html>
+"""
+
+
+async def _serve_client(session, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode('latin-1')
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass  # Headers are not needed
+        parts = request_line.split()
+        path = parts[1] if len(parts) > 1 else '/'
+        if path == '/events':
+            await _stream_events(session, reader, writer)
+        elif path in ('/', '/index.html'):
+            body = _PAGE.encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n'
+                         + f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        else:
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _until_disconnected(reader):
+    try:
+        await reader.read()
+    except ConnectionError:
+        pass
+
+
+async def _stream_events(session, reader, writer):
+    """Send the history and then every new event to one client until it disconnects."""
+    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                 b'Connection: keep-alive\r\n\r\n')
+    queue = asyncio.Queue(maxsize=CLIENT_QUEUE_LENGTH)
+    for event in list(session.history):
+        writer.write(f"data: {json.dumps(event)}\n\n".encode())
+    session.clients.add(queue)
+    # The browser sends nothing after its request, so this read only returns once it disconnects
+    disconnected = asyncio.ensure_future(_until_disconnected(reader))
+    try:
+        await writer.drain()
+        while not writer.is_closing():
+            event = asyncio.ensure_future(queue.get())
+            await asyncio.wait([event, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                event.cancel()
+                break
+            writer.write(f"data: {json.dumps(event.result())}\n\n".encode())
+            await writer.drain()
+    except ConnectionResetError:
+        pass
+    finally:
+        disconnected.cancel()
+        session.clients.discard(queue)
+
+
+async def follow(log_dir='./logs', pi_log_dir=None, host='127.0.0.1', port=8765, poll_interval=0.5,
+                 boat_scale=1.0, buoy_scale=1.0, boat_offset=0.0, buoy_offset=0.0, pair=DEFAULT_PAIR,
+                 ranges_file=None):
+    """Follow a deployment's logs and serve the live map until cancelled.
+
+    The clock parameters map modem seconds onto the GPS clocks as in
+    ``align_pings``; take them from ``fit_clock`` on an earlier run. Only the
+    ranges from ``pair[0]`` to ``pair[1]`` are shown, timed from the start of
+    ``ranges_file`` (default: ``<log_dir>/pi_runs.json``) when it exists.
+    """
+    from logprocessor.dataset import BOAT_FILE, BUOY_FILE, RANGES_FILE
+
+    start_time = dataset_start_time(ranges_file or os.path.join(log_dir, RANGES_FILE))
+    if start_time is not None:
+        logger.info(f"Measuring ping times from the range dataset's start at {start_time}.")
+    session = LiveSession(boat_scale, buoy_scale, boat_offset, buoy_offset, pair=pair, start_time=start_time)
+    server = await asyncio.start_server(lambda reader, writer: _serve_client(session, reader, writer), host, port)
+    logger.info(f"Serving the live map on http://{host}:{port}/")
+    async with server:
+        await asyncio.gather(
+            server.serve_forever(),
+            _follow_gps(session, os.path.join(log_dir, BOAT_FILE), BOAT_COLUMNS, 'boat', poll_interval),
+            _follow_gps(session, os.path.join(log_dir, BUOY_FILE), BUOY_COLUMNS, 'buoy', poll_interval),
+            _follow_log_dir(session, pi_log_dir or os.path.join(log_dir, 'pi_runs'), poll_interval),
+        )
@@ -0,0 +1,274 @@
+"""Streaming, parallel parser for raw pi modem logs.
+
+Each ``.log`` file is parsed line by line in a worker process into a sorted
+list of ``(timestamp, distance, source, destination)`` entries; the per-file
+lists are then k-way merged into one timeline and written out entry by entry.
+Ranges between every pair of nodes are read in the same pass and loaded into
+a ``RangeMatrix``, from which each pair's ``RangeLog`` is sliced. Logs and
+range datasets may be gzip- or zstd-compressed (``.log.gz``, ``.log.zst``);
+they are decompressed while they are parsed.
+"""
+import heapq
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.cache import cached_columns
+from logprocessor.compression import compression_of, open_stream, strip_compression_suffix
+from logprocessor.instrumentation import call_counted, count, merge_counts, timed
+from logprocessor.records import RangeMatrix
+
+# Regex patterns to parse the log lines
+log_pattern = re.compile(r'(\w+ \d{1,2}, \d{4}) > (\d{2}:\d{2}:\d{2}) \| SER_IN \| Range (\d+) to (\d+) : ([\d\.]+) m')
+no_response_pattern = re.compile(r'(\w+ \d{1,2}, \d{4}) > (\d{2}:\d{2}:\d{2}) \| SER_IN \| Response Not Received')
+
+# The boat modem ranging the buoy modem, the pair the GPS tracks belong to
+DEFAULT_PAIR = (0, 1)
+
+# Month names as written by the pi logger ("%B"), independent of the current locale
+MONTHS = {name: number for number, name in enumerate(
+    ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+     'August', 'September', 'October', 'November', 'December'], start=1)}
+
+
+@lru_cache(maxsize=64)
+def _parse_date(date_str):
+    month, day, year = date_str.replace(',', '').split()
+    return int(year), MONTHS[month], int(day)
+
+
+def parse_timestamp(date_str, time_str):
+    """Parse ``"August 20, 2024"`` and ``"08:21:13"`` without going through ``strptime``."""
+    year, month, day = _parse_date(date_str)
+    return datetime(year, month, day, int(time_str[0:2]), int(time_str[3:5]), int(time_str[6:8]))
+
+
+def parse_line(line):
+    """Return ``(timestamp, distance, source, destination)`` for a range line, or None for any other line.
+
+    ``distance`` is None when the modem reported ``Response Not Received``;
+    such lines do not name the nodes, so ``source`` and ``destination`` are
+    None too and the caller attributes them (see ``PairTracker``).
+    """
+    # Nearly every line is something other than a serial response; skip it before any regex
+    if 'SER_IN' not in line:
+        return None
+    if 'Range' in line:
+        match = log_pattern.match(line)
+        if match:
+            date_str, time_str, source, destination, distance = match.groups()
+            return parse_timestamp(date_str, time_str), float(distance), int(source), int(destination)
+    elif 'Response Not Received' in line:
+        match = no_response_pattern.match(line)
+        if match:
+            date_str, time_str = match.groups()
+            return parse_timestamp(date_str, time_str), None, None, None
+    return None
+
+
+class PairTracker:
+    """Attributes ``Response Not Received`` lines to the pair of the last range line before them.
+
+    Until a log names a pair, failures are attributed to ``DEFAULT_PAIR``.
+    """
+
+    def __init__(self, pair=DEFAULT_PAIR):
+        self.pair = pair
+
+    def resolve(self, parsed):
+        timestamp, distance, source, destination = parsed
+        if source is None:
+            return (timestamp, distance) + self.pair
+        self.pair = (source, destination)
+        return parsed
+
+
+def parse_log_file(file_path, offset=0, final=True, pair=DEFAULT_PAIR):
+    """Parse one log file from byte ``offset`` into entries sorted by time.
+
+    Returns ``(entries, end_offset, pair)`` where ``entries`` is a list of
+    ``(timestamp, distance, source, destination)``, ``end_offset`` is the
+    byte position parsing stopped at and ``pair`` the node pair of the last
+    range line before it. Failures are attributed starting from ``pair``, so
+    resuming at ``end_offset`` with the returned pair attributes them as a
+    parse of the whole file would. Unless ``final`` is set, a trailing line without a newline is
+    assumed to be still being written and is left for the next call. Offsets
+    of compressed logs count decompressed bytes, and compressed logs, being
+    archives, are always read to the end.
+    """
+    entries = []
+    pairs = PairTracker(tuple(pair))
+    lines = misses = 0
+    final = final or compression_of(file_path) is not None
+    with open_stream(file_path, offset=offset) as file:
+        for raw_line in file:
+            if not final and not raw_line.endswith(b'\n'):
+                break
+            offset += len(raw_line)
+            lines += 1
+            line = raw_line.decode('utf-8', errors='replace')
+            parsed = parse_line(line)
+            if parsed is not None:
+                entries.append(pairs.resolve(parsed))
+            elif 'SER_IN' in line and 'Range' in line:
+                # A range response the pattern does not understand, not just other modem output
+                misses += 1
+    entries.sort(key=lambda entry: entry[0])
+    failures = sum(1 for entry in entries if entry[1] is None)
+    count('log_lines_read', lines)
+    count('log_regex_misses', misses)
+    count('range_entries', len(entries) - failures)
+    count('failed_ranges', failures)
+    return entries, offset, pairs.pair
+
+
+def find_log_files(log_dir):
+    """The ``.log`` files of ``log_dir``, including compressed ``.log.gz`` and ``.log.zst`` ones."""
+    return sorted(os.path.join(log_dir, name) for name in os.listdir(log_dir)
+                  if strip_compression_suffix(name).endswith('.log'))
+
+
+@timed('parse')
+def parse_log_chunks(file_paths, offsets=None, final=True, workers=None, pairs=None):
+    """Parse log files (from optional byte offsets and starting node pairs) across a process pool.
+
+    ``final`` is passed to ``parse_log_file``, either one value for every file
+    or one per file. Returns a list of ``(entries, end_offset, pair)`` in the
+    order of ``file_paths``.
+    """
+    file_paths = list(file_paths)
+    offsets = list(offsets) if offsets is not None else [0] * len(file_paths)
+    pairs = list(pairs) if pairs is not None else [DEFAULT_PAIR] * len(file_paths)
+    finals = [final] * len(file_paths) if isinstance(final, bool) else list(final)
+    if workers == 1 or len(file_paths) <= 1:
+        results = list(map(parse_log_file, file_paths, offsets, finals, pairs))
+    else:
+        # Spawned, not forked, as the build calls this from a worker thread
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = []
+            for result, counts in pool.map(call_counted, repeat(parse_log_file), file_paths, offsets, finals,
+                                           pairs):
+                results.append(result)
+                merge_counts(counts)
+    for file_path, (entries, _, _) in zip(file_paths, results):
+        logger.info(f"Parsed {len(entries)} range entries from {file_path}.")
+    return results
+
+
+def merge_entries(per_file_entries):
+    """K-way merge of per-file sorted entry lists into one sorted stream."""
+    return heapq.merge(*per_file_entries, key=lambda entry: entry[0])
+
+
+def parse_log_files(file_paths, workers=None):
+    """Parse log files across a process pool and merge them into one sorted stream."""
+    return merge_entries(entries for entries, _, _ in parse_log_chunks(file_paths, workers=workers))
+
+
+def format_range_entry(timestamp, distance, source, destination, start_time):
+    entry = {
+        "timestamp": timestamp.isoformat(),
+        "distance": distance,
+        "seconds_after_start": (timestamp - start_time).total_seconds(),
+        "source": source,
+        "destination": destination,
+    }
+    return '\n'.join('    ' + line for line in json.dumps(entry, indent=4).splitlines())
+
+
+def write_range_entries(entries, output_file, start_time=None):
+    """Stream sorted ``(timestamp, distance, source, destination)`` entries to the ``pi_runs.json`` layout.
+
+    ``seconds_after_start`` is measured from ``start_time``, or from the first
+    entry when it is not given. Returns the number of entries written.
+    """
+    count = 0
+    with open(output_file, 'w') as json_file:
+        json_file.write('[')
+        for timestamp, distance, source, destination in entries:
+            if start_time is None:
+                start_time = timestamp
+            json_file.write(',\n' if count else '\n')
+            json_file.write(format_range_entry(timestamp, distance, source, destination, start_time))
+            count += 1
+        json_file.write('\n]' if count else ']')
+    return count
+
+
+def append_range_entries(entries, output_file, start_time):
+    """Append sorted entries to a file written by ``write_range_entries``.
+
+    The caller guarantees every new entry is not earlier than the last one in
+    the file. Returns the number of entries appended.
+    """
+    with open(output_file, 'rb') as json_file:
+        json_file.seek(0, os.SEEK_END)
+        end = json_file.tell()
+        json_file.seek(max(end - 2, 0))
+        tail = json_file.read()
+    has_entries = tail == b'\n]'
+    if not has_entries and tail[-1:] != b']':
+        raise ValueError(f"{output_file} does not end with a JSON array")
+
+    count = 0
+    with open(output_file, 'r+b') as json_file:
+        json_file.truncate(end - (2 if has_entries else 1))
+        json_file.seek(0, os.SEEK_END)
+        for timestamp, distance, source, destination in entries:
+            separator = ',\n' if has_entries or count else '\n'
+            json_file.write((separator + format_range_entry(timestamp, distance, source, destination,
+                                                            start_time)).encode())
+            count += 1
+        json_file.write(b'\n]' if has_entries or count else b']')
+    return count
+
+
+def convert_logs(log_dir, output_file, workers=None):
+    """Parse every ``.log`` file in ``log_dir`` and write the merged range timeline."""
+    count = write_range_entries(parse_log_files(find_log_files(log_dir), workers=workers), output_file)
+    logger.info(f"Wrote {count} range entries to {output_file}.")
+    return count
+
+
+def _range_row(entry):
+    # Entries written before node pairs were parsed are all from the default pair
+    return (entry['timestamp'], entry['seconds_after_start'],
+            np.nan if entry['distance'] is None else entry['distance'],
+            entry.get('source', DEFAULT_PAIR[0]), entry.get('destination', DEFAULT_PAIR[1]))
+
+
+def _read_range_columns(file_path):
+    # Turn each entry into a row as soon as it is decoded so the dicts never pile up
+    with open_stream(file_path, 'r') as file:
+        rows = json.load(file, object_hook=_range_row)
+    return RangeMatrix.from_records(rows).columns()
+
+
+def load_range_matrix(file_path='./logs/pi_runs.json', use_cache=True, cache_dir=None):
+    """Load a ``pi_runs.json`` range dataset as a ``RangeMatrix`` of every node pair.
+
+    Failed ranges ("Response Not Received") have a NaN distance.
+    """
+    columns = (cached_columns(file_path, 'ranges', _read_range_columns, cache_dir) if use_cache
+               else _read_range_columns(file_path))
+    matrix = RangeMatrix(*(columns[name] for name, _ in RangeMatrix.COLUMNS))
+    pairs = ', '.join(f"{source}->{destination}: {requests}" for (source, destination), (requests, _) in
+                      matrix.counts().items())
+    logger.info(f"Loaded {len(matrix)} range request entries ({pairs or 'none'}).")
+    return matrix
+
+
+def load_range_log(file_path='./logs/pi_runs.json', use_cache=True, pair=DEFAULT_PAIR, cache_dir=None):
+    """Load the range requests of one node pair as a columnar ``RangeLog``."""
+    ranges = load_range_matrix(file_path, use_cache=use_cache, cache_dir=cache_dir).pair(*pair)
+    if not len(ranges):
+        logger.warning(f"No range requests from node {pair[0]} to node {pair[1]} in {file_path}.")
+    return ranges
@@ -0,0 +1,273 @@
+"""Matplotlib figures comparing modem ranges with GPS-derived distances.
+
+Figures are drawn with the object-oriented API on Agg canvases, never through
+pyplot, so nothing opens a window or blocks. Each figure is described by a
+``FigureSpec`` holding plain arrays; independent specs are rendered
+concurrently in worker processes. Every spec is keyed by a hash of its kind
+and data: identical figures are drawn once, and a figure whose key matches
+the one recorded for its file in the output directory is not redrawn at all.
+Time series denser than the figure's pixel columns are reduced with min/max
+decimation first, which leaves the drawn envelope unchanged.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.geodesy import geodesic_distance
+from logprocessor.instrumentation import timed
+
+FigureSpec = namedtuple('FigureSpec', ['output_file', 'kind', 'data'])
+
+DPI = 100
+# Bump when the drawing code changes so previously rendered figures are redrawn
+STYLE_VERSION = 1
+MANIFEST_NAME = '.plots.json'
+RANGE_ERROR_FILES = ('distance_comparison_plot.png', 'distance_comparison_with_error_plot.png',
+                     'error_vs_seconds_after_start_plot.png')
+BOAT_BUOY_DISTANCE_FILES = ('all_plots_with_boat_buoy_distances.png',)
+
+
+def minmax_decimate(x, y, columns):
+    """Reduce a series to the first, last, min and max point of each of ``columns`` bins along ``x``.
+
+    A line through the kept points covers the same pixels as the full series
+    when drawn ``columns`` pixels wide. NaN points are dropped and a series
+    that is not sorted by ``x`` is sorted before it is reduced.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    finite = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[finite], y[finite]
+    if len(x) <= 4 * columns:
+        return x, y
+    if np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+    span = x[-1] - x[0]
+    bins = np.zeros(len(x), dtype=np.intp) if span == 0 else np.minimum(((x - x[0]) / span * columns).astype(np.intp),
+                                                                         columns - 1)
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    ends = np.r_[starts[1:], len(x)] - 1
+    by_value = np.lexsort((y, bins))  # Sorted by bin, then by value within each bin
+    kept = np.unique(np.concatenate([starts, ends, by_value[starts], by_value[ends]]))
+    return x[kept], y[kept]
+
+
+def _columns(figure):
+    return int(figure.get_figwidth() * DPI)
+
+
+def _time_series(ax, x, y, fmt, **kwargs):
+    x, y = minmax_decimate(x, y, _columns(ax.figure))
+    ax.plot(x, y, fmt, **kwargs)
+
+
+def _finish(ax, xlabel, ylabel, title):
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True)
+
+
+def _draw_distance_scatter(ax, data):
+    original, calculated = data['original_distances'], data['calculated_distances']
+    ideal = [original.min(), original.max()] if len(original) else []
+    ax.scatter(original, calculated, color='blue', edgecolors='k', label='Distance Comparison', alpha=0.7,
+               rasterized=len(original) > 10000)
+    ax.plot(ideal, ideal, color='red', linestyle='--', label='Ideal Correlation')
+    _finish(ax, 'Original Distance (meters)', 'Calculated Distance (meters)',
+            'Comparison of Original and Calculated Distances')
+
+
+def _draw_distance_comparison(figure, data):
+    _draw_distance_scatter(figure.add_subplot(1, 1, 1), data)
+
+
+def _draw_distance_with_error(figure, data):
+    _draw_distance_scatter(figure.add_subplot(2, 1, 1), data)
+
+    ax = figure.add_subplot(2, 1, 2)
+    ax.plot(data['original_distances'], np.abs(data['original_distances'] - data['calculated_distances']),
+            color='green', marker='o', linestyle='-', label='Absolute Error')
+    _finish(ax, 'Original Distance (meters)', 'Absolute Error (meters)',
+            'Absolute Error Between Original and Calculated Distances')
+
+
+def _draw_error_vs_time(figure, data):
+    ax = figure.add_subplot(1, 1, 1)
+    _time_series(ax, data['seconds'], data['original_distances'] - data['calculated_distances'], 'o-',
+                 color='purple', label='Error vs Seconds After Start')
+    _finish(ax, 'Seconds After Start', 'Error (meters)', 'Error vs. Seconds After Start')
+
+
+def _draw_boat_buoy_distances(figure, data):
+    # Boat distance over time
+    ax = figure.add_subplot(4, 1, 1)
+    _time_series(ax, data['times'], data['boat_distances'], 'o-', label='Boat Distance (meters)', color='orange')
+    _finish(ax, 'Time (seconds after start)', 'Boat Distance (meters)', 'Boat Distance Over Time')
+
+    # Original vs. Calculated Distances over time
+    ax = figure.add_subplot(4, 1, 2)
+    _time_series(ax, data['original_times'], data['original_distances'], 'o-',
+                 label='Original Distance (meters)', color='blue')
+    _time_series(ax, data['original_times'], data['calculated_distances'], 'x-',
+                 label='Calculated Distance (meters)', color='green')
+    _finish(ax, 'Time (seconds after start)', 'Distance (meters)',
+            'Comparison of Original and Calculated Distances Over Time')
+
+    # Error vs. Seconds After Start
+    ax = figure.add_subplot(4, 1, 3)
+    _time_series(ax, data['original_times'], np.abs(data['original_distances'] - data['calculated_distances']),
+                 'o-', color='purple', label='Error vs Seconds After Start')
+    _finish(ax, 'Time (seconds after start)', 'Error (meters)', 'Error vs. Seconds After Start')
+
+    # All calculated distances between boat and buoy over time
+    ax = figure.add_subplot(4, 1, 4)
+    _time_series(ax, data['times'], data['all_distances'], 'o-', label='Calculated Distance (meters)', color='green')
+    _finish(ax, 'Time (seconds after start)', 'Distance (meters)',
+            'Calculated Distance Between Boat and Buoy Over Time')
+
+
+# kind: (drawing function, figure size in inches, tight layout)
+FIGURES = {
+    'distance_comparison': (_draw_distance_comparison, (10, 6), True),
+    'distance_with_error': (_draw_distance_with_error, (12, 10), True),
+    'error_vs_time': (_draw_error_vs_time, (10, 6), False),
+    'boat_buoy_distances': (_draw_boat_buoy_distances, (12, 12), True),
+}
+
+
+def figure_key(spec):
+    """Hash of everything that determines the pixels of ``spec``'s figure."""
+    digest = hashlib.sha256(f'{STYLE_VERSION}:{spec.kind}'.encode())
+    for name in sorted(spec.data):
+        values = np.ascontiguousarray(spec.data[name])
+        digest.update(f'{name}:{values.dtype.str}:{values.shape}'.encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def render_figure(spec):
+    """Draw one ``FigureSpec`` to its output file on an Agg canvas."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    draw, figsize, tight = FIGURES[spec.kind]
+    figure = Figure(figsize=figsize, dpi=DPI)
+    FigureCanvasAgg(figure)
+    draw(figure, spec.data)
+    if tight:
+        figure.tight_layout()
+    figure.savefig(spec.output_file)
+    return spec.output_file
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+@timed('plot')
+def render_figures(specs, workers=None):
+    """Render ``specs``, skipping figures that are already up to date on disk.
+
+    Specs with identical content are drawn once and copied to the other
+    output files. Distinct figures are drawn in up to ``workers`` processes
+    (default: one per CPU); ``workers=1`` draws them in this process.
+    """
+    keys = {spec.output_file: figure_key(spec) for spec in specs}
+    manifests = {}
+    for spec in specs:
+        output_dir = os.path.dirname(spec.output_file) or '.'
+        if output_dir not in manifests:
+            manifests[output_dir] = _load_manifest(output_dir)
+
+    def up_to_date(output_file):
+        manifest = manifests[os.path.dirname(output_file) or '.']
+        return os.path.exists(output_file) and manifest.get(os.path.basename(output_file)) == keys[output_file]
+
+    stale = [spec for spec in specs if not up_to_date(spec.output_file)]
+    unique = {}
+    for spec in stale:
+        unique.setdefault(keys[spec.output_file], spec)
+    to_draw = list(unique.values())
+
+    if len(to_draw) > 1 and workers != 1:
+        # Spawned, not forked: the build runs this stage in a thread while the map is drawn in another
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(to_draw)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            list(pool.map(render_figure, to_draw))
+    else:
+        for spec in to_draw:
+            render_figure(spec)
+
+    for spec in stale:
+        drawn = unique[keys[spec.output_file]]
+        if drawn is not spec:
+            shutil.copyfile(drawn.output_file, spec.output_file)
+        manifests[os.path.dirname(spec.output_file) or '.'][os.path.basename(spec.output_file)] = \
+            keys[spec.output_file]
+    for output_dir, manifest in manifests.items():
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    logger.info(f"Rendered {len(to_draw)} of {len(specs)} figures "
+                f"({len(specs) - len(stale)} up to date, {len(stale) - len(to_draw)} duplicates).")
+    return [spec.output_file for spec in specs]
+
+
+def range_error_figures(dataset, comparison, output_dir='.'):
+    """Specs of the distance comparison, absolute error and error-over-time plots."""
+    successful = comparison.successful
+    data = {
+        'original_distances': dataset.ranges.distances[successful],
+        'calculated_distances': comparison.calculated_distances[successful],
+    }
+    seconds = dataset.ranges.seconds_after_start[successful].astype(int)
+    comparison_file, with_error_file, over_time_file = (os.path.join(output_dir, name) for name in RANGE_ERROR_FILES)
+    return [
+        FigureSpec(comparison_file, 'distance_comparison', data),
+        FigureSpec(with_error_file, 'distance_with_error', data),
+        FigureSpec(over_time_file, 'error_vs_time', dict(data, seconds=seconds)),
+    ]
+
+
+def boat_buoy_distance_figures(dataset, comparison, output_dir='.'):
+    """Spec of the four-panel plot of boat, modem and calculated distances over time."""
+    aligned = comparison.aligned
+    valid = aligned.valid
+    successful = comparison.successful
+    seconds_after_start = dataset.ranges.seconds_after_start.astype(int)
+
+    # Calculate the distance of the boat from the starting point (assuming the first point is the start)
+    boat_distances = geodesic_distance(dataset.boat_track.latitudes[0], dataset.boat_track.longitudes[0],
+                                       aligned.boat_latitudes[valid], aligned.boat_longitudes[valid])
+    data = {
+        'times': seconds_after_start[valid],
+        'boat_distances': boat_distances,
+        'all_distances': comparison.calculated_distances[valid],
+        'original_times': seconds_after_start[successful],
+        'original_distances': dataset.ranges.distances[successful],
+        'calculated_distances': comparison.calculated_distances[successful],
+    }
+    return [FigureSpec(os.path.join(output_dir, BOAT_BUOY_DISTANCE_FILES[0]), 'boat_buoy_distances', data)]
+
+
+def plot_range_errors(dataset, comparison, output_dir='.', workers=None):
+    """Save the distance comparison, absolute error and error-over-time plots."""
+    return render_figures(range_error_figures(dataset, comparison, output_dir), workers=workers)
+
+
+def plot_boat_buoy_distances(dataset, comparison, output_dir='.', workers=None):
+    """Save the four-panel plot of boat, modem and calculated distances over time."""
+    return render_figures(boat_buoy_distance_figures(dataset, comparison, output_dir), workers=workers)
@@ -0,0 +1,205 @@
+"""In-process time-window queries over a loaded deployment.
+
+A ``DeploymentIndex`` aligns every range ping with the boat and buoy tracks
+once and keeps the per-ping columns (modem distance, GPS-derived distance,
+error, positions) in ping time order next to the time-sorted tracks. A query
+binary-searches its time span, so it costs O(log n) plus the k pings in the
+span, and returns a ``PingWindow`` whose columns are views of the index
+arrays. Filters such as a maximum boat-buoy distance only look at the pings
+of the span and keep the positions that pass; the other columns are gathered
+when they are read. For example::
+
+    index = open_deployment('./logs')
+    close = index.pings(3600, 7200, max_gps_distance=200)
+    recent_failures = index.last(600, successful=False)
+    boat_fixes = index.fixes('boat', 3600, 7200)
+
+Times are seconds after the first ping, as in ``pi_runs.json``, or
+datetimes, ``datetime64`` values or ISO 8601 strings on the clock of the
+modem logs.
+"""
+from datetime import datetime
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.instrumentation import count, timed
+
+PING_COLUMNS = ('timestamps', 'seconds_after_start', 'distances', 'gps_distances', 'errors', 'boat_latitudes',
+                'boat_longitudes', 'buoy_latitudes', 'buoy_longitudes', 'aligned', 'successful')
+
+
+class PingWindow:
+    """Pings of one query: rows ``start:stop`` of the index, narrowed to ``positions`` within them if set.
+
+    Every name in ``PING_COLUMNS`` is an attribute holding that column for
+    the window's pings: a view while no filter applies, gathered on access
+    otherwise.
+    """
+
+    __slots__ = ('_columns', 'start', 'stop', 'positions')
+
+    def __init__(self, columns, start, stop, positions=None):
+        self._columns = columns
+        self.start = start
+        self.stop = stop
+        self.positions = positions
+
+    def __getattr__(self, name):
+        try:
+            values = self._columns[name]
+        except KeyError:
+            raise AttributeError(f"{type(self).__name__} has no column {name!r}") from None
+        values = values[self.start:self.stop]
+        return values if self.positions is None else values[self.positions]
+
+    def __len__(self):
+        return self.stop - self.start if self.positions is None else len(self.positions)
+
+    def where(self, mask):
+        """The pings of this window for which ``mask`` (one bool per ping of the window) is True."""
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (len(self),):
+            raise ValueError(f"Mask of shape {mask.shape} does not match a window of {len(self)} pings")
+        positions = np.flatnonzero(mask)
+        return PingWindow(self._columns, self.start, self.stop,
+                          positions if self.positions is None else self.positions[positions])
+
+    def ranges(self):
+        """The window as a ``RangeLog``."""
+        from logprocessor.records import RangeLog
+
+        return RangeLog(self.timestamps, self.seconds_after_start, self.distances)
+
+    def __repr__(self):
+        return f"PingWindow({len(self)} pings, {int(np.count_nonzero(self.successful))} successful)"
+
+
+class DeploymentIndex:
+    """Sorted per-ping columns and tracks of one deployment, for repeated time-window queries.
+
+    ``clock_fit`` maps ping times onto the GPS clocks for ``fixes``; without
+    it both clocks are taken to agree, as in ``compare_ranges``' defaults.
+    """
+
+    def __init__(self, dataset, comparison, clock_fit=None):
+        ranges = dataset.ranges
+        seconds = ranges.seconds_after_start
+        if np.any(seconds[1:] < seconds[:-1]):
+            raise ValueError("Range pings must be sorted by seconds_after_start")
+        aligned = comparison.aligned
+        self.dataset = dataset
+        self.clock_fit = clock_fit
+        self.columns = {
+            'timestamps': ranges.timestamps,
+            'seconds_after_start': seconds,
+            'distances': ranges.distances,
+            'gps_distances': comparison.calculated_distances,
+            'errors': ranges.distances - comparison.calculated_distances,
+            'boat_latitudes': aligned.boat_latitudes,
+            'boat_longitudes': aligned.boat_longitudes,
+            'buoy_latitudes': aligned.buoy_latitudes,
+            'buoy_longitudes': aligned.buoy_longitudes,
+            'aligned': aligned.valid,
+            'successful': comparison.successful,
+        }
+
+    def __len__(self):
+        return len(self.dataset.ranges)
+
+    def seconds(self, moment):
+        """``moment`` as seconds after the first ping; numbers are returned unchanged."""
+        if moment is None or isinstance(moment, (int, float, np.integer, np.floating)):
+            return moment
+        if isinstance(moment, datetime) and moment.tzinfo is not None:
+            raise ValueError(f"{moment} has a time zone; the modem logs' timestamps are local times without one")
+        ranges = self.dataset.ranges
+        if not len(ranges):
+            raise ValueError("No pings to place a date on")
+        offset = (np.datetime64(moment, 's') - ranges.timestamps[0]) / np.timedelta64(1, 's')
+        return float(ranges.seconds_after_start[0] + offset)
+
+    def pings(self, start=None, end=None, successful=None, max_gps_distance=None, min_gps_distance=None):
+        """Pings with ``start <= time < end`` (either end may be None), optionally filtered.
+
+        ``successful`` keeps only pings that did (True) or did not (False)
+        get a modem distance and were aligned; ``max_gps_distance`` and
+        ``min_gps_distance`` bound the GPS-derived boat-buoy distance in
+        meters, which drops pings outside the GPS tracks.
+        """
+        first, stop = self.dataset.ranges.span(self.seconds(start), self.seconds(end))
+        window = PingWindow(self.columns, first, stop)
+        mask = None
+        if successful is not None:
+            mask = window.successful == bool(successful)
+        with np.errstate(invalid='ignore'):
+            if max_gps_distance is not None:
+                mask = _and(mask, window.gps_distances <= max_gps_distance)
+            if min_gps_distance is not None:
+                mask = _and(mask, window.gps_distances >= min_gps_distance)
+        if mask is not None:
+            window = window.where(mask)
+        count('queries')
+        count('query_pings', len(window))
+        return window
+
+    def last(self, seconds, **filters):
+        """Pings of the last ``seconds`` before the latest ping, inclusive; takes the filters of ``pings``."""
+        times = self.dataset.ranges.seconds_after_start
+        if not len(times):
+            return self.pings(**filters)
+        return self.pings(times[-1] - seconds, np.nextafter(times[-1], np.inf), **filters)
+
+    def failures(self, start=None, end=None):
+        """Pings in the span that got no modem distance or could not be aligned."""
+        return self.pings(start, end, successful=False)
+
+    def track_clock(self, track):
+        """``(scale, offset)`` mapping ping seconds onto the ``'boat'`` or ``'buoy'`` GPS clock."""
+        if track not in ('boat', 'buoy'):
+            raise ValueError(f"Unknown track {track!r}; expected 'boat' or 'buoy'")
+        if self.clock_fit is None:
+            return 1.0, 0.0
+        return getattr(self.clock_fit, f'{track}_scale'), getattr(self.clock_fit, f'{track}_offset')
+
+    def fixes(self, track, start=None, end=None):
+        """Fixes of the ``'boat'`` or ``'buoy'`` track within a span of ping time, as a ``Track`` of views.
+
+        The span is mapped onto the track's clock with ``clock_fit``; the
+        fixes keep their own clock's times.
+        """
+        scale, offset = self.track_clock(track)
+        start, end = self.seconds(start), self.seconds(end)
+        return getattr(self.dataset, f'{track}_track').between(None if start is None else start * scale + offset,
+                                                               None if end is None else end * scale + offset)
+
+
+def _and(mask, condition):
+    return condition if mask is None else mask & condition
+
+
+@timed('index')
+def open_deployment(log_dir='./logs', clock_fit=None, clock_file=None, **load_options):
+    """Load a deployment and index it for queries.
+
+    The GPS clocks are fitted unless ``clock_fit`` is given or ``clock_file``
+    names a fit saved by ``save_clock_fit`` (such as the one the build
+    graph keeps in ``<log_dir>/clock_fit.json``). ``load_options`` are
+    passed to ``load_dataset``.
+    """
+    from logprocessor.analysis import compare_ranges
+    from logprocessor.clock import compare_fitted, load_clock_fit
+    from logprocessor.dataset import load_dataset
+
+    dataset = load_dataset(log_dir, **load_options)
+    if clock_fit is None and clock_file is not None:
+        clock_fit = load_clock_fit(clock_file)
+    if clock_fit is None:
+        clock_fit, comparison = compare_fitted(dataset)
+    else:
+        comparison = compare_ranges(dataset, clock_fit.boat_scale, clock_fit.buoy_scale,
+                                    clock_fit.boat_offset, clock_fit.buoy_offset)
+    index = DeploymentIndex(dataset, comparison, clock_fit)
+    logger.info(f"Indexed {len(index)} pings, {len(dataset.boat_track)} boat and {len(dataset.buoy_track)} "
+                f"buoy fixes for queries.")
+    return index
@@ -0,0 +1,221 @@
+"""Compact typed records for GPS fixes and range pings.
+
+Bulk data is held column-wise: a ``Track`` is three float64 arrays (``times``,
+``latitudes``, ``longitudes``) and a ``RangeLog`` is ``timestamps``
+(``datetime64[s]``), ``seconds_after_start`` and ``distances`` (NaN for a
+failed range), so a fix or ping costs 24 bytes rather than a dict of boxed
+values. ``Fix`` and ``Ping`` are ``__slots__`` records for code that handles
+one item at a time, such as the live follower. Indexing a container with an
+integer returns a record; slices, index arrays and boolean masks return a
+smaller container of the same type; ``between`` cuts a time span out of a
+sorted ``Track`` or ``RangeLog`` with a binary search, as array views. A
+``RangeMatrix`` holds the ranges of every node pair of a deployment and hands
+out each pair's ``RangeLog``.
+"""
+import math
+
+import numpy as np
+
+
+class Fix:
+    """One GPS fix: seconds on the track's clock, latitude and longitude."""
+
+    __slots__ = ('time', 'latitude', 'longitude')
+
+    def __init__(self, time, latitude, longitude):
+        self.time = float(time)
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+
+    def __iter__(self):
+        return iter((self.time, self.latitude, self.longitude))
+
+    def __eq__(self, other):
+        return isinstance(other, Fix) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"Fix(time={self.time!r}, latitude={self.latitude!r}, longitude={self.longitude!r})"
+
+
+class Ping:
+    """One range request: when it was logged and the modem distance (NaN if it failed)."""
+
+    __slots__ = ('timestamp', 'seconds_after_start', 'distance')
+
+    def __init__(self, timestamp, seconds_after_start, distance):
+        self.timestamp = timestamp
+        self.seconds_after_start = float(seconds_after_start)
+        self.distance = math.nan if distance is None else float(distance)
+
+    @property
+    def successful(self):
+        return not math.isnan(self.distance)
+
+    def __iter__(self):
+        return iter((self.timestamp, self.seconds_after_start, self.distance))
+
+    def __eq__(self, other):
+        # NaN distances of two failed pings compare equal here
+        return (isinstance(other, Ping) and self.timestamp == other.timestamp
+                and self.seconds_after_start == other.seconds_after_start
+                and (self.distance == other.distance or not (self.successful or other.successful)))
+
+    def __repr__(self):
+        return (f"Ping(timestamp={self.timestamp!r}, seconds_after_start={self.seconds_after_start!r}, "
+                f"distance={self.distance!r})")
+
+
+class _Columns:
+    """Struct-of-arrays container; subclasses list their ``COLUMNS`` as ``(name, dtype)``."""
+
+    COLUMNS = ()
+    # The column the rows are sorted by, if any, which ``between`` searches
+    TIME_COLUMN = None
+
+    __slots__ = ()
+
+    def __init__(self, *columns):
+        if len(columns) != len(self.COLUMNS):
+            raise TypeError(f"{type(self).__name__} takes {len(self.COLUMNS)} columns, got {len(columns)}")
+        lengths = set()
+        for (name, dtype), values in zip(self.COLUMNS, columns):
+            # No copy when the column already has the right dtype, e.g. a memory-mapped cache column
+            values = np.asarray(values, dtype=dtype)
+            if values.ndim != 1:
+                raise ValueError(f"{type(self).__name__}.{name} must be one-dimensional")
+            lengths.add(len(values))
+            setattr(self, name, values)
+        if len(lengths) > 1:
+            raise ValueError(f"{type(self).__name__} columns differ in length: {sorted(lengths)}")
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a container from an iterable of ``Fix``/``Ping`` records or plain tuples."""
+        rows = list(map(tuple, records))
+        if not rows:
+            return cls.empty()
+        return cls(*zip(*rows))
+
+    @classmethod
+    def empty(cls):
+        return cls(*(np.empty(0, dtype=dtype) for _, dtype in cls.COLUMNS))
+
+    def columns(self):
+        """The columns as ``{name: array}``, the layout the columnar cache stores."""
+        return {name: getattr(self, name) for name, _ in self.COLUMNS}
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name, _ in self.COLUMNS)
+
+    def __len__(self):
+        return len(getattr(self, self.COLUMNS[0][0]))
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self._record(*(getattr(self, name)[index] for name, _ in self.COLUMNS))
+        return type(self)(*(getattr(self, name)[index] for name, _ in self.COLUMNS))
+
+    def __iter__(self):
+        for row in zip(*(getattr(self, name).tolist() for name, _ in self.COLUMNS)):
+            yield self._record(*row)
+
+    def span(self, start=None, end=None):
+        """``(first, stop)`` row bounds of ``start <= time < end`` in the sorted ``TIME_COLUMN``; None is open."""
+        times = getattr(self, self.TIME_COLUMN)
+        first = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        stop = len(times) if end is None else int(np.searchsorted(times, end, side='left'))
+        return first, max(first, stop)
+
+    def between(self, start=None, end=None):
+        """Rows with ``start <= time < end`` as views of these columns."""
+        first, stop = self.span(start, end)
+        return self[first:stop]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} rows, {self.nbytes / 2 ** 20:.1f} MiB)"
+
+
+class Track(_Columns):
+    """GPS fixes sorted by time, as float64 columns."""
+
+    COLUMNS = (('times', np.float64), ('latitudes', np.float64), ('longitudes', np.float64))
+    TIME_COLUMN = 'times'
+
+    __slots__ = ('times', 'latitudes', 'longitudes')
+
+    def _record(self, time, latitude, longitude):
+        return Fix(time, latitude, longitude)
+
+
+class RangeLog(_Columns):
+    """Range requests in log order; ``distances`` is NaN where no response was received."""
+
+    COLUMNS = (('timestamps', 'datetime64[s]'), ('seconds_after_start', np.float64), ('distances', np.float64))
+    TIME_COLUMN = 'seconds_after_start'
+
+    __slots__ = ('timestamps', 'seconds_after_start', 'distances')
+
+    def _record(self, timestamp, seconds_after_start, distance):
+        if isinstance(timestamp, np.datetime64):
+            timestamp = timestamp.astype(object)
+        return Ping(timestamp, seconds_after_start, distance)
+
+    @property
+    def successful(self):
+        """Boolean mask of the ranges that got a response."""
+        return ~np.isnan(self.distances)
+
+
+class RangeMatrix(_Columns):
+    """Range requests between every pair of nodes, indexed by ``(source, destination)`` and time.
+
+    Rows are grouped by pair and sorted by time within each pair, so
+    ``pair`` returns a pair's ``RangeLog`` as array views without scanning
+    and ``window`` narrows it to a time span with a binary search.
+    """
+
+    COLUMNS = (('timestamps', 'datetime64[s]'), ('seconds_after_start', np.float64), ('distances', np.float64),
+               ('sources', np.int32), ('destinations', np.int32))
+
+    __slots__ = ('timestamps', 'seconds_after_start', 'distances', 'sources', 'destinations', '_pairs')
+
+    def __init__(self, *columns):
+        super().__init__(*columns)
+        keys = self.sources.astype(np.int64) << 32 | self.destinations.astype(np.int64)
+        times = self.seconds_after_start
+        same_pair = keys[1:] == keys[:-1]
+        if not (np.all(keys[1:] >= keys[:-1]) and np.all(times[1:][same_pair] >= times[:-1][same_pair])):
+            order = np.lexsort((self.seconds_after_start, self.destinations, self.sources))
+            for name, _ in self.COLUMNS:
+                setattr(self, name, getattr(self, name)[order])
+            keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.intp)
+        stops = np.r_[starts[1:], len(keys)]
+        self._pairs = {(int(self.sources[start]), int(self.destinations[start])): (int(start), int(stop))
+                       for start, stop in zip(starts, stops)}
+
+    def _record(self, timestamp, seconds_after_start, distance, source, destination):
+        if isinstance(timestamp, np.datetime64):
+            timestamp = timestamp.astype(object)
+        return Ping(timestamp, seconds_after_start, distance)
+
+    @property
+    def pairs(self):
+        """The ``(source, destination)`` pairs with at least one range request, in sorted order."""
+        return list(self._pairs)
+
+    def pair(self, source, destination):
+        """All range requests from ``source`` to ``destination`` as a ``RangeLog`` (empty if there are none)."""
+        start, stop = self._pairs.get((source, destination), (0, 0))
+        return RangeLog(self.timestamps[start:stop], self.seconds_after_start[start:stop],
+                        self.distances[start:stop])
+
+    def window(self, source, destination, start_seconds, end_seconds):
+        """Requests of one pair with ``start_seconds <= seconds_after_start < end_seconds``."""
+        return self.pair(source, destination).between(start_seconds, end_seconds)
+
+    def counts(self):
+        """``{(source, destination): (requests, successful requests)}``."""
+        successful = ~np.isnan(self.distances)
+        return {pair: (stop - start, int(successful[start:stop].sum())) for pair, (start, stop) in self._pairs.items()}
@@ -0,0 +1,210 @@
+"""Resampling of raw boat (phone) and buoy GPS logs onto one regular time base.
+
+Raw logs are CSV files with a header row or JSON-lines files (either may be
+gzip- or zstd-compressed), one fix per row, with a time column (ISO 8601 strings or Unix seconds/milliseconds) and
+latitude and longitude columns under any of the usual names. Both streams are
+cleaned with ``logprocessor.validation``, then linearly interpolated in one
+vectorized pass at ``start + k * step`` seconds and written in the layout of
+``resampled_boat_gps_data.json`` and ``resampled_buoy_gps_data.json``, with
+seconds counted from the same ``start`` for both. A grid time whose
+surrounding raw fixes are more than ``max_gap`` seconds apart is written with
+null coordinates, which the loaders skip; grid times outside a stream's
+recording are not written at all.
+"""
+import csv
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.alignment import BOAT_COLUMNS, BUOY_COLUMNS, interpolate_track
+from logprocessor.compression import open_stream, strip_compression_suffix
+from logprocessor.dataset import BOAT_FILE, BUOY_FILE
+from logprocessor.instrumentation import count, timed
+from logprocessor.records import Track
+from logprocessor.validation import clean_track
+
+# Column names tried, case-insensitively, when a raw log's columns are not given
+TIME_KEYS = ('time', 'timestamp', 'datetime', 'date_time', 'utc', 'gps_time')
+LATITUDE_KEYS = ('latitude', 'lat', 'phone_latitude')
+LONGITUDE_KEYS = ('longitude', 'lon', 'lng', 'long', 'phone_longitude')
+
+DEFAULT_STEP = 1.0
+DEFAULT_MAX_GAP = 10.0
+# Unix times above this are taken to be in milliseconds (it is in the year 5138 in seconds)
+MILLISECONDS_THRESHOLD = 1e11
+
+
+def _find_key(keys, candidates, file_path):
+    lowered = {key.lower(): key for key in keys}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    raise ValueError(f"{file_path} has none of the columns {candidates}; found {sorted(keys)}")
+
+
+def _read_rows(file_path):
+    """Yield each fix of a CSV or JSON-lines file as a dict."""
+    with open_stream(file_path, 'r', newline='') as f:
+        if os.path.splitext(strip_compression_suffix(file_path))[1].lower() == '.csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Error parsing JSON from {file_path}: {e}")
+                count('gps_json_errors')
+
+
+def parse_times(values):
+    """Convert raw time values to float Unix seconds.
+
+    Numbers are Unix seconds, or milliseconds when they are too large to be
+    seconds; strings are ISO 8601, taken as UTC unless they carry an offset.
+    """
+    values = list(values)
+    try:
+        seconds = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        seconds = None
+    if seconds is not None:
+        return np.where(np.abs(seconds) > MILLISECONDS_THRESHOLD, seconds / 1000, seconds)
+    try:
+        # The fast path: offset-free timestamps, optionally with a trailing Z
+        stamps = np.array([value[:-1] if value.endswith('Z') else value for value in values], dtype='datetime64[ms]')
+        return stamps.astype(np.int64) / 1000
+    except ValueError:
+        pass
+    seconds = np.empty(len(values))
+    for i, value in enumerate(values):
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        seconds[i] = moment.timestamp()
+    return seconds
+
+
+def read_raw_gps(file_path, time_key=None, latitude_key=None, longitude_key=None):
+    """Load a raw GPS log as a time-sorted ``Track`` of Unix seconds.
+
+    Rows without a time or a position are skipped and counted as invalid fixes.
+    """
+    times, latitudes, longitudes = [], [], []
+    keys = None
+    skipped = 0
+    for row in _read_rows(file_path):
+        if keys is None:
+            keys = (time_key or _find_key(row, TIME_KEYS, file_path),
+                    latitude_key or _find_key(row, LATITUDE_KEYS, file_path),
+                    longitude_key or _find_key(row, LONGITUDE_KEYS, file_path))
+        time, latitude, longitude = (row.get(key) for key in keys)
+        if time in (None, '') or latitude in (None, '') or longitude in (None, ''):
+            skipped += 1
+            continue
+        times.append(time)
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+    count('invalid_gps_fixes', skipped)
+    count('gps_fixes_read', len(times))
+
+    times = parse_times(times)
+    order = np.argsort(times, kind='stable')
+    track = Track(times[order], np.asarray(latitudes, dtype=np.float64)[order],
+                  np.asarray(longitudes, dtype=np.float64)[order])
+    logger.info(f"Read {len(track)} raw GPS fixes from {file_path} ({skipped} without a time or position).")
+    return track
+
+
+def _as_unix_seconds(moment):
+    if moment is None or isinstance(moment, (int, float)):
+        return moment
+    if isinstance(moment, str):
+        return float(parse_times([moment])[0])
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def window_track(track, start, end):
+    """The fixes of ``track`` between ``start`` and ``end`` plus the one just outside either end."""
+    first = max(int(np.searchsorted(track.times, start, side='right')) - 1, 0)
+    last = int(np.searchsorted(track.times, end, side='left')) + 1
+    return track[first:last]
+
+
+def resample_track(track, grid_times, max_gap=DEFAULT_MAX_GAP):
+    """Interpolate ``track`` at ``grid_times``; positions are NaN across gaps longer than ``max_gap`` seconds.
+
+    Grid times outside the track are NaN as well.
+    """
+    latitudes, longitudes = interpolate_track(track, grid_times)
+    n = len(track)
+    if n > 1:
+        index = np.searchsorted(track.times, grid_times, side='left')
+        exact = track.times[np.minimum(index, n - 1)] == grid_times
+        upper = np.clip(index, 1, n - 1)
+        gap = ~exact & (track.times[upper] - track.times[upper - 1] > max_gap)
+        latitudes[gap] = np.nan
+        longitudes[gap] = np.nan
+    return latitudes, longitudes
+
+
+def write_resampled(file_path, columns, seconds, latitudes, longitudes):
+    """Write one resampled stream as JSON lines; NaN positions become nulls."""
+    time_key, latitude_key, longitude_key = columns
+    gaps = np.isnan(latitudes) | np.isnan(longitudes)
+    latitudes = np.round(latitudes, 7)
+    longitudes = np.round(longitudes, 7)
+    with open(file_path, 'w') as f:
+        for second, latitude, longitude, gap in zip(seconds.tolist(), latitudes.tolist(), longitudes.tolist(),
+                                                     gaps.tolist()):
+            entry = {time_key: second, latitude_key: None if gap else latitude,
+                     longitude_key: None if gap else longitude}
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+    return len(seconds)
+
+
+@timed('resample')
+def resample_gps_logs(boat_file, buoy_file, output_dir='./logs', step=DEFAULT_STEP, max_gap=DEFAULT_MAX_GAP,
+                      start=None, end=None, clean=True):
+    """Resample raw boat and buoy GPS logs onto one time base and write both resampled files.
+
+    ``start`` and ``end`` (datetimes, ISO strings or Unix seconds) limit the
+    window; by default it spans both recordings. Returns
+    ``{'start': ISO start time, 'boat': fixes written, 'buoy': fixes written}``.
+    """
+    tracks = {'boat': read_raw_gps(boat_file), 'buoy': read_raw_gps(buoy_file)}
+    recorded = [track for track in tracks.values() if len(track)]
+    if not recorded:
+        raise ValueError(f"No GPS fixes in {boat_file} or {buoy_file}")
+    start = _as_unix_seconds(start)
+    end = _as_unix_seconds(end)
+    start = min(track.times[0] for track in recorded) if start is None else start
+    end = max(track.times[-1] for track in recorded) if end is None else end
+    if end < start:
+        raise ValueError(f"Resampling window ends before it starts ({start} > {end})")
+    # Only the window and the fixes bracketing it are cleaned and interpolated
+    tracks = {name: window_track(track, start, end) for name, track in tracks.items()}
+    if clean:
+        tracks = {name: clean_track(track, name=name)[0] for name, track in tracks.items()}
+
+    os.makedirs(output_dir, exist_ok=True)
+    grid = np.arange(0.0, end - start + step / 2, step)
+    written = {'start': datetime.fromtimestamp(start, timezone.utc).isoformat()}
+    for name, file_name, columns in (('boat', BOAT_FILE, BOAT_COLUMNS), ('buoy', BUOY_FILE, BUOY_COLUMNS)):
+        track = tracks[name]
+        grid_times = start + grid
+        covered = (grid_times >= track.times[0]) & (grid_times <= track.times[-1]) if len(track) else \
+            np.zeros(len(grid), dtype=bool)
+        latitudes, longitudes = resample_track(track, grid_times[covered], max_gap)
+        output_file = os.path.join(output_dir, file_name)
+        written[name] = write_resampled(output_file, columns, grid[covered], latitudes, longitudes)
+        gaps = int(np.isnan(latitudes).sum())
+        count('resampled_gap_fixes', gaps)
+        logger.info(f"Wrote {written[name]} resampled {name} fixes ({gaps} in gaps) to {output_file}.")
+    return written
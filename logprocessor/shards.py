@@ -0,0 +1,193 @@
+"""Map site split into one page per hour or day of a deployment.
+
+A week-long deployment is too much for one folium page, so the site is cut
+into shards: each time window of the range log gets its own map with the
+pings and the boat and buoy fixes of that window, sliced out of a
+``DeploymentIndex`` with binary searches. The bathymetry tile pyramid is cut
+once and shared by every shard, and a plain ``index.html`` lists the shards
+with their ping counts. Each shard is keyed by a hash of its data and the
+render settings, kept in ``.shards.json`` in the site directory; only shards
+whose key changed (typically the window that received new data) or whose
+page is missing are redrawn, in parallel worker processes. A refitted clock
+moves every ping and fix, so it redraws every shard; pass a fixed
+``clock_fit`` or ``clock_file`` to ``open_deployment`` while data is still
+coming in, as ``logprocessor shards`` does with ``logs/clock_fit.json``.
+"""
+import hashlib
+import html
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.analysis import RangeComparison
+from logprocessor.alignment import AlignedPings
+from logprocessor.dataset import Dataset
+from logprocessor.instrumentation import call_counted, count, merge_counts, timed
+
+SHARD_WINDOWS = {'hour': 'h', 'day': 'D'}
+MANIFEST_NAME = '.shards.json'
+INDEX_NAME = 'index.html'
+# Bump when the shard pages change so every shard is redrawn
+SHARD_VERSION = 1
+
+ShardSpec = namedtuple('ShardSpec', ['name', 'start', 'end', 'map_file', 'dataset', 'comparison'])
+
+
+def shard_windows(index, window='hour'):
+    """``[(name, start_seconds, end_seconds)]`` of the windows holding pings or fixes, in time order.
+
+    Windows are aligned to whole hours or days of the modem logs' clock and
+    named after their start, e.g. ``2024-08-20T08`` or ``2024-08-20``.
+    """
+    if window not in SHARD_WINDOWS:
+        raise ValueError(f"Unknown shard window {window!r}; expected one of {tuple(SHARD_WINDOWS)}")
+    ranges = index.dataset.ranges
+    if not len(ranges):
+        raise ValueError("Cannot shard a deployment without range pings, which place it in time")
+    unit = SHARD_WINDOWS[window]
+    origin = ranges.timestamps[0] - np.timedelta64(int(round(ranges.seconds_after_start[0])), 's')
+    starts, ends = [ranges.seconds_after_start[0]], [ranges.seconds_after_start[-1]]
+    for track in ('boat', 'buoy'):
+        times = getattr(index.dataset, f'{track}_track').times
+        if len(times):
+            scale, offset = index.track_clock(track)
+            starts.append(min((times[0] - offset) / scale, (times[-1] - offset) / scale))
+            ends.append(max((times[0] - offset) / scale, (times[-1] - offset) / scale))
+
+    first = (origin + np.timedelta64(int(np.floor(min(starts))), 's')).astype(f'datetime64[{unit}]')
+    last = (origin + np.timedelta64(int(np.floor(max(ends))), 's')).astype(f'datetime64[{unit}]')
+    windows = []
+    for moment in np.arange(first, last + 1):
+        start = float((moment - origin) / np.timedelta64(1, 's'))
+        end = float((moment + 1 - origin) / np.timedelta64(1, 's'))
+        if any(len(rows) for rows in (index.pings(start, end), index.fixes('boat', start, end),
+                                      index.fixes('buoy', start, end))):
+            windows.append((str(moment), start, end))
+    return windows
+
+
+def shard_spec(index, name, start, end, site_dir):
+    """The data of one shard as array views of ``index``."""
+    pings = index.pings(start, end)
+    rows = slice(pings.start, pings.stop)
+    aligned = AlignedPings(pings.boat_latitudes, pings.boat_longitudes, pings.buoy_latitudes, pings.buoy_longitudes,
+                           pings.aligned)
+    dataset = Dataset(index.fixes('boat', start, end), index.fixes('buoy', start, end), index.dataset.ranges[rows])
+    comparison = RangeComparison(aligned, pings.gps_distances, pings.successful)
+    return ShardSpec(name, start, end, os.path.join(site_dir, f'{name}.html'), dataset, comparison)
+
+
+def shard_key(spec, settings):
+    """Hash of everything that determines the page of ``spec``."""
+    digest = hashlib.sha256(json.dumps(dict(settings, version=SHARD_VERSION), sort_keys=True).encode())
+    columns = list(spec.dataset.boat_track.columns().values()) + list(spec.dataset.buoy_track.columns().values()) \
+        + list(spec.dataset.ranges.columns().values()) + list(spec.comparison.aligned) \
+        + [spec.comparison.calculated_distances]
+    for values in columns:
+        values = np.ascontiguousarray(values)
+        digest.update(f'{values.dtype.str}:{values.shape}'.encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def render_shard(spec, tiff_file, tile_dir, pyramid, render_mode, track_tolerance):
+    from logprocessor.site import build_map
+
+    build_map(spec.dataset, spec.comparison, tiff_file=tiff_file, map_file=spec.map_file, render_mode=render_mode,
+              track_tolerance=track_tolerance, overlay='tiles', tile_dir=tile_dir, pyramid=pyramid)
+    return spec.map_file
+
+
+def _load_manifest(site_dir):
+    try:
+        with open(os.path.join(site_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_index(specs, index_file, window):
+    """Write the page linking every shard, with its time span and ping counts."""
+    rows = []
+    for spec in specs:
+        successful = int(np.count_nonzero(spec.comparison.successful))
+        link = f'<a href="{html.escape(os.path.basename(spec.map_file))}">{html.escape(spec.name)}</a>'
+        rows.append(f'<tr><td>{link}</td><td>{len(spec.dataset.ranges)}</td><td>{successful}</td>'
+                    f'<td>{len(spec.dataset.boat_track)}</td><td>{len(spec.dataset.buoy_track)}</td></tr>')
+    with open(index_file, 'w') as f:
+        f.write(f'''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Deployment maps by {window}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+th, td {{ padding: 4px 12px; border-bottom: 1px solid #ccc; text-align: right; }}
+th:first-child, td:first-child {{ text-align: left; }}
+</style>
+</head>
+<body>
+<h1>Deployment maps by {window}</h1>
+<table>
+<tr><th>Window</th><th>Pings</th><th>Successful</th><th>Boat fixes</th><th>Buoy fixes</th></tr>
+{chr(10).join(rows)}
+</table>
+</body>
+</html>
+''')
+
+
+@timed('shards')
+def build_shards(index, site_dir='./site/shards', window='hour', tiff_file='./site/bethymetry.tiff',
+                 render_mode='fast', track_tolerance=1.0, workers=None):
+    """Bring the sharded map site of ``index`` (a ``DeploymentIndex``) in ``site_dir`` up to date.
+
+    Shards are drawn in up to ``workers`` processes (default: one per CPU);
+    ``workers=1`` draws them in this process. Pages of windows that no longer
+    exist are removed. Returns ``{'shards': all shard names, 'rendered': redrawn names}``.
+    """
+    from logprocessor.site import TILE_DIR_NAME
+
+    os.makedirs(site_dir, exist_ok=True)
+    tile_dir = pyramid = None
+    settings = {'window': window, 'render_mode': render_mode, 'track_tolerance': track_tolerance}
+    if tiff_file:
+        from logprocessor.tiles import build_tile_pyramid
+
+        # Cut the shared pyramid once, before the workers look it up concurrently
+        tile_dir = os.path.join(site_dir, TILE_DIR_NAME)
+        settings['pyramid'] = pyramid = build_tile_pyramid(tiff_file, tile_dir)
+
+    specs = [shard_spec(index, name, start, end, site_dir) for name, start, end in shard_windows(index, window)]
+    keys = {spec.name: shard_key(spec, settings) for spec in specs}
+    manifest = _load_manifest(site_dir)
+    stale = [spec for spec in specs
+             if manifest.get(spec.name) != keys[spec.name] or not os.path.exists(spec.map_file)]
+
+    if len(stale) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(stale))) as pool:
+            render = [render_shard] * len(stale)
+            for _, counts in pool.map(call_counted, render, stale, repeat(tiff_file), repeat(tile_dir),
+                                      repeat(pyramid), repeat(render_mode), repeat(track_tolerance)):
+                merge_counts(counts)
+    else:
+        for spec in stale:
+            render_shard(spec, tiff_file, tile_dir, pyramid, render_mode, track_tolerance)
+
+    for name in set(manifest) - set(keys):
+        page = os.path.join(site_dir, f'{name}.html')
+        if os.path.exists(page):
+            os.remove(page)
+    with open(os.path.join(site_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(keys, f, indent=4)
+    write_index(specs, os.path.join(site_dir, INDEX_NAME), window)
+    count('shards_rendered', len(stale))
+    logger.info(f"Rendered {len(stale)} of {len(specs)} {window} map shards into {site_dir} "
+                f"({len(specs) - len(stale)} up to date).")
+    return {'shards': [spec.name for spec in specs], 'rendered': [spec.name for spec in stale]}
@@ -0,0 +1,375 @@
+"""Folium map of the boat and buoy tracks with good and bad range markers."""
+import os
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.decimation import decimate_track, decimation_pyramid
+from logprocessor.instrumentation import timed
+
+# Bounds of the bathymetry overlay
+BOUNDS = [[32.84947, -117.40825], [32.96678, -117.24071]]
+
+# 'tiles' serves the bathymetry as a cached XYZ tile pyramid next to the page;
+# 'inline' embeds the whole image in the HTML
+OVERLAY_MODES = ('tiles', 'inline')
+TILE_DIR_NAME = 'bathymetry_tiles'
+
+# 'fast' draws tracks as gradient polylines and pings as client-side clusters;
+# 'markers' draws one popup marker per GPS fix and per ping
+RENDER_MODES = ('fast', 'markers')
+
+# Start and end colors of the track gradients
+BOAT_GRADIENT = [(1.0, 0.75, 0.8), (0.8, 0.0, 0.4)]  # Light pink to dark pink
+BUOY_GRADIENT = [(0.75, 0.75, 1.0), (0.0, 0.0, 0.8)]  # Light blue to dark blue
+
+# Coordinates are written with 6 decimals (~0.1 m) to keep the page small
+COORDINATE_DECIMALS = 6
+
+# Zoom levels at which the fast mode draws the tracks decimated to a screen
+# pixel; zooms beyond these draw the tracks decimated with the track tolerance
+TRACK_ZOOMS = range(10, 19)
+
+# Shows only the level of a track matching the map's zoom, i.e. the last one
+# whose minimum zoom is reached
+_TRACK_LEVEL_SCRIPT = """{% macro script(this, kwargs) %}
+(function () {
+    var map = {{ this._parent.get_name() }};
+    var group = {{ this.group.get_name() }};
+    var levels = [{% for min_zoom, line in this.levels %}[{{ min_zoom }}, {{ line.get_name() }}]{{ ', ' if not loop.last }}{% endfor %}];
+    function showLevel() {
+        var line = levels[0][1];
+        levels.forEach(function (level) { if (map.getZoom() >= level[0]) { line = level[1]; } });
+        if (!group.hasLayer(line)) {
+            group.clearLayers();
+            group.addLayer(line);
+        }
+    }
+    map.on('zoomend', showLevel);
+    showLevel();
+})();
+{% endmacro %}"""
+
+# Builds each ping marker in the browser from a compact data row
+# [lat, lon, timestamp, modem distance or null, calculated distance]; the
+# popup HTML is only generated when the marker is clicked
+_PING_MARKER_CALLBACK = """function (row) {
+    var good = row[3] !== null;
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.setIcon(L.AwesomeMarkers.icon({
+        markerColor: good ? 'green' : 'red', icon: good ? 'check' : 'times', prefix: 'fa', iconColor: 'white'}));
+    marker.bindPopup(function () {
+        return 'Timestamp: ' + row[2] + '<br>'
+            + (good ? 'Modem Distance: ' + row[3] + ' meters<br>' : '')
+            + 'Actual Distance: ' + row[4].toFixed(2) + ' meters';
+    }, {maxWidth: 200});
+    return marker;
+}"""
+
+
+def _span_minutes(track):
+    """Whole minutes from the first to the last fix of ``track``, the time its color gradient spans."""
+    return int(round((track.times[-1] - track.times[0]) / 60)) if len(track.times) else 0
+
+
+def _legend_html(end_label):
+    return f'''
+<div style="
+     position: fixed; 
+     bottom: 30px; left: 30px; width: 450px; 
+     background-color: rgba(44, 44, 44, 0.4); border: 0px solid #666; z-index:9999; font-size: 12px;
+     padding: 15px; padding-bottom: 30px; color: #f0f0f0; border-radius: 10px;
+     backdrop-filter: blur(3px);">
+    <u><b style="font-size: 16px;">Legend</b></u><br><br>
+    
+    <div style="display: flex; align-items: center;">
+        <b style="width: 30px;">Boat</b>
+        <div style="flex-grow: 1; height: 15px; background: linear-gradient(to right, #ffb3cc, #cc0066); position: relative; margin-left: 10px; margin-right: 40px;">
+            <!-- Start and End Lines -->
+            <div style="position: absolute; left: 0%; bottom: -30px; height: 30px; width: 1px; background-color: #f0f0f0;"></div>
+            <div style="position: absolute; right: 0%; bottom: -30px; height: 30px; width: 1px; background-color: #f0f0f0;"></div>
+        </div>
+    </div>
+    
+    <div style="display: flex; align-items: center; margin-top: 20px;">
+        <b style="width: 30px;">Buoy</b>
+        <div style="flex-grow: 1; height: 15px; background: linear-gradient(to right, #b3b3ff, #0000cc); position: relative; margin-left: 10px; margin-right: 40px;">
+            <!-- Start and End Lines -->
+            <div style="position: absolute; left: 0%; bottom: -30px; height: 30px; width: 1px; background-color: #f0f0f0;"></div>
+            <div style="position: absolute; right: 0%; bottom: -30px; height: 30px; width: 1px; background-color: #f0f0f0;"></div>
+        </div>
+    </div>
+    
+    <!-- Center-aligned labels directly under the lines -->
+    <div style="position: relative; margin-top: 25px;">
+        <div style="position: absolute; left: calc(0% + 15px); text-align: center;">0 minutes</div>
+        <div style="position: absolute; right: calc(0% - 0px); text-align: center;">{end_label}</div>
+    </div>
+    <br>
+    
+    <!-- Good and Bad Range Markers -->
+    <div style="display: flex; align-items: center; margin-top: 20px;">
+        <i class="fa fa-check-circle" style="color: green; font-size: 24px; margin-right: 10px;"></i>
+        <b style="font-size: 14px;">Good Range</b>
+    </div>
+    <div style="display: flex; align-items: center; margin-top: 10px;">
+        <i class="fa fa-times-circle" style="color: red; font-size: 24px; margin-right: 10px;"></i>
+        <b style="font-size: 14px;">Bad Range</b>
+    </div>
+    
+    <br>
+</div>
+'''
+
+
+def _read_overlay_image(tiff_file):
+    import rasterio
+    from rasterio.plot import reshape_as_image
+
+    with rasterio.open(tiff_file) as dataset:
+        return reshape_as_image(dataset.read([1, 2, 3]))  # Assuming RGB bands
+
+
+def _add_bathymetry_overlay(my_map, tiff_file, map_file, overlay, tile_dir=None, pyramid=None):
+    import folium
+    from folium.raster_layers import ImageOverlay
+
+    if overlay == 'inline':
+        ImageOverlay(image=_read_overlay_image(tiff_file), name='Scripps Bathymetry Overlay',
+                     bounds=BOUNDS, opacity=0.4).add_to(my_map)
+        return
+
+    map_dir = os.path.dirname(map_file) or '.'
+    tile_dir = tile_dir or os.path.join(map_dir, TILE_DIR_NAME)
+    if pyramid is None:
+        from logprocessor.tiles import build_tile_pyramid
+
+        pyramid = build_tile_pyramid(tiff_file, tile_dir)
+    tile_url = os.path.relpath(tile_dir, map_dir).replace(os.sep, '/')
+    west, south, east, north = pyramid['bounds']
+    folium.TileLayer(
+        tiles=f"{tile_url}/{{z}}/{{x}}/{{y}}.{pyramid['format']}",
+        attr='Scripps Bathymetry',
+        name='Scripps Bathymetry Overlay',
+        overlay=True,
+        control=True,
+        opacity=0.4,
+        max_zoom=22,
+        min_native_zoom=pyramid['min_zoom'],
+        max_native_zoom=pyramid['max_zoom'],
+        bounds=[[south, west], [north, east]],
+    ).add_to(my_map)
+
+
+def _add_track_markers(my_map, track, gradient):
+    import folium
+    from matplotlib import colors as mcolors
+    from matplotlib.colors import LinearSegmentedColormap
+
+    cmap = LinearSegmentedColormap.from_list("gradient", gradient)
+    span = max(track.times[-1] - track.times[0], 1e-9) if len(track.times) else 1.0
+    color_values = [cmap((time - track.times[0]) / span) for time in track.times]
+    for time, latitude, longitude, color in zip(track.times, track.latitudes, track.longitudes, color_values):
+        folium.CircleMarker(
+            location=[latitude, longitude],
+            radius=5,
+            color=mcolors.rgb2hex(color[:3]),  # Convert to hex color
+            fill=True,
+            fill_opacity=1,
+            popup=folium.Popup(f"Seconds after start: {time:.0f}", max_width=200)
+        ).add_to(my_map)
+
+
+def _track_levels(track, tolerance, name):
+    """``[(min_zoom, Track)]`` from coarse to fine: a level per distinct ``TRACK_ZOOMS`` decimation, then ``track``."""
+    if tolerance <= 0:
+        return [(0, track)]
+    # A level pays off only where it may deviate at least twice as far as ``track`` already does
+    pyramid = decimation_pyramid(track, TRACK_ZOOMS, min_tolerance=2 * tolerance, name=name)
+    levels = []
+    for zoom, level in sorted(pyramid.items()):
+        if not levels or level is not levels[-1][1]:
+            levels.append((zoom, level))
+    if levels[-1][1] is not track:
+        levels.append((max(TRACK_ZOOMS) + 1, track))
+    return [(0, levels[0][1])] + levels[1:]
+
+
+def _add_track_line(my_map, levels, gradient, name):
+    """Draw a track as one gradient line per ``(min_zoom, Track)`` level, showing the level for the map's zoom."""
+    import folium
+    from branca.colormap import LinearColormap
+    from branca.element import MacroElement
+    from jinja2 import Template
+    from matplotlib import colors as mcolors
+
+    finest = levels[-1][1]
+    if len(finest.times) < 2:
+        return
+    # One color scale for every level, so the gradient does not shift between zooms
+    colormap = LinearColormap([mcolors.rgb2hex(color) for color in gradient],
+                              vmin=finest.times[0], vmax=finest.times[-2])
+    group = folium.FeatureGroup(name=name).add_to(my_map)
+    switch = MacroElement()
+    switch._template = Template(_TRACK_LEVEL_SCRIPT)
+    switch.group = group
+    switch.levels = []
+    for min_zoom, track in levels:
+        positions = np.column_stack([track.latitudes, track.longitudes]).round(COORDINATE_DECIMALS).tolist()
+        line = folium.ColorLine(
+            positions,
+            colors=track.times[:-1],
+            colormap=colormap,
+            nb_steps=32,
+            weight=4,
+            control=False,
+        ).add_to(group)
+        switch.levels.append((min_zoom, line))
+    switch.add_to(my_map)
+
+
+def _add_range_markers(my_map, dataset, comparison):
+    import folium
+
+    # Create feature groups for good and bad ranges with popups showing time and range
+    good_ranges_group = folium.FeatureGroup(name='Good Ranges').add_to(my_map)
+    bad_ranges_group = folium.FeatureGroup(name='Bad Ranges').add_to(my_map)
+
+    aligned = comparison.aligned
+    for timestamp, distance, boat_latitude, boat_longitude, calculated_distance, valid in zip(
+            dataset.ranges.timestamps, dataset.ranges.distances, aligned.boat_latitudes, aligned.boat_longitudes,
+            comparison.calculated_distances, aligned.valid):
+        if not valid:
+            continue
+        if not np.isnan(distance):  # Successful range
+            popup_content = (f"Timestamp: {timestamp}<br>"
+                             f"Modem Distance: {distance} meters<br>"
+                             f"Actual Distance: {calculated_distance:.2f} meters")
+            folium.Marker(
+                location=[boat_latitude, boat_longitude],
+                icon=folium.Icon(color='green', icon='check', prefix='fa'),
+                popup=folium.Popup(popup_content, max_width=200)
+            ).add_to(good_ranges_group)
+        else:  # Failed range
+            popup_content = (f"Timestamp: {timestamp}<br>"
+                             f"Actual Distance: {calculated_distance:.2f} meters")
+            folium.Marker(
+                location=[boat_latitude, boat_longitude],
+                icon=folium.Icon(color='red', icon='times', prefix='fa'),
+                popup=folium.Popup(popup_content, max_width=200)
+            ).add_to(bad_ranges_group)
+
+    # Add the feature groups to the map
+    my_map.add_child(good_ranges_group)
+    my_map.add_child(bad_ranges_group)
+
+
+def _range_rows(dataset, comparison, mask):
+    aligned = comparison.aligned
+    distances = dataset.ranges.distances[mask]
+    return [
+        [latitude, longitude, str(timestamp), None if np.isnan(distance) else float(distance), calculated_distance]
+        for latitude, longitude, timestamp, distance, calculated_distance in zip(
+            aligned.boat_latitudes[mask].round(COORDINATE_DECIMALS).tolist(),
+            aligned.boat_longitudes[mask].round(COORDINATE_DECIMALS).tolist(),
+            dataset.ranges.timestamps[mask],
+            distances,
+            comparison.calculated_distances[mask].round(2).tolist(),
+        )
+    ]
+
+
+def _add_range_clusters(my_map, dataset, comparison):
+    from folium.plugins import FastMarkerCluster
+
+    failed = comparison.aligned.valid & ~comparison.successful
+    for name, mask in (('Good Ranges', comparison.successful), ('Bad Ranges', failed)):
+        FastMarkerCluster(_range_rows(dataset, comparison, mask), callback=_PING_MARKER_CALLBACK,
+                          name=name, disableClusteringAtZoom=17).add_to(my_map)
+
+
+@timed('map')
+def build_map(dataset, comparison, tiff_file='./site/bethymetry.tiff', map_file='./site/index.html',
+              render_mode='fast', track_tolerance=1.0, overlay='tiles', tile_dir=None, pyramid=None):
+    """Render the deployment map to ``map_file``.
+
+    ``render_mode`` is one of ``RENDER_MODES``. The ``'fast'`` mode keeps the
+    page size and browser load roughly independent of the number of GPS fixes.
+    Tracks are decimated so the drawn line stays within ``track_tolerance``
+    meters of every fix; 0 draws every fix. The fast mode also draws coarser
+    copies of each track that it switches to when zoomed out (see
+    ``TRACK_ZOOMS``). ``overlay`` is one of
+    ``OVERLAY_MODES``; with ``'tiles'`` the tile pyramid is written to
+    ``tile_dir`` (default: next to ``map_file``) and must be published with
+    it. Callers drawing several maps from one pyramid pass its manifest as
+    ``pyramid`` so the TIFF is not hashed again for every map. Without a
+    ``tiff_file`` the map has no bathymetry overlay.
+    """
+    import folium
+
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render_mode!r}; expected one of {RENDER_MODES}")
+    if overlay not in OVERLAY_MODES:
+        raise ValueError(f"Unknown overlay mode {overlay!r}; expected one of {OVERLAY_MODES}")
+    fast = render_mode == 'fast'
+
+    # Create a folium map object centered on the average coordinates of the bounds
+    (south, west), (north, east) = BOUNDS
+    my_map = folium.Map(location=[(south + north) / 2, (west + east) / 2], zoom_start=13, prefer_canvas=fast)
+
+    # Add the bathymetry image as an overlay
+    if tiff_file:
+        _add_bathymetry_overlay(my_map, tiff_file, map_file, overlay, tile_dir, pyramid)
+
+    # Add Google Satellite as the default basemap (pure satellite view)
+    folium.TileLayer(
+        tiles='http://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
+        attr='Google',
+        name='Google Satellite',
+        overlay=False,
+        control=True,
+        max_zoom=22
+    ).add_to(my_map)
+
+    # Add Google Maps as an optional layer
+    folium.TileLayer(
+        tiles='http://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}',
+        attr='Google',
+        name='Google Maps',
+        overlay=False,
+        control=False,
+        max_zoom=22
+    ).add_to(my_map)
+
+    # Drop fixes that would not change the drawn tracks by more than the tolerance
+    boat_track, buoy_track = dataset.boat_track, dataset.buoy_track
+    if track_tolerance > 0:
+        boat_track = decimate_track(boat_track, track_tolerance, name='boat track')
+        buoy_track = decimate_track(buoy_track, track_tolerance, name='buoy track')
+
+    # Plot boat GPS points (Phone data) and buoy GPS points with gradient colors
+    if fast:
+        _add_track_line(my_map, _track_levels(boat_track, track_tolerance, 'boat track'), BOAT_GRADIENT,
+                        'Boat Track')
+        _add_track_line(my_map, _track_levels(buoy_track, track_tolerance, 'buoy track'), BUOY_GRADIENT,
+                        'Buoy Track')
+        _add_range_clusters(my_map, dataset, comparison)
+    else:
+        _add_track_markers(my_map, boat_track, BOAT_GRADIENT)
+        _add_track_markers(my_map, buoy_track, BUOY_GRADIENT)
+        _add_range_markers(my_map, dataset, comparison)
+    logger.info(f"Plotted {len(boat_track.times)} boat GPS points and "
+                f"{len(buoy_track.times)} buoy GPS points on the map ({render_mode} mode).")
+
+    # Add a custom legend for both boat and buoy times with gradients and range markers
+    boat_minutes, buoy_minutes = _span_minutes(dataset.boat_track), _span_minutes(dataset.buoy_track)
+    end_label = (f'{boat_minutes} minutes' if boat_minutes == buoy_minutes
+                 else f'boat {boat_minutes} / buoy {buoy_minutes} minutes')
+    my_map.get_root().html.add_child(folium.Element(_legend_html(end_label)))
+
+    # Add a layer control panel to toggle the ranges on and off
+    my_map.add_child(folium.LayerControl())
+
+    my_map.save(map_file)
+    logger.info(f"Map saved to {map_file}")
+    return map_file
@@ -0,0 +1,319 @@
+"""Streaming, mergeable statistics of the modem range error.
+
+Every accumulator holds only counts, sums and a fixed-accuracy quantile
+sketch, so it is filled in a single pass over chunks of pings, never keeps
+the individual errors, and accumulators built from different files or runs
+merge into the same statistics as a single pass over their union. They
+serialize to plain JSON so summaries can be stored next to a deployment and
+merged later.
+"""
+import json
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from logprocessor.alignment import align_pings
+from logprocessor.geodesy import geodesic_distance
+from logprocessor.instrumentation import timed
+
+STATS_VERSION = 1
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch of non-negative values with bounded relative error.
+
+    Values are counted in logarithmic buckets whose width is set by
+    ``relative_accuracy`` (as in DDSketch), so any quantile is returned within
+    that relative error of a value at that rank, and merging two sketches is
+    adding their bucket counts. Values below ``min_value`` share one bucket.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-3):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zero_count = 0
+        self.buckets = defaultdict(int)
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        small = values < self.min_value
+        self.zero_count += int(np.count_nonzero(small))
+        indices = np.ceil(np.log(values[~small]) / self._log_gamma).astype(np.int64)
+        for index, count in zip(*np.unique(indices, return_counts=True)):
+            self.buckets[int(index)] += int(count)
+
+    def merge(self, other):
+        if other.gamma != self.gamma or other.min_value != self.min_value:
+            raise ValueError("Cannot merge quantile sketches with different accuracy settings")
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+        return self
+
+    def quantile(self, q):
+        """Approximate nearest-rank value at quantile ``q`` in [0, 1]; NaN for an empty sketch."""
+        total = self.count
+        if total == 0:
+            return float('nan')
+        rank = max(1, math.ceil(q * total))
+        seen = self.zero_count
+        if rank <= seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank <= seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {'relative_accuracy': self.relative_accuracy, 'min_value': self.min_value,
+                'zero_count': self.zero_count, 'buckets': {str(index): count for index, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'], data['min_value'])
+        sketch.zero_count = data['zero_count']
+        sketch.buckets.update({int(index): count for index, count in data['buckets'].items()})
+        return sketch
+
+
+class ErrorStats:
+    """Success rate, bias, RMSE, MAE and absolute-error percentiles of a set of pings."""
+
+    def __init__(self, relative_accuracy=0.01):
+        self.pings = 0
+        self.successes = 0
+        self.error_sum = 0.0
+        self.absolute_error_sum = 0.0
+        self.squared_error_sum = 0.0
+        self.min_error = math.inf
+        self.max_error = -math.inf
+        self.absolute_errors = QuantileSketch(relative_accuracy)
+
+    def add(self, errors):
+        """Add aligned pings; ``errors`` is modem minus GPS distance, NaN for failed ranges."""
+        errors = np.asarray(errors, dtype=np.float64).ravel()
+        self.pings += len(errors)
+        errors = errors[~np.isnan(errors)]
+        if len(errors) == 0:
+            return self
+        self.successes += len(errors)
+        self.error_sum += float(errors.sum())
+        self.absolute_error_sum += float(np.abs(errors).sum())
+        self.squared_error_sum += float(np.square(errors).sum())
+        self.min_error = min(self.min_error, float(errors.min()))
+        self.max_error = max(self.max_error, float(errors.max()))
+        self.absolute_errors.add(np.abs(errors))
+        return self
+
+    def merge(self, other):
+        self.pings += other.pings
+        self.successes += other.successes
+        self.error_sum += other.error_sum
+        self.absolute_error_sum += other.absolute_error_sum
+        self.squared_error_sum += other.squared_error_sum
+        self.min_error = min(self.min_error, other.min_error)
+        self.max_error = max(self.max_error, other.max_error)
+        self.absolute_errors.merge(other.absolute_errors)
+        return self
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        """Plain dict of the statistics; undefined values are None."""
+        successes = self.successes
+        summary = {
+            'pings': self.pings,
+            'successes': successes,
+            'success_rate': successes / self.pings if self.pings else None,
+            'bias': self.error_sum / successes if successes else None,
+            'mae': self.absolute_error_sum / successes if successes else None,
+            'rmse': math.sqrt(self.squared_error_sum / successes) if successes else None,
+            'min_error': self.min_error if successes else None,
+            'max_error': self.max_error if successes else None,
+        }
+        for percentile in percentiles:
+            summary[f'p{percentile}_absolute_error'] = (self.absolute_errors.quantile(percentile / 100)
+                                                        if successes else None)
+        return summary
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in ('pings', 'successes', 'error_sum', 'absolute_error_sum',
+                                                     'squared_error_sum')}
+        data['min_error'] = self.min_error if self.successes else None
+        data['max_error'] = self.max_error if self.successes else None
+        data['absolute_errors'] = self.absolute_errors.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key in ('pings', 'successes', 'error_sum', 'absolute_error_sum', 'squared_error_sum'):
+            setattr(stats, key, data[key])
+        stats.min_error = math.inf if data['min_error'] is None else data['min_error']
+        stats.max_error = -math.inf if data['max_error'] is None else data['max_error']
+        stats.absolute_errors = QuantileSketch.from_dict(data['absolute_errors'])
+        return stats
+
+
+class RangeErrorAggregate:
+    """Range error statistics overall, per time window, per distance band and per depth band.
+
+    Windows are keyed by their start in Unix seconds, so aggregates of
+    different log files and runs line up; distance bands are keyed by the
+    lower edge of the GPS-derived boat-buoy distance in meters and double as
+    the error-vs-distance bins. Depth bands, keyed by the lower edge of the
+    mean water depth at the boat and buoy, are only filled for pings added
+    with depths.
+    """
+
+    def __init__(self, window_seconds=600, band_meters=50.0, relative_accuracy=0.01, depth_band_meters=10.0):
+        self.window_seconds = window_seconds
+        self.band_meters = band_meters
+        self.relative_accuracy = relative_accuracy
+        self.depth_band_meters = depth_band_meters
+        self.total = ErrorStats(relative_accuracy)
+        self.windows = {}
+        self.bands = {}
+        self.depths = {}
+
+    def add(self, timestamps, modem_distances, calculated_distances, depths=None):
+        """Add a chunk of aligned pings.
+
+        ``timestamps`` are ``datetime64`` ping times, ``modem_distances`` NaN
+        for failed ranges; pings with a NaN ``calculated_distances`` were not
+        aligned and are skipped. ``depths``, the water depth of each ping in
+        meters, fills the depth bands; pings with a NaN depth are left out
+        of them.
+        """
+        calculated_distances = np.asarray(calculated_distances, dtype=np.float64)
+        aligned = ~np.isnan(calculated_distances)
+        errors = np.asarray(modem_distances, dtype=np.float64)[aligned] - calculated_distances[aligned]
+        seconds = np.asarray(timestamps, dtype='datetime64[s]')[aligned].astype(np.int64)
+        self.total.add(errors)
+        self._add_grouped(self.windows, seconds // self.window_seconds * self.window_seconds, errors)
+        bands = np.floor(calculated_distances[aligned] / self.band_meters) * self.band_meters
+        self._add_grouped(self.bands, bands, errors)
+        if depths is not None:
+            depths = np.asarray(depths, dtype=np.float64)[aligned]
+            known = ~np.isnan(depths)
+            self._add_grouped(self.depths, np.floor(depths[known] / self.depth_band_meters) * self.depth_band_meters,
+                              errors[known])
+        return self
+
+    def _add_grouped(self, groups, keys, errors):
+        if len(keys) == 0:
+            return
+        order = np.argsort(keys, kind='stable')
+        keys, errors = keys[order], errors[order]
+        unique_keys, starts = np.unique(keys, return_index=True)
+        for key, group_errors in zip(unique_keys.tolist(), np.split(errors, starts[1:])):
+            groups.setdefault(key, ErrorStats(self.relative_accuracy)).add(group_errors)
+
+    def merge(self, other):
+        if (other.window_seconds, other.band_meters, other.depth_band_meters) \
+                != (self.window_seconds, self.band_meters, self.depth_band_meters):
+            raise ValueError("Cannot merge range error aggregates with different windows or bands")
+        self.total.merge(other.total)
+        for groups, other_groups in ((self.windows, other.windows), (self.bands, other.bands),
+                                     (self.depths, other.depths)):
+            for key, stats in other_groups.items():
+                groups.setdefault(key, ErrorStats(self.relative_accuracy)).merge(stats)
+        return self
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        return {
+            'total': self.total.summary(percentiles),
+            'windows': {str(np.datetime64(key, 's')): stats.summary(percentiles)
+                        for key, stats in sorted(self.windows.items())},
+            'bands': {f'{key:g}-{key + self.band_meters:g} m': stats.summary(percentiles)
+                      for key, stats in sorted(self.bands.items())},
+            'depths': {f'{key:g}-{key + self.depth_band_meters:g} m': stats.summary(percentiles)
+                       for key, stats in sorted(self.depths.items())},
+        }
+
+    def to_dict(self):
+        return {
+            'version': STATS_VERSION,
+            'window_seconds': self.window_seconds,
+            'band_meters': self.band_meters,
+            'relative_accuracy': self.relative_accuracy,
+            'depth_band_meters': self.depth_band_meters,
+            'total': self.total.to_dict(),
+            'windows': {str(key): stats.to_dict() for key, stats in self.windows.items()},
+            'bands': {repr(key): stats.to_dict() for key, stats in self.bands.items()},
+            'depths': {repr(key): stats.to_dict() for key, stats in self.depths.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != STATS_VERSION:
+            raise ValueError(f"Unsupported range error stats version {data.get('version')!r}")
+        aggregate = cls(data['window_seconds'], data['band_meters'], data['relative_accuracy'],
+                        data.get('depth_band_meters', 10.0))
+        aggregate.total = ErrorStats.from_dict(data['total'])
+        aggregate.windows = {int(key): ErrorStats.from_dict(stats) for key, stats in data['windows'].items()}
+        aggregate.bands = {float(key): ErrorStats.from_dict(stats) for key, stats in data['bands'].items()}
+        aggregate.depths = {float(key): ErrorStats.from_dict(stats) for key, stats in data.get('depths', {}).items()}
+        return aggregate
+
+
+@timed('stats')
+def accumulate_range_errors(dataset, clock_fit, aggregate=None, chunk_size=65536):
+    """Align and add the pings of ``dataset`` to ``aggregate`` one chunk at a time.
+
+    Only one chunk of aligned positions is held at once, so the range log may
+    be a memory-mapped column far larger than memory. Returns the aggregate.
+    """
+    aggregate = aggregate or RangeErrorAggregate()
+    ranges = dataset.ranges
+    for start in range(0, len(ranges.distances), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        aligned = align_pings(ranges.seconds_after_start[chunk], dataset.boat_track, dataset.buoy_track,
+                              clock_fit.boat_scale, clock_fit.buoy_scale, clock_fit.boat_offset, clock_fit.buoy_offset)
+        calculated_distances = geodesic_distance(aligned.boat_latitudes, aligned.boat_longitudes,
+                                                 aligned.buoy_latitudes, aligned.buoy_longitudes)
+        aggregate.add(ranges.timestamps[chunk], ranges.distances[chunk], calculated_distances)
+    return aggregate
+
+
+@timed('stats')
+def aggregate_range_errors(dataset, comparison, aggregate=None, depths=None):
+    """Add the pings of ``dataset`` to ``aggregate`` with the GPS distances of an existing ``comparison``.
+
+    Unlike ``accumulate_range_errors`` this aligns nothing, for pings that
+    ``compare_ranges`` or ``compare_fitted`` already aligned. ``depths`` (one
+    per ping, e.g. ``PingDepths.mean()``) fills the depth bands. Returns the
+    aggregate.
+    """
+    aggregate = aggregate or RangeErrorAggregate()
+    ranges = dataset.ranges
+    return aggregate.add(ranges.timestamps, ranges.distances, comparison.calculated_distances, depths)
+
+
+def load_stats(file_path):
+    with open(file_path, 'r') as f:
+        return RangeErrorAggregate.from_dict(json.load(f))
+
+
+def save_stats(aggregate, file_path):
+    with open(file_path, 'w') as f:
+        json.dump(aggregate.to_dict(), f, indent=4)
+
+
+def merge_stats_files(file_paths):
+    """Merge the range error aggregates stored in ``file_paths``."""
+    aggregates = [load_stats(file_path) for file_path in file_paths]
+    if not aggregates:
+        raise ValueError("No range error statistics to merge")
+    merged = aggregates[0]
+    for aggregate in aggregates[1:]:
+        merged.merge(aggregate)
+    return merged
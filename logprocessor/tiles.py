@@ -0,0 +1,176 @@
+"""XYZ tile pyramid for the bathymetry overlay.
+
+Instead of base64-embedding the whole raster in ``index.html``, the TIFF is cut
+into 256x256 Web Mercator tiles that the map loads on demand. Every tile is
+warped straight from the source file with GDAL, which only reads the source
+window under that tile, so the full image is never held in memory. The
+pyramid is keyed by the TIFF's SHA-256 and is only rebuilt when it changes.
+A TIFF without a CRS is taken to span the map's ``BOUNDS`` in lon/lat, as the
+inline overlay does.
+"""
+import json
+import math
+import os
+import shutil
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.cache import file_sha256
+from logprocessor.decimation import EQUATOR_METERS_PER_PIXEL
+from logprocessor.instrumentation import timed
+from logprocessor.site import BOUNDS
+
+TILE_SIZE = 256
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+TILE_FORMATS = ('png', 'webp')
+MANIFEST_NAME = 'pyramid.json'
+
+
+def tile_range(bounds, zoom):
+    """Inclusive ``(x_min, x_max, y_min, y_max)`` tile indices covering lon/lat ``bounds``."""
+    west, south, east, north = bounds
+    n = 2 ** zoom
+
+    def tile_x(longitude):
+        return min(max(int((longitude + 180.0) / 360.0 * n), 0), n - 1)
+
+    def tile_y(latitude):
+        latitude = math.radians(latitude)
+        return min(max(int((1.0 - math.asinh(math.tan(latitude)) / math.pi) / 2.0 * n), 0), n - 1)
+
+    return tile_x(west), tile_x(east), tile_y(north), tile_y(south)
+
+
+def tile_mercator_bounds(x, y, zoom):
+    """``(west, south, east, north)`` of a tile in EPSG:3857 meters."""
+    size = 2 * WEB_MERCATOR_HALF_WORLD / 2 ** zoom
+    west = -WEB_MERCATOR_HALF_WORLD + x * size
+    north = WEB_MERCATOR_HALF_WORLD - y * size
+    return west, north - size, west + size, north
+
+
+@contextmanager
+def open_georeferenced(tiff_file):
+    """Open ``tiff_file`` with rasterio; a raster without a CRS is presented as spanning ``BOUNDS`` in EPSG:4326."""
+    import rasterio
+    from rasterio.crs import CRS
+    from rasterio.errors import NotGeoreferencedWarning
+    from rasterio.transform import from_bounds
+    from rasterio.vrt import WarpedVRT
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', NotGeoreferencedWarning)
+        dataset = rasterio.open(tiff_file)
+    with dataset:
+        if dataset.crs is not None:
+            yield dataset
+            return
+        logger.warning(f"{tiff_file} has no CRS; placing it on the map's default bounds.")
+        (south, west), (north, east) = BOUNDS
+        crs = CRS.from_epsg(4326)
+        transform = from_bounds(west, south, east, north, dataset.width, dataset.height)
+        # The VRT still reads only the source window under each tile
+        with WarpedVRT(dataset, src_crs=crs, src_transform=transform, crs=crs, transform=transform,
+                       width=dataset.width, height=dataset.height) as vrt:
+            yield vrt
+
+
+def native_zoom(dataset):
+    """Zoom level whose pixel size is closest to the raster's ground resolution."""
+    from rasterio.warp import calculate_default_transform
+
+    transform, _, _ = calculate_default_transform(dataset.crs, 'EPSG:3857', dataset.width, dataset.height,
+                                                  *dataset.bounds)
+    mercator_pixel = abs(transform.a)
+    return int(round(math.log2(EQUATOR_METERS_PER_PIXEL / mercator_pixel)))
+
+
+def _inside_mask(tile_bounds, raster_bounds):
+    """Alpha mask of the tile pixels whose centers fall inside the raster's lon/lat bounds."""
+    west, south, east, north = tile_bounds
+    step = (east - west) / TILE_SIZE
+    centers_x = west + (np.arange(TILE_SIZE) + 0.5) * step
+    centers_y = north - (np.arange(TILE_SIZE) + 0.5) * step
+    longitudes = np.degrees(centers_x / 6378137.0)
+    latitudes = np.degrees(np.arctan(np.sinh(centers_y / 6378137.0)))
+    raster_west, raster_south, raster_east, raster_north = raster_bounds
+    inside_x = (longitudes >= raster_west) & (longitudes <= raster_east)
+    inside_y = (latitudes >= raster_south) & (latitudes <= raster_north)
+    return np.outer(inside_y, inside_x)
+
+
+def _render_tile(dataset, x, y, zoom, raster_bounds):
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_bounds
+    from rasterio.warp import reproject
+
+    tile_bounds = tile_mercator_bounds(x, y, zoom)
+    rgb = np.zeros((3, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    reproject(
+        source=rasterio.band(dataset, [1, 2, 3]),  # Assuming RGB bands
+        destination=rgb,
+        dst_transform=from_bounds(*tile_bounds, TILE_SIZE, TILE_SIZE),
+        dst_crs='EPSG:3857',
+        resampling=Resampling.bilinear,
+    )
+    alpha = np.where(_inside_mask(tile_bounds, raster_bounds), 255, 0).astype(np.uint8)
+    return np.dstack([rgb[0], rgb[1], rgb[2], alpha])
+
+
+@timed('tiles')
+def build_tile_pyramid(tiff_file, tile_dir, min_zoom=10, max_zoom=None, tile_format='png'):
+    """Cut ``tiff_file`` into ``tile_dir/{z}/{x}/{y}.<tile_format>`` tiles.
+
+    ``max_zoom`` defaults to the raster's native resolution. Returns the
+    pyramid manifest (zoom range, lon/lat bounds, format). Nothing is
+    regenerated when the TIFF content and settings match the existing pyramid.
+    """
+    from PIL import Image
+    from rasterio.warp import transform_bounds
+
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(f"Unknown tile format {tile_format!r}; expected one of {TILE_FORMATS}")
+
+    source_hash = file_sha256(tiff_file)
+    manifest_file = os.path.join(tile_dir, MANIFEST_NAME)
+    with open_georeferenced(tiff_file) as dataset:
+        raster_bounds = transform_bounds(dataset.crs, 'EPSG:4326', *dataset.bounds)
+        if max_zoom is None:
+            max_zoom = max(native_zoom(dataset), min_zoom)
+        settings = {'sha256': source_hash, 'min_zoom': min_zoom, 'max_zoom': max_zoom, 'format': tile_format}
+
+        try:
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+            if all(manifest.get(key) == value for key, value in settings.items()):
+                logger.info(f"Bathymetry tiles in {tile_dir} are up to date.")
+                return manifest
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        # Remove tiles of a previous pyramid so no stale zoom levels are left behind
+        if os.path.isdir(tile_dir):
+            for name in os.listdir(tile_dir):
+                if name.isdigit():
+                    shutil.rmtree(os.path.join(tile_dir, name))
+
+        count = 0
+        for zoom in range(min_zoom, max_zoom + 1):
+            x_min, x_max, y_min, y_max = tile_range(raster_bounds, zoom)
+            for x in range(x_min, x_max + 1):
+                os.makedirs(os.path.join(tile_dir, str(zoom), str(x)), exist_ok=True)
+                for y in range(y_min, y_max + 1):
+                    tile = _render_tile(dataset, x, y, zoom, raster_bounds)
+                    Image.fromarray(tile).save(
+                        os.path.join(tile_dir, str(zoom), str(x), f'{y}.{tile_format}'))
+                    count += 1
+
+    manifest = dict(settings, bounds=list(raster_bounds), tiles=count)
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    logger.info(f"Wrote {count} bathymetry tiles for zoom {min_zoom}-{max_zoom} to {tile_dir}.")
+    return manifest
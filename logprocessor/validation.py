@@ -0,0 +1,173 @@
+"""Vectorized validation and outlier filtering of GPS tracks and modem ranges.
+
+Every check works on whole columns. A GPS fix is dropped when its coordinates
+are NaN, out of range or exactly (0, 0); when it repeats the timestamp of the
+fix before it; when reaching it and leaving it again would both take an
+impossible speed (a single-fix spike); or when it lies more than ``max_jump``
+meters from the median position of the fixes around it (a jump, which also
+catches excursions several fixes long). Interpolation then bridges the gap
+with the neighbouring good fixes. Modem distances can additionally be passed
+through a Hampel filter, which flags ranges far from the median of their
+neighbours in units of the local median absolute deviation.
+"""
+from collections import namedtuple
+
+import numpy as np
+from loguru import logger
+
+from logprocessor.decimation import project_local
+from logprocessor.instrumentation import count, timed
+
+# Defaults: no boat or buoy in a deployment moves faster than this
+MAX_SPEED = 25.0  # m/s
+MAX_JUMP = 100.0  # meters from the rolling median position
+JUMP_WINDOW = 9  # fixes
+HAMPEL_WINDOW = 7  # successful ranges
+HAMPEL_THRESHOLD = 3.0  # scaled median absolute deviations
+HAMPEL_MIN_DEVIATION = 5.0  # meters; keeps flat stretches from flagging every small change
+# Scale of the median absolute deviation to the standard deviation of normal noise
+MAD_SCALE = 1.4826
+CHUNK_ELEMENTS = 2_000_000
+
+TrackFlags = namedtuple('TrackFlags', ['invalid_coordinates', 'duplicate_times', 'speed_outliers', 'jumps'])
+
+
+def invalid_coordinates(latitudes, longitudes):
+    """Mask of fixes whose coordinates are NaN, out of range or the (0, 0) of a GPS without a fix."""
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        in_range = (np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)
+    return ~in_range | ((latitudes == 0) & (longitudes == 0))
+
+
+def duplicate_times(times):
+    """Mask of fixes with the same time as the fix before them; ``times`` must be sorted."""
+    times = np.asarray(times, dtype=np.float64)
+    return np.r_[False, times[1:] == times[:-1]] if len(times) else np.zeros(0, dtype=bool)
+
+
+def speed_outliers(times, latitudes, longitudes, max_speed=MAX_SPEED):
+    """Mask of single-fix spikes: both the segment into a fix and the one out of it exceed ``max_speed``.
+
+    At either end of the track, the end fix is flagged when its only segment
+    is too fast but the segment after it is not. Times must be strictly
+    increasing.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    flags = np.zeros(len(times), dtype=bool)
+    if len(times) < 3:
+        return flags
+    east, north = project_local(latitudes, longitudes)
+    fast = np.hypot(np.diff(east), np.diff(north)) > max_speed * np.diff(times)
+    flags[1:-1] = fast[:-1] & fast[1:]
+    flags[0] = fast[0] and not fast[1]
+    flags[-1] = fast[-1] and not fast[-2]
+    return flags
+
+
+def _windows(values, window):
+    """View of each value with its ``window // 2`` neighbours on either side, ends padded by reflection."""
+    half = window // 2
+    padded = np.pad(values, half, mode='reflect' if len(values) > half else 'edge')
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1)
+
+
+def _chunks(windows):
+    # Bound the temporary copies np.median makes of the window view
+    step = max(1, CHUNK_ELEMENTS // windows.shape[1])
+    return (slice(start, start + step) for start in range(0, len(windows), step))
+
+
+def rolling_median(values, window):
+    """Median of each value and its ``window // 2`` neighbours on either side.
+
+    The ends are padded by reflection so the first and last values still see
+    a full window.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0 or window < 3:
+        return values.copy()
+    windows = _windows(values, window)
+    medians = np.empty(len(values))
+    for chunk in _chunks(windows):
+        medians[chunk] = np.median(windows[chunk], axis=1)
+    return medians
+
+
+def jump_outliers(latitudes, longitudes, max_jump=MAX_JUMP, window=JUMP_WINDOW):
+    """Mask of fixes more than ``max_jump`` meters from the rolling median position of ``window`` fixes."""
+    east, north = project_local(latitudes, longitudes)
+    return np.hypot(east - rolling_median(east, window), north - rolling_median(north, window)) > max_jump
+
+
+def hampel_outliers(values, window=HAMPEL_WINDOW, threshold=HAMPEL_THRESHOLD, min_deviation=HAMPEL_MIN_DEVIATION):
+    """Hampel filter: mask of values more than ``threshold`` scaled MADs from their rolling median.
+
+    NaN values (failed ranges) are skipped, so each window spans ``window``
+    valid values, and are never flagged. The scaled MAD is floored at
+    ``min_deviation``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    flags = np.zeros(len(values), dtype=bool)
+    finite = np.flatnonzero(~np.isnan(values))
+    if len(finite) < 3 or window < 3:
+        return flags
+    series = values[finite]
+    windows = _windows(series, window)
+    outliers = np.empty(len(series), dtype=bool)
+    for chunk in _chunks(windows):
+        medians = np.median(windows[chunk], axis=1)
+        deviations = np.median(np.abs(windows[chunk] - medians[:, None]), axis=1)
+        scale = np.maximum(MAD_SCALE * deviations, min_deviation)
+        outliers[chunk] = np.abs(series[chunk] - medians) > threshold * scale
+    flags[finite] = outliers
+    return flags
+
+
+@timed('validate')
+def clean_track(track, max_speed=MAX_SPEED, max_jump=MAX_JUMP, window=JUMP_WINDOW, name='track'):
+    """Drop invalid, duplicate, spiking and jumping fixes from a time-sorted ``Track``.
+
+    Returns ``(cleaned_track, flags)`` where ``flags`` is a ``TrackFlags`` of
+    masks over the fixes of the input track. Each check only looks at the
+    fixes that passed the checks before it.
+    """
+    n = len(track)
+    invalid = invalid_coordinates(track.latitudes, track.longitudes)
+    duplicates = np.zeros(n, dtype=bool)
+    speeds = np.zeros(n, dtype=bool)
+    jumps = np.zeros(n, dtype=bool)
+
+    kept = np.flatnonzero(~invalid)
+    duplicates[kept] = duplicate_times(track.times[kept])
+    kept = kept[~duplicates[kept]]
+    speeds[kept] = speed_outliers(track.times[kept], track.latitudes[kept], track.longitudes[kept], max_speed)
+    kept = kept[~speeds[kept]]
+    jumps[kept] = jump_outliers(track.latitudes[kept], track.longitudes[kept], max_jump, window)
+    kept = kept[~jumps[kept]]
+
+    flags = TrackFlags(invalid, duplicates, speeds, jumps)
+    for counter, mask in zip(('gps_invalid_coordinates', 'gps_duplicate_times', 'gps_speed_outliers', 'gps_jumps'),
+                             flags):
+        count(counter, int(mask.sum()))
+    if len(kept) < n:
+        logger.warning(f"Dropped {n - len(kept)} of {n} {name} GPS fixes: {int(invalid.sum())} invalid, "
+                       f"{int(duplicates.sum())} duplicate times, {int(speeds.sum())} speed spikes, "
+                       f"{int(jumps.sum())} jumps.")
+    return (track if len(kept) == n else track[kept]), flags
+
+
+@timed('validate')
+def filter_range_outliers(ranges, window=HAMPEL_WINDOW, threshold=HAMPEL_THRESHOLD, min_deviation=HAMPEL_MIN_DEVIATION):
+    """Remove modem ranges flagged by ``hampel_outliers`` from a ``RangeLog``.
+
+    Returns ``(filtered_ranges, outliers)``. Removed ranges count neither as
+    successes nor as failures afterwards.
+    """
+    outliers = hampel_outliers(ranges.distances, window, threshold, min_deviation)
+    removed = int(outliers.sum())
+    count('range_outliers', removed)
+    if removed:
+        logger.warning(f"Removed {removed} of {len(ranges)} modem ranges as outliers.")
+    return (ranges[~outliers] if removed else ranges), outliers
@@ -0,0 +1,28 @@
+import numpy as np
+
+from logprocessor.decimation import decimate_track, decimation_pyramid
+from logprocessor.records import Track
+
+
+def _wandering_track(n=2000):
+    rng = np.random.default_rng(0)
+    seconds = np.arange(n, dtype=np.float64)
+    heading = np.cumsum(rng.normal(0, 0.1, n))
+    north, east = np.cumsum(np.cos(heading)), np.cumsum(np.sin(heading))
+    return Track(seconds, 32.88 + north / 111000.0, -117.27 + east / 93000.0)
+
+
+def test_decimate_track_keeps_ends():
+    track = _wandering_track()
+    decimated = decimate_track(track, 5.0)
+    assert 2 <= len(decimated.times) < len(track.times)
+    assert decimated.times[0] == track.times[0] and decimated.times[-1] == track.times[-1]
+
+
+def test_decimation_pyramid_coarsens_when_zooming_out():
+    track = decimate_track(_wandering_track(), 1.0)
+    pyramid = decimation_pyramid(track, range(10, 19), min_tolerance=2.0)
+    sizes = [len(pyramid[zoom].times) for zoom in range(10, 19)]
+    assert sizes == sorted(sizes)
+    assert pyramid[18] is track and pyramid[17] is track
+    assert sizes[0] < len(track.times)
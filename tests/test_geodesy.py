@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from logprocessor.geodesy import geodesic_distance
+
+
+def test_vincenty_flinders_peak_to_buninyong():
+    # Vincenty's (1975) test case on the WGS84 ellipsoid
+    distance = geodesic_distance(np.array([-37.95103342]), np.array([144.42486789]),
+                                 np.array([-37.65282114]), np.array([143.92649554]))
+    assert distance[0] == pytest.approx(54972.271, abs=1e-3)
+
+
+def test_vincenty_degree_of_latitude_at_equator():
+    distance = geodesic_distance(np.array([0.0]), np.array([0.0]), np.array([1.0]), np.array([0.0]))
+    assert distance[0] == pytest.approx(110574.389, abs=1e-3)
+
+
+@pytest.mark.parametrize('method', ['vincenty', 'enu', 'haversine'])
+def test_short_distances_agree(method):
+    latitudes = np.array([32.8815, 32.8815, 32.9])
+    longitudes = np.array([-117.2738, -117.2738, -117.3])
+    ends = (latitudes + np.array([0.0, 0.01, -0.005]), longitudes + np.array([0.0, 0.0, 0.01]))
+    expected = geodesic_distance(latitudes, longitudes, *ends, method='vincenty')
+    tolerance = 1e-3 if method == 'enu' else 5e-3
+    np.testing.assert_allclose(geodesic_distance(latitudes, longitudes, *ends, method=method), expected,
+                               rtol=tolerance, atol=1e-6)
+
+
+def test_nan_coordinates_give_nan():
+    distance = geodesic_distance(np.array([np.nan]), np.array([-117.0]), np.array([32.0]), np.array([-117.0]))
+    assert np.isnan(distance[0])
@@ -0,0 +1,32 @@
+import json
+
+from logprocessor.ingest import default_manifest_path, ingest_logs
+
+
+def _range_line(second, source=0, destination=1, distance=100.0):
+    return f'August 20, 2024 > 08:00:{second:02d} | SER_IN | Range {source} to {destination} : {distance} m\n'
+
+
+def test_ingest_appends_and_resumes(tmp_path):
+    log_dir = tmp_path / 'pi_runs'
+    log_dir.mkdir()
+    log_file = log_dir / 'run.log'
+    output_file = str(tmp_path / 'pi_runs.json')
+    log_file.write_text(_range_line(0) + 'August 20, 2024 > 08:00:01 | SER_IN | Response Not Received\n')
+
+    assert ingest_logs(str(log_dir), output_file, workers=1) == 2
+    assert ingest_logs(str(log_dir), output_file, workers=1) == 0
+
+    with open(log_file, 'a') as f:
+        f.write(_range_line(5, destination=2, distance=250.5))
+    assert ingest_logs(str(log_dir), output_file, workers=1) == 1
+
+    with open(output_file) as f:
+        entries = json.load(f)
+    assert [(entry['seconds_after_start'], entry['distance'], entry['source'], entry['destination'])
+            for entry in entries] == [(0.0, 100.0, 0, 1), (1.0, None, 0, 1), (5.0, 250.5, 0, 2)]
+    with open(default_manifest_path(output_file)) as f:
+        manifest = json.load(f)
+    assert manifest['entry_count'] == 3
+    assert manifest['start_time'] == '2024-08-20T08:00:00'
+    assert manifest['files'][str(log_file)]['pair'] == [0, 2]
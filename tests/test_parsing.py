@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import numpy as np
+
+from logprocessor import instrumentation
+from logprocessor.parsing import PairTracker, parse_line, parse_log_file
+from logprocessor.records import RangeMatrix
+
+
+def test_parse_line_range():
+    line = 'August 20, 2024 > 08:21:33 | SER_IN | Range 0 to 2 : 423.7 m\n'
+    assert parse_line(line) == (datetime(2024, 8, 20, 8, 21, 33), 423.7, 0, 2)
+
+
+def test_parse_line_no_response():
+    line = 'August 20, 2024 > 08:21:35 | SER_IN | Response Not Received\n'
+    assert parse_line(line) == (datetime(2024, 8, 20, 8, 21, 35), None, None, None)
+
+
+def test_parse_line_other_lines():
+    assert parse_line('August 20, 2024 > 08:21:33 | SER_OUT | $P001,1\n') is None
+    assert parse_line('August 20, 2024 > 08:21:33 | INFO | modem status ok\n') is None
+    assert parse_line('August 20, 2024 > 08:21:33 | SER_IN | Range 0 to 1 : garbled\n') is None
+
+
+def test_pair_tracker_attributes_failures_to_last_pair():
+    pairs = PairTracker()
+    pairs.resolve(parse_line('August 20, 2024 > 08:21:33 | SER_IN | Range 0 to 2 : 423.7 m'))
+    timestamp, distance, source, destination = pairs.resolve(
+        parse_line('August 20, 2024 > 08:21:35 | SER_IN | Response Not Received'))
+    assert (timestamp, distance, source, destination) == (datetime(2024, 8, 20, 8, 21, 35), None, 0, 2)
+
+
+def test_parse_log_file_counts_only_malformed_ranges_as_misses(tmp_path):
+    log_file = tmp_path / 'run.log'
+    log_file.write_text('August 20, 2024 > 08:21:33 | SER_IN | Range 0 to 1 : 423.7 m\n'
+                        'August 20, 2024 > 08:21:34 | SER_IN | $P001,OK\n'
+                        'August 20, 2024 > 08:21:35 | SER_IN | Range 0 to 1 : garbled\n')
+    instrumentation.reset()
+    entries, _, _ = parse_log_file(str(log_file))
+    assert len(entries) == 1
+    assert instrumentation.summary()['counters']['log_regex_misses'] == 1
+
+
+def test_range_matrix_pair():
+    timestamps = np.array(['2024-08-20T08:00:03', '2024-08-20T08:00:01', '2024-08-20T08:00:02',
+                           '2024-08-20T08:00:00'], dtype='datetime64[s]')
+    matrix = RangeMatrix(timestamps, np.array([3.0, 1.0, 2.0, 0.0]), np.array([30.0, np.nan, 20.0, 10.0]),
+                         np.array([0, 0, 0, 0], dtype=np.int32), np.array([1, 2, 1, 1], dtype=np.int32))
+
+    ranges = matrix.pair(0, 1)
+    np.testing.assert_array_equal(ranges.seconds_after_start, [0.0, 2.0, 3.0])
+    np.testing.assert_array_equal(ranges.distances, [10.0, 20.0, 30.0])
+    assert matrix.pairs == [(0, 1), (0, 2)]
+    assert matrix.counts() == {(0, 1): (3, 3), (0, 2): (1, 0)}
+    assert len(matrix.pair(1, 0)) == 0
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pytest
+
+from logprocessor.stats import QuantileSketch
+
+
+def test_quantile_sketch_relative_accuracy():
+    values = np.linspace(1.0, 1000.0, 10001)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.add(values)
+    for q in (0.1, 0.5, 0.95, 0.99):
+        exact = values[int(np.ceil(q * len(values))) - 1]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+
+
+def test_quantile_sketch_merge_matches_single_sketch():
+    rng = np.random.default_rng(0)
+    first, second = rng.exponential(10.0, 5000), rng.exponential(50.0, 3000)
+    merged = QuantileSketch()
+    for values in (first, second):
+        sketch = QuantileSketch()
+        sketch.add(values)
+        merged.merge(sketch)
+    combined = QuantileSketch()
+    combined.add(np.concatenate([first, second]))
+
+    assert merged.count == combined.count == 8000
+    for q in (0.05, 0.5, 0.95):
+        assert merged.quantile(q) == combined.quantile(q)
+
+
+def test_quantile_sketch_merge_rejects_other_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_accuracy=0.01).merge(QuantileSketch(relative_accuracy=0.02))
+
+
+def test_quantile_sketch_json_round_trip():
+    sketch = QuantileSketch()
+    sketch.add([0.0, 0.0005, 1.5, 2.5, 300.0, np.nan])
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+    assert restored.count == sketch.count == 5
+    assert restored.zero_count == 2
+    for q in (0.0, 0.4, 0.6, 1.0):
+        assert restored.quantile(q) == sketch.quantile(q)